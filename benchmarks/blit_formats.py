@@ -0,0 +1,56 @@
+"""
+Measures how much it costs to blit images and text to the screen, before and after converting them to the display's
+pixel format (see assets.convert_for_display), and with text rendered with or without a background.
+
+Run with: PYTHONPATH=dialog_tree python3 benchmarks/blit_formats.py
+"""
+import os
+import timeit
+
+import pygame
+from pygame.surface import Surface
+
+from assets import convert_for_display
+
+SCREEN_SIZE = 500, 500
+PICTURE_SIZE = 494, 380
+NUM_BLITS = 200
+
+
+def main():
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    pygame.init()
+    screen = pygame.display.set_mode(SCREEN_SIZE)
+
+    # The formats that PNGs are typically loaded in: 24-bit RGB, and 32-bit RGBA with transparent areas
+    opaque = pygame.image.frombuffer(bytes(PICTURE_SIZE[0] * PICTURE_SIZE[1] * 3), PICTURE_SIZE, "RGB")
+    sprite = Surface(PICTURE_SIZE, pygame.SRCALPHA)
+    pygame.draw.circle(sprite, (200, 100, 50), (PICTURE_SIZE[0] // 2, PICTURE_SIZE[1] // 2), 150)
+    translucent = Surface(PICTURE_SIZE, pygame.SRCALPHA)
+    translucent.fill((200, 100, 50, 128))
+
+    font = pygame.font.Font(None, 17)
+    line = "The quick brown fox jumps over the lazy dog, again and again and again"
+
+    cases = [
+        ("opaque image", opaque, convert_for_display(opaque)),
+        ("image with transparent areas", sprite, convert_for_display(sprite)),
+        ("translucent image", translucent, convert_for_display(translucent)),
+        ("text line", font.render(line, True, (255, 255, 255)), font.render(line, True, (255, 255, 255), (0, 0, 0))),
+    ]
+
+    print(f"{'':<30}{'before (us)':>12}{'after (us)':>12}{'speedup':>10}")
+    for name, before, after in cases:
+        before_time = _time_blit(screen, before)
+        after_time = _time_blit(screen, after)
+        print(f"{name:<30}{before_time:>12.1f}{after_time:>12.1f}{before_time / after_time:>9.1f}x")
+
+
+def _time_blit(screen: Surface, surface: Surface) -> float:
+    """ Return the average time of one blit, in microseconds """
+    timer = timeit.Timer(lambda: screen.blit(surface, (3, 3)))
+    return min(timer.repeat(repeat=5, number=NUM_BLITS)) / NUM_BLITS * 1_000_000
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+Measures how long the static analysis of a large, procedurally generated dialog graph takes
+
+The graph is a long chain of nodes with a "Go back" choice on every node, some branches that lead to endings, and a
+part that can't be reached from the root, so that every kind of problem is looked for (and found).
+
+Run with: PYTHONPATH=dialog_tree python3 benchmarks/graph_analysis.py [--nodes 2000000]
+"""
+import argparse
+import time
+from array import array
+
+from analysis import analyze_graph
+from graph import DialogGraph, DialogNode
+
+
+def generate_graph(num_nodes: int) -> DialogGraph:
+    choice_offsets = array("l", [0])
+    choice_targets = array("l")
+    nodes = []
+    # The last tenth of the nodes can't be reached from the root
+    num_reachable = num_nodes - num_nodes // 10
+    for i in range(num_nodes):
+        is_ending = i % 1000 == 999
+        if not is_ending:
+            targets = [(i + 1) % num_reachable if i < num_reachable else (i + 1) % num_nodes, max(0, i - 1)]
+            if i % 100 == 0:
+                targets.append(min(num_nodes - 1, i + 999 - i % 1000))
+            choice_targets.extend(targets)
+        choice_offsets.append(len(choice_targets))
+        # The analysis only looks at the resolved choices, so the nodes' own choice objects are left out
+        nodes.append(DialogNode(str(i), "", [], is_ending=is_ending))
+    return DialogGraph.from_resolved_choices(0, nodes, choice_offsets, choice_targets)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the time it takes to analyze a large dialog graph.")
+    parser.add_argument("--nodes", type=int, default=2_000_000, help="The number of nodes. (Default: 2000000)")
+    args = parser.parse_args()
+
+    dialog_graph = generate_graph(args.nodes)
+    start_time = time.perf_counter()
+    analysis = analyze_graph(dialog_graph)
+    elapsed_time = time.perf_counter() - start_time
+    print(analysis.summary().splitlines()[0])
+    print(f"{args.nodes} nodes analyzed in {elapsed_time:.2f} s")
+
+
+if __name__ == '__main__':
+    main()
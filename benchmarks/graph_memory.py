@@ -0,0 +1,92 @@
+"""
+Measures how much memory a large, procedurally generated dialog graph takes once it has been parsed
+
+The dialog is generated as JSON text and decoded with json.loads (like load_dialog_from_file does), so that
+repeated strings are separate copies, just like when they come from a file. What is counted is the memory that is
+still held once the decoded JSON has been dropped, i.e. the graph and the strings it refers to.
+
+For comparison, the same dialog is also stored the way graphs used to be: plain objects (with a __dict__ each) holding
+the decoded strings as they are, one graphics and choice object per node, and the nodes in a dict by ID.
+
+Run with: PYTHONPATH=dialog_tree python3 benchmarks/graph_memory.py [--nodes 500000]
+"""
+import argparse
+import gc
+import json
+import tracemalloc
+from typing import Callable, Dict, List
+
+from config_file import parse_dialog_from_json
+
+
+def generate_dialog_json(num_nodes: int) -> str:
+    """ A dialog in which every node has its own text, a few shared choice texts and a handful of shared images """
+    nodes = []
+    for i in range(num_nodes):
+        choices = [["Next", str((i + 1) % num_nodes)]]
+        if i % 5 == 0:
+            choices.append(["Go back to the start", "0"])
+        nodes.append({"id": str(i), "text": f"This is the text of node number {i}.", "choices": choices,
+                      "graphics": {"image": f"image_{i % 16}.png"}})
+    return json.dumps({"title": "Generated", "graph": {"root": "0", "nodes": nodes}})
+
+
+class _PlainChoice:
+    def __init__(self, text: str, leads_to_id: str):
+        self.text = text
+        self.leads_to_id = leads_to_id
+
+
+class _PlainGraphics:
+    def __init__(self, image_ids: List[str]):
+        self.animation_id = None
+        self.image_ids = image_ids
+        self.offset = (0, 0)
+        self.screen_shake = None
+        self.instant_text = False
+
+
+class _PlainNode:
+    def __init__(self, node_id: str, text: str, choices: List[_PlainChoice], graphics: _PlainGraphics):
+        self.node_id = node_id
+        self.text = text
+        self.choices = choices
+        self.graphics = graphics
+        self.sound_id = None
+
+
+def parse_plain(dialog_json: Dict) -> Dict[str, _PlainNode]:
+    """ The nodes by ID, stored like DialogGraph used to store them """
+    return {node["id"]: _PlainNode(node["id"], node["text"], [_PlainChoice(*choice) for choice in node["choices"]],
+                                   _PlainGraphics([node["graphics"]["image"]]))
+            for node in dialog_json["graph"]["nodes"]}
+
+
+def measure(num_nodes: int, parse: Callable[[Dict], object] = parse_dialog_from_json) -> int:
+    """ Return the number of bytes that the parsed graph holds on to """
+    dialog_text = generate_dialog_json(num_nodes)
+    gc.collect()
+    tracemalloc.start()
+    dialog_json = json.loads(dialog_text)
+    graph = parse(dialog_json)
+    del dialog_json
+    gc.collect()
+    num_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert graph is not None
+    return num_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the memory used by a large dialog graph.")
+    parser.add_argument("--nodes", type=int, default=500_000, help="The number of nodes. (Default: 500000)")
+    args = parser.parse_args()
+
+    for name, parse in [("plain objects", parse_plain), ("DialogGraph", parse_dialog_from_json)]:
+        num_bytes = measure(args.nodes, parse)
+        print(f"{name:<15}{args.nodes} nodes: {num_bytes / 1024 / 1024:.1f} MB "
+              f"({num_bytes / args.nodes:.0f} bytes per node)")
+
+
+if __name__ == '__main__':
+    main()
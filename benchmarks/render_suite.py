@@ -0,0 +1,251 @@
+"""
+Headless microbenchmarks for text layout, the UI, node transitions and dialog parsing
+
+Runs under SDL's dummy video and audio drivers, so no window or sound device is needed. Every benchmark is run over a
+few content sizes, and the results are written as JSON. Pass a previous result file with --compare to report (and fail
+on) regressions.
+
+Run with: PYTHONPATH=dialog_tree python3 benchmarks/render_suite.py --output results.json [--compare baseline.json]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame
+from pygame.font import Font
+from pygame.mixer import Sound
+from pygame.surface import Surface
+
+import ui
+from config_file import parse_dialog_from_json
+from constants import Millis
+from dialog_component import DialogComponent
+from graph import DialogGraph, DialogNode, DialogChoice, NodeGraphics
+from sound import SoundPlayer
+from text_util import layout_text_in_area
+from timing import Scheduler
+
+FONT_PATH = Path(__file__).resolve().parent.parent.joinpath("resources", "fonts", "Monaco.dfont")
+SCREEN_SIZE = 500, 500
+SURFACE_SIZE = 494, 494
+PICTURE_SIZE = 494, 380
+
+# Content sizes: number of words of text, number of choices per node, number of animation frames and number of nodes
+SIZES = {
+    "small": {"words": 10, "choices": 1, "frames": 1, "nodes": 10},
+    "medium": {"words": 60, "choices": 3, "frames": 8, "nodes": 500},
+    "large": {"words": 400, "choices": 6, "frames": 32, "nodes": 10_000},
+}
+
+# A benchmark sets up its state for one size, and returns the function to be timed
+Benchmark = Callable[[Dict[str, int]], Callable[[], None]]
+
+
+def bench_layout_text(size: Dict[str, int]) -> Callable[[], None]:
+    font = _font()
+    text = _text(size["words"])
+    return lambda: list(layout_text_in_area(text, lambda t: font.size(t)[0], 464))
+
+
+def bench_text_box_reveal(size: Dict[str, int]) -> Callable[[], None]:
+    """ Reveal a text box's full text, one cursor step at a time """
+    font = _font()
+    text = _text(size["words"])
+    sound_player = _sound_player()
+    _clear_ui_caches()
+    scheduler = Scheduler()
+    text_box = ui._TextBox(font, (484, 120), text, border_color=(150, 150, 150), text_color=(255, 255, 255),
+                           sound_player=sound_player, scheduler=scheduler)
+
+    def run():
+        while not text_box.is_cursor_at_end():
+            scheduler.update(Millis(40))
+
+    return run
+
+
+def bench_ui_frames(size: Dict[str, int]) -> Callable[[], None]:
+    """ 100 frames of update + redraw, while the text appears and the picture animates """
+    component = _dialog_component(_graph(size, num_nodes=1), size["frames"])
+
+    def run():
+        for _ in range(100):
+            component.update(Millis(16))
+            component.redraw()
+
+    return run
+
+
+def bench_node_transitions(size: Dict[str, int]) -> Callable[[], None]:
+    """ 50 choices, each followed by a redraw of the new node """
+    component = _dialog_component(_graph(size, num_nodes=20), size["frames"])
+
+    def run():
+        for _ in range(50):
+            component._commit_choice(0)
+            component.redraw()
+
+    return run
+
+
+def bench_parse_dialog(size: Dict[str, int]) -> Callable[[], None]:
+    dialog_json = _graph_json(size)
+    return lambda: parse_dialog_from_json(dialog_json)
+
+
+BENCHMARKS: List[Tuple[str, Benchmark]] = [
+    ("layout_text_in_area", bench_layout_text),
+    ("text_box_reveal", bench_text_box_reveal),
+    ("ui_update_redraw", bench_ui_frames),
+    ("node_transition", bench_node_transitions),
+    ("parse_dialog_from_json", bench_parse_dialog),
+]
+
+
+def run_benchmarks(repeats: int, names: List[str]) -> List[Dict]:
+    results = []
+    for name, benchmark in BENCHMARKS:
+        if names and name not in names:
+            continue
+        for size_name, size in SIZES.items():
+            times = []
+            for _ in range(repeats):
+                run = benchmark(size)
+                start_time = time.perf_counter()
+                run()
+                times.append((time.perf_counter() - start_time) * 1000)
+            result = {"name": name, "size": size_name, "repeats": repeats, "min_ms": round(min(times), 4),
+                      "median_ms": round(statistics.median(times), 4)}
+            print(f"{name:<25}{size_name:<8}{result['min_ms']:>10.3f} ms (min){result['median_ms']:>10.3f} ms (median)")
+            results.append(result)
+    return results
+
+
+def compare(results: List[Dict], baseline: List[Dict], threshold: float) -> List[str]:
+    """ Return a description of every benchmark whose best time got slower than the baseline's by more than the
+    threshold (a fraction) """
+    baseline_times = {(r["name"], r["size"]): r["min_ms"] for r in baseline}
+    regressions = []
+    for result in results:
+        baseline_time = baseline_times.get((result["name"], result["size"]))
+        if baseline_time and result["min_ms"] > baseline_time * (1 + threshold):
+            regressions.append(f"{result['name']} ({result['size']}): {baseline_time:.3f} ms -> "
+                               f"{result['min_ms']:.3f} ms (+{(result['min_ms'] / baseline_time - 1) * 100:.0f}%)")
+    return regressions
+
+
+def _clear_ui_caches():
+    """ Every run starts out with empty caches, so that the results don't depend on the runs before it """
+    for cache in [ui.text_layout_cache, ui.rendered_line_cache, ui.picture_frame_cache, ui.choice_button_cache]:
+        cache.clear()
+
+
+def _font() -> Font:
+    return Font(str(FONT_PATH), 17)
+
+
+def _text(num_words: int) -> str:
+    words = ["lorem", "ipsum", "dolor", "sit", "amet,", "consectetur", "adipiscing", "elit."]
+    return " ".join(words[i % len(words)] for i in range(num_words))
+
+
+def _sound_player() -> SoundPlayer:
+    silence = Sound(buffer=bytes(1024))
+    return SoundPlayer({"select_blip": silence}, silence)
+
+
+def _graph(size: Dict[str, int], num_nodes: int) -> DialogGraph:
+    nodes = [DialogNode(str(i), _text(size["words"]),
+                        [DialogChoice(f"Choice {j}", str((i + j + 1) % num_nodes)) for j in range(size["choices"])],
+                        NodeGraphics(animation_id="animation", instant_text=i > 0))
+             for i in range(num_nodes)]
+    return DialogGraph("0", nodes, background_image_id="background")
+
+
+def _dialog_component(dialog_graph: DialogGraph, num_frames: int) -> DialogComponent:
+    _clear_ui_caches()
+    background = Surface(PICTURE_SIZE)
+    background.fill((0, 50, 35))
+    frames = []
+    for i in range(num_frames):
+        frame = Surface((100, 100))
+        frame.fill((i * 255 // num_frames, 100, 100))
+        frames.append(frame)
+    return DialogComponent(
+        surface=Surface(SURFACE_SIZE),
+        dialog_font=_font(),
+        choice_font=Font(str(FONT_PATH), 15),
+        images={"background": background},
+        animations={"animation": frames},
+        sound_player=_sound_player(),
+        dialog_graph=dialog_graph,
+        picture_size=PICTURE_SIZE,
+        select_blip_sound_id="select_blip"
+    )
+
+
+def _graph_json(size: Dict[str, int]) -> Dict:
+    num_nodes = size["nodes"]
+    return {
+        "title": "Benchmark",
+        "graph": {
+            "root": "0",
+            "nodes": [{"id": str(i), "text": _text(size["words"]),
+                       "choices": [[f"Choice {j}", str((i + j + 1) % num_nodes)] for j in range(size["choices"])],
+                       "graphics": {"image": "image"}}
+                      for i in range(num_nodes)]
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the rendering benchmarks headlessly.")
+    parser.add_argument("--output", type=str, help="Write the results to this JSON file.")
+    parser.add_argument("--compare", type=str, help="A JSON file from an earlier run, to check for regressions.")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="How much slower (as a fraction) a benchmark may get before it's a regression. "
+                             "(Default: 0.1)")
+    parser.add_argument("--repeats", type=int, default=7, help="How many times to run each benchmark. (Default: 7)")
+    parser.add_argument("--only", type=str, nargs="*", default=[], help="Only run the benchmarks with these names.")
+    args = parser.parse_args()
+
+    pygame.init()
+    pygame.display.set_mode(SCREEN_SIZE)
+
+    results = run_benchmarks(args.repeats, args.only)
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "pygame": pygame.version.ver,
+            "sdl": ".".join(str(v) for v in pygame.get_sdl_version()),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote results to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions.")
+
+
+if __name__ == '__main__':
+    main()
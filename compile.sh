@@ -0,0 +1,3 @@
+#!/usr/bin/env bash
+
+python3 dialog_tree/runners/dialog_compiler.py "$@"
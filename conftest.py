@@ -0,0 +1,26 @@
+import os
+
+import pygame
+import pytest
+from pygame.mixer import Sound
+
+from dialog_component import DialogComponent
+from sound import SoundPlayer
+
+
+@pytest.fixture
+def make_dialog_component():
+    """ Creates DialogComponents on a small surface, with silent sounds that play without an audio device """
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    pygame.mixer.init()
+    pygame.font.init()
+    silence = Sound(buffer=bytes(1024))
+
+    def make(dialog_graph, images, **kwargs) -> DialogComponent:
+        return DialogComponent(
+            surface=pygame.Surface((200, 200)), dialog_font=pygame.font.Font(None, 15),
+            choice_font=pygame.font.Font(None, 15), images=images, animations={},
+            sound_player=SoundPlayer({"blip": silence}, silence), dialog_graph=dialog_graph, picture_size=(8, 8),
+            select_blip_sound_id="blip", **kwargs)
+
+    return make
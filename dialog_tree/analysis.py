@@ -0,0 +1,153 @@
+from array import array
+from typing import List, NamedTuple, Tuple
+
+from graph import DialogGraph
+
+# The algorithms work on a graph's adjacency arrays (see DialogGraph.adjacency) with nodes referred to by index, and
+# are iterative rather than recursive, so that they cope with graphs of millions of nodes and arbitrarily long paths.
+
+
+class GraphAnalysis(NamedTuple):
+    """ Problems found in a dialog graph. Lists of nodes are in the order of DialogGraph.nodes(). """
+    num_nodes: int
+    num_choices: int
+    # Nodes that can't be reached from the root
+    unreachable_node_ids: List[str]
+    # Nodes without choices that aren't marked as endings
+    dead_end_node_ids: List[str]
+    # Endings that can't be reached from the root
+    unreachable_ending_ids: List[str]
+    num_strongly_connected_components: int
+    # Strongly connected components that one can go around in circles in (i.e. with more than one node, or a node
+    # with a choice that leads back to itself)
+    cycles: List[List[str]]
+
+    def has_problems(self) -> bool:
+        """ Cycles are not counted as problems, as most dialogs have some (like a "Go back" choice) """
+        return bool(self.unreachable_node_ids or self.dead_end_node_ids or self.unreachable_ending_ids)
+
+    def problems(self) -> List[str]:
+        """ One line per kind of problem that was found """
+        return [f"{description} ({len(node_ids)}): {_abbreviate(node_ids)}"
+                for description, node_ids in [("Unreachable nodes", self.unreachable_node_ids),
+                                              ("Dead ends (no choices, not marked as ending)", self.dead_end_node_ids),
+                                              ("Unreachable endings", self.unreachable_ending_ids)]
+                if node_ids]
+
+    def summary(self) -> str:
+        lines = [f"{self.num_nodes} nodes, {self.num_choices} choices, "
+                 f"{self.num_strongly_connected_components} strongly connected components, {len(self.cycles)} cycles"]
+        return "\n".join(lines + self.problems())
+
+
+def analyze_graph(dialog_graph: DialogGraph) -> GraphAnalysis:
+    choice_offsets, choice_targets = dialog_graph.adjacency()
+    node_ids = []
+    is_ending = bytearray()
+    for node in dialog_graph.nodes():
+        node_ids.append(node.node_id)
+        is_ending.append(node.is_ending)
+    num_nodes = len(node_ids)
+
+    reachable = reachable_from(choice_offsets, choice_targets, dialog_graph.root_node_index())
+    component_of, num_components = strongly_connected_components(choice_offsets, choice_targets)
+
+    component_sizes = array("l", [0]) * num_components
+    for component in component_of:
+        component_sizes[component] += 1
+    is_cyclic = bytearray(num_components)
+    for index in range(num_nodes):
+        component = component_of[index]
+        if component_sizes[component] > 1:
+            is_cyclic[component] = 1
+        elif index in choice_targets[choice_offsets[index]:choice_offsets[index + 1]]:
+            is_cyclic[component] = 1
+    cycles_by_component = {}
+    for index in range(num_nodes):
+        component = component_of[index]
+        if is_cyclic[component]:
+            cycles_by_component.setdefault(component, []).append(node_ids[index])
+
+    return GraphAnalysis(
+        num_nodes=num_nodes,
+        num_choices=len(choice_targets),
+        unreachable_node_ids=[node_ids[i] for i in range(num_nodes) if not reachable[i]],
+        dead_end_node_ids=[node_ids[i] for i in range(num_nodes)
+                           if choice_offsets[i] == choice_offsets[i + 1] and not is_ending[i]],
+        unreachable_ending_ids=[node_ids[i] for i in range(num_nodes) if is_ending[i] and not reachable[i]],
+        num_strongly_connected_components=num_components,
+        cycles=list(cycles_by_component.values()),
+    )
+
+
+def reachable_from(choice_offsets: array, choice_targets: array, start_index: int) -> bytearray:
+    """ For each node, whether it can be reached from the start node (by a breadth-first search) """
+    reachable = bytearray(len(choice_offsets) - 1)
+    reachable[start_index] = 1
+    frontier = [start_index]
+    while frontier:
+        next_frontier = []
+        for index in frontier:
+            for target_index in choice_targets[choice_offsets[index]:choice_offsets[index + 1]]:
+                if not reachable[target_index]:
+                    reachable[target_index] = 1
+                    next_frontier.append(target_index)
+        frontier = next_frontier
+    return reachable
+
+
+def strongly_connected_components(choice_offsets: array, choice_targets: array) -> Tuple[array, int]:
+    """ Tarjan's algorithm, with explicit stacks instead of recursion. Returns the component of each node, and the
+    number of components. Components are numbered in reverse topological order (a component's choices only lead to
+    components with lower or equal numbers). """
+    num_nodes = len(choice_offsets) - 1
+    unvisited = -1
+    order = array("l", [unvisited]) * num_nodes
+    lowest = array("l", [0]) * num_nodes
+    component_of = array("l", [unvisited]) * num_nodes
+    # For each node that is being visited, where in choice_targets to continue from
+    next_choice = array("l", choice_offsets)
+    num_visited = 0
+    num_components = 0
+    # Visited nodes that haven't been assigned to a component yet
+    component_stack = []
+
+    for start_index in range(num_nodes):
+        if order[start_index] != unvisited:
+            continue
+        order[start_index] = lowest[start_index] = num_visited
+        num_visited += 1
+        component_stack.append(start_index)
+        path = [start_index]
+        while path:
+            index = path[-1]
+            position = next_choice[index]
+            if position < choice_offsets[index + 1]:
+                next_choice[index] = position + 1
+                target_index = choice_targets[position]
+                if order[target_index] == unvisited:
+                    order[target_index] = lowest[target_index] = num_visited
+                    num_visited += 1
+                    component_stack.append(target_index)
+                    path.append(target_index)
+                elif component_of[target_index] == unvisited and order[target_index] < lowest[index]:
+                    lowest[index] = order[target_index]
+                continue
+
+            path.pop()
+            if path and lowest[index] < lowest[path[-1]]:
+                lowest[path[-1]] = lowest[index]
+            if lowest[index] == order[index]:
+                while True:
+                    member = component_stack.pop()
+                    component_of[member] = num_components
+                    if member == index:
+                        break
+                num_components += 1
+
+    return component_of, num_components
+
+
+def _abbreviate(node_ids: List[str], max_shown: int = 20) -> str:
+    shown = ", ".join(node_ids[:max_shown])
+    return shown if len(node_ids) <= max_shown else f"{shown}, ... ({len(node_ids) - max_shown} more)"
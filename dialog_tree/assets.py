@@ -0,0 +1,451 @@
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+from pathlib import Path
+from threading import Lock
+from typing import Dict, List, Optional, Tuple, TypeVar, Generic, Iterator, Mapping, Iterable, Callable, Sequence, \
+    Set
+
+import pygame
+from pygame.mixer import Sound
+from pygame.surface import Surface
+
+from cache import LruCache, surface_size_in_bytes
+from constants import Vec2, Millis
+
+T = TypeVar("T")
+
+# Used as the colorkey for images with fully transparent areas, unless the image itself contains this color
+_COLORKEY = (255, 0, 255)
+
+
+def load_image_file(filepath: Path) -> Surface:
+    try:
+        return pygame.image.load(str(filepath))
+    except pygame.error as e:
+        raise Exception(f"Failed to load image '{filepath}': {e}")
+
+
+def load_and_scale(filepath: Path, size: Vec2) -> Surface:
+    return pygame.transform.scale(load_image_file(filepath), size)
+
+
+def convert_for_display(surface: Surface) -> Surface:
+    """
+    Return a copy of the surface in the display's pixel format, so that blitting it to the screen needs no conversion
+
+    Per-pixel alpha is only kept if some pixels are partly transparent. Surfaces that are either fully transparent or
+    fully opaque in each pixel get a colorkey with RLE acceleration instead, which is much cheaper to blit. Before a
+    display mode has been set, the surface is returned as it is.
+    """
+    if pygame.display.get_surface() is None:
+        return surface
+    colorkey = surface.get_colorkey()
+    if colorkey is not None:
+        converted = surface.convert()
+        converted.set_colorkey(colorkey, pygame.RLEACCEL)
+        return converted
+    if not surface.get_flags() & pygame.SRCALPHA:
+        return surface.convert()
+    num_pixels = surface.get_width() * surface.get_height()
+    num_opaque = pygame.mask.from_surface(surface, 254).count()
+    if num_opaque == num_pixels:
+        return surface.convert()
+    num_visible = pygame.mask.from_surface(surface, 0).count()
+    uses_key_color = pygame.mask.from_threshold(surface, _COLORKEY, (1, 1, 1, 255)).count() > 0
+    if num_opaque != num_visible or uses_key_color:
+        return surface.convert_alpha()
+    converted = Surface(surface.get_size()).convert()
+    converted.fill(_COLORKEY)
+    converted.blit(surface, (0, 0))
+    converted.set_colorkey(_COLORKEY, pygame.RLEACCEL)
+    return converted
+
+
+def load_sound_file(filepath: str) -> Sound:
+    try:
+        sound = Sound(filepath)
+        sound.set_volume(0.2)
+        return sound
+    except Exception as e:
+        raise Exception(f"Failed to load sound file '{filepath}': {e}")
+
+
+class SurfaceDiskCache:
+    """
+    A directory of decoded and scaled images, stored as raw pixels
+
+    Each source image gets one cache file per size that it's scaled to, holding a small header and the scaled pixels
+    in a format that Pygame can use directly. The file is memory-mapped on a hit, so no PNG decoding or scaling is
+    needed. An entry is rebuilt whenever the source file's modification time or size doesn't match its header.
+    """
+
+    _MAGIC = b"DTSC"
+    _VERSION = 1
+    # magic, version, has_alpha, width, height, source mtime (ns), source size
+    _HEADER = struct.Struct("<4sHHIIqq")
+
+    def __init__(self, directory: Path):
+        self._directory = Path(directory)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def load_and_scale(self, filepath: Path, size: Vec2) -> Surface:
+        stat = os.stat(filepath)
+        key = f"{Path(filepath).resolve()}:{size[0]}x{size[1]}"
+        cache_filepath = self._directory.joinpath(hashlib.sha1(key.encode("utf-8")).hexdigest() + ".raw")
+        surface = self._read(cache_filepath, size, stat)
+        with self._lock:
+            if surface is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if surface is None:
+            surface = load_and_scale(filepath, size)
+            self._write(cache_filepath, surface, stat)
+        return surface
+
+    def _read(self, cache_filepath: Path, size: Vec2, stat: os.stat_result) -> Optional[Surface]:
+        try:
+            with open(cache_filepath, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            return None
+        if len(mapped) < self._HEADER.size:
+            mapped.close()
+            return None
+        magic, version, has_alpha, width, height, mtime_ns, source_size = self._HEADER.unpack_from(mapped)
+        pixel_format = "RGBA" if has_alpha else "RGB"
+        if (magic, version, (width, height), mtime_ns, source_size) != \
+                (self._MAGIC, self._VERSION, tuple(size), stat.st_mtime_ns, stat.st_size) \
+                or len(mapped) != self._HEADER.size + width * height * len(pixel_format):
+            mapped.close()
+            return None
+        # The surface keeps a reference to the mapped buffer, so the pixels stay valid for as long as it's used
+        return pygame.image.frombuffer(memoryview(mapped)[self._HEADER.size:], (width, height), pixel_format)
+
+    def _write(self, cache_filepath: Path, surface: Surface, stat: os.stat_result):
+        has_alpha = bool(surface.get_flags() & pygame.SRCALPHA) or surface.get_colorkey() is not None
+        pixels = pygame.image.tostring(surface, "RGBA" if has_alpha else "RGB")
+        header = self._HEADER.pack(self._MAGIC, self._VERSION, has_alpha, surface.get_width(), surface.get_height(),
+                                   stat.st_mtime_ns, stat.st_size)
+        # Write to a temporary file first, so that a concurrent reader never sees a partially written entry
+        tmp_filepath = cache_filepath.with_name(f"{cache_filepath.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_filepath, "wb") as f:
+            f.write(header)
+            f.write(pixels)
+        os.replace(tmp_filepath, cache_filepath)
+
+
+class LoadingAssets(Mapping[str, T], Generic[T]):
+    """
+    A read-only mapping of assets that may still be loading in the background
+
+    Keys are known as soon as an asset has been registered, so membership checks never block. Looking up an asset
+    that hasn't finished loading schedules it (if needed) and blocks until it's ready, re-raising the error if loading
+    failed.
+    """
+
+    def __init__(self, loader: "AssetLoader"):
+        self._loader = loader
+        # For each asset: the files to load (as load functions with arguments) and how to combine them into the asset
+        self._sources: Dict[str, Tuple[List[Tuple[Callable, tuple]], Callable[[List], T]]] = {}
+        self._evictable: Set[str] = set()
+        self._scheduled: Dict[str, List[Future]] = {}
+        # Assets that have been looked up since they were last scheduled, combined from their loaded files
+        self._combined: Dict[str, T] = {}
+
+    def _register(self, asset_id: str, jobs: List[Tuple[Callable, tuple]], combine: Callable[[List], T],
+        lazy: bool):
+        self._sources[asset_id] = (jobs, combine)
+        if lazy:
+            self._evictable.add(asset_id)
+        else:
+            self._schedule(asset_id)
+
+    def _schedule(self, asset_id: str) -> List[Future]:
+        futures = self._scheduled.get(asset_id)
+        if futures is None:
+            jobs, _ = self._sources[asset_id]
+            futures = self._scheduled[asset_id] = [self._loader._submit(load, *args) for load, args in jobs]
+        return futures
+
+    def _evict_all_except(self, asset_ids: Set[str]):
+        for asset_id in [a for a in self._scheduled if a in self._evictable and a not in asset_ids]:
+            for future in self._scheduled.pop(asset_id):
+                future.cancel()
+            self._combined.pop(asset_id, None)
+
+    def is_loaded(self, asset_id: str) -> bool:
+        futures = self._scheduled.get(asset_id)
+        return futures is not None and all(f.done() for f in futures)
+
+    def __getitem__(self, asset_id: str) -> T:
+        asset = self._combined.get(asset_id)
+        if asset is not None:
+            self._loader._record_access(hit=True, stall_seconds=0)
+            return asset
+        _, combine = self._sources[asset_id]
+        if self.is_loaded(asset_id):
+            self._loader._record_access(hit=True, stall_seconds=0)
+            results = [f.result() for f in self._scheduled[asset_id]]
+        else:
+            start_time = time.perf_counter()
+            results = [f.result() for f in self._schedule(asset_id)]
+            self._loader._record_access(hit=False, stall_seconds=time.perf_counter() - start_time)
+        asset = self._combined[asset_id] = combine(results)
+        return asset
+
+    def __contains__(self, asset_id) -> bool:
+        return asset_id in self._sources
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._sources)
+
+    def __len__(self) -> int:
+        return len(self._sources)
+
+
+class FrameBudget:
+    """
+    Memory budget shared by streamed animations
+
+    Holds the decoded frames of all StreamedAnimations that use it, and evicts the least recently shown frames once
+    their total size exceeds max_bytes.
+    """
+
+    def __init__(self, max_bytes: int):
+        self._frames: LruCache[Tuple[str, int], Surface] = LruCache(max_bytes=max_bytes,
+                                                                    size_of=surface_size_in_bytes)
+        self._lock = Lock()
+        self.decodes = 0
+        self._window_evictions = 0
+
+    def get(self, key: Tuple[str, int]) -> Optional[Surface]:
+        return self._frames.get(key)
+
+    def add_decoded(self, key: Tuple[str, int], frame: Surface):
+        self._frames.put(key, frame)
+        with self._lock:
+            self.decodes += 1
+
+    def evict(self, key: Tuple[str, int]) -> bool:
+        evicted = self._frames.pop(key) is not None
+        if evicted:
+            with self._lock:
+                self._window_evictions += 1
+        return evicted
+
+    @property
+    def evictions(self) -> int:
+        return self._frames.evictions + self._window_evictions
+
+    @property
+    def num_bytes(self) -> int:
+        return self._frames.num_bytes
+
+    def __repr__(self):
+        return f"FrameBudget(bytes={self.num_bytes}, decodes={self.decodes}, evictions={self.evictions})"
+
+
+class StreamedAnimation(Sequence[Surface]):
+    """
+    The frames of an animation, decoded from file only when they are shown
+
+    At most window_size decoded frames of the animation are kept, and all streamed animations together stay within
+    the given FrameBudget. Can be used in place of a list of frames wherever the UI expects an animation.
+    """
+
+    def __init__(self, animation_id: str, frame_filepaths: List[Path], picture_size: Vec2, budget: FrameBudget,
+        window_size: int = 16, load: Callable[[Path, Vec2], Surface] = load_and_scale):
+        if window_size < 1:
+            raise ValueError("Animation window must hold at least one frame!")
+        self._animation_id = animation_id
+        self._frame_filepaths = frame_filepaths
+        self._picture_size = picture_size
+        self._budget = budget
+        self._window_size = window_size
+        self._load = load
+        self._window: "OrderedDict[int, None]" = OrderedDict()
+        self._lock = Lock()
+        self.decodes = 0
+        self.evictions = 0
+
+    def __getitem__(self, index: int) -> Surface:
+        index = range(len(self))[index]
+        key = (self._animation_id, index)
+        frame = self._budget.get(key)
+        if frame is None:
+            frame = self._load(self._frame_filepaths[index], self._picture_size)
+            self._budget.add_decoded(key, frame)
+            self.decodes += 1
+        self._keep_in_window(index)
+        return frame
+
+    def _keep_in_window(self, index: int):
+        with self._lock:
+            self._window[index] = None
+            self._window.move_to_end(index)
+            while len(self._window) > self._window_size:
+                evicted_index, _ = self._window.popitem(last=False)
+                if self._budget.evict((self._animation_id, evicted_index)):
+                    self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._frame_filepaths)
+
+    def __repr__(self):
+        return f"StreamedAnimation({self._animation_id}, frames={len(self)}, decodes={self.decodes}, " \
+               f"evictions={self.evictions})"
+
+
+class AssetLoader:
+    """
+    Decodes images, animation frames and sounds on a pool of worker threads
+
+    Assets are decoded in the order that they are scheduled, so schedule the ones that are needed first (for example
+    those of the dialog's root node) before the rest. The images, animations and sounds attributes can be handed to
+    DialogComponent/SoundPlayer right away, as they only block when an asset is used before it has been loaded.
+
+    Assets are either loaded eagerly (load_*) and kept for good, or registered lazily (register_*) in which case they
+    are only loaded when prefetched or used, and can be evicted again. Every lookup counts as a hit if the asset had
+    already been loaded, or as a miss that stalled the caller for a while otherwise.
+
+    If a disk cache is given, scaled images are read from and written to it instead of being decoded from scratch.
+    Loaded images are converted to the display's pixel format (see convert_for_display), so create the window first.
+    """
+
+    def __init__(self, picture_size: Vec2, num_workers: Optional[int] = None,
+        disk_cache: Optional[SurfaceDiskCache] = None):
+        self._picture_size = picture_size
+        self._load_scaled_image = disk_cache.load_and_scale if disk_cache else load_and_scale
+        self._executor = ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="asset-loader")
+        self._lock = Lock()
+        self._num_scheduled = 0
+        self._num_finished = 0
+        self._errors: List[BaseException] = []
+        self.hits = 0
+        self.misses = 0
+        self._stall_seconds = 0.0
+        self.images: LoadingAssets[Surface] = LoadingAssets(self)
+        self.animations: LoadingAssets[Sequence[Surface]] = LoadingAssets(self)
+        self.sounds: LoadingAssets[Sound] = LoadingAssets(self)
+
+    def load_image(self, image_id: str, filepath: Path, lazy: bool = False):
+        if image_id not in self.images:
+            self.images._register(image_id, [(self._load_image, (filepath, self._picture_size))], _single, lazy)
+
+    def register_image(self, image_id: str, filepath: Path):
+        self.load_image(image_id, filepath, lazy=True)
+
+    def load_animation(self, animation_id: str, frame_filepaths: List[Path], lazy: bool = False):
+        if animation_id not in self.animations:
+            jobs = [(self._load_image, (filepath, self._picture_size)) for filepath in frame_filepaths]
+            self.animations._register(animation_id, jobs, list, lazy)
+
+    def register_animation(self, animation_id: str, frame_filepaths: List[Path]):
+        self.load_animation(animation_id, frame_filepaths, lazy=True)
+
+    def stream_animation(self, animation_id: str, frame_filepaths: List[Path], budget: FrameBudget,
+        window_size: int = 16):
+        """ Register an animation whose frames are decoded lazily (on the thread that shows them) instead of being
+        loaded up front. """
+        if animation_id not in self.animations:
+            animation = StreamedAnimation(animation_id, frame_filepaths, self._picture_size, budget, window_size,
+                                          self._load_image)
+            self.animations._register(animation_id, [], lambda _: animation, lazy=False)
+
+    def load_sound(self, sound_id: str, filepath: Path, lazy: bool = False):
+        if sound_id not in self.sounds:
+            self.sounds._register(sound_id, [(load_sound_file, (str(filepath),))], _single, lazy)
+
+    def register_sound(self, sound_id: str, filepath: Path):
+        self.load_sound(sound_id, filepath, lazy=True)
+
+    def prefetch(self, image_ids: Iterable[str] = (), animation_ids: Iterable[str] = (),
+        sound_ids: Iterable[str] = ()):
+        """ Start loading the given assets in the background (in the given order), unless they are already loaded.
+        Unknown IDs are ignored. """
+        for assets, asset_ids in self._by_kind(image_ids, animation_ids, sound_ids):
+            for asset_id in asset_ids:
+                if asset_id in assets:
+                    assets._schedule(asset_id)
+
+    def evict_all_except(self, image_ids: Iterable[str] = (), animation_ids: Iterable[str] = (),
+        sound_ids: Iterable[str] = ()):
+        """ Drop all lazily registered assets that aren't among the given ones, so that they have to be loaded again
+        if they are needed later. Eagerly loaded assets are never evicted. """
+        for assets, asset_ids in self._by_kind(image_ids, animation_ids, sound_ids):
+            assets._evict_all_except(set(asset_ids))
+
+    def is_loaded(self, image_ids: Iterable[str] = (), animation_ids: Iterable[str] = (),
+        sound_ids: Iterable[str] = ()) -> bool:
+        """ Check if the given assets are done loading. Unknown IDs are ignored. """
+        return all(assets.is_loaded(asset_id)
+                   for assets, asset_ids in self._by_kind(image_ids, animation_ids, sound_ids)
+                   for asset_id in asset_ids if asset_id in assets)
+
+    def progress(self) -> Tuple[int, int]:
+        """ Return the number of files that have been loaded so far, and the total number of scheduled files """
+        with self._lock:
+            return self._num_finished, self._num_scheduled
+
+    def hit_rate(self) -> float:
+        """ The share of asset lookups that didn't have to wait for the asset to be loaded """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stall_time(self) -> Millis:
+        """ The total time that lookups have spent waiting for assets to be loaded """
+        return Millis(int(self._stall_seconds * 1000))
+
+    def raise_first_error(self):
+        """ Re-raise the first error that occurred while loading, if any, so that broken assets are reported early
+        rather than when they are first used. """
+        with self._lock:
+            if self._errors:
+                raise self._errors[0]
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+    def _load_image(self, filepath: Path, size: Vec2) -> Surface:
+        return convert_for_display(self._load_scaled_image(filepath, size))
+
+    def _by_kind(self, image_ids: Iterable[str], animation_ids: Iterable[str], sound_ids: Iterable[str]):
+        return [(self.images, image_ids), (self.animations, animation_ids), (self.sounds, sound_ids)]
+
+    def _submit(self, load: Callable, *args) -> Future:
+        with self._lock:
+            self._num_scheduled += 1
+        future = self._executor.submit(load, *args)
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, future: Future):
+        with self._lock:
+            if future.cancelled():
+                self._num_scheduled -= 1
+                return
+            self._num_finished += 1
+            if future.exception() is not None:
+                self._errors.append(future.exception())
+
+    def _record_access(self, hit: bool, stall_seconds: float):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+                self._stall_seconds += stall_seconds
+
+
+def _single(results: List[T]) -> T:
+    return results[0]
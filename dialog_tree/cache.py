@@ -0,0 +1,112 @@
+from collections import OrderedDict
+from threading import RLock
+from typing import Callable, Optional, TypeVar, Generic, Hashable
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+# Default for arguments of set_limits that weren't given
+_UNCHANGED = object()
+
+
+class LruCache(Generic[K, V]):
+    """
+    A bounded mapping that evicts the least recently used entries
+
+    The cache can be bounded by number of entries, by total size in bytes (as reported by size_of), or both. It keeps
+    hit/miss/eviction counters so that the limits can be tuned. All operations are thread-safe.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None,
+        size_of: Optional[Callable[[V], int]] = None):
+        if max_bytes is not None and size_of is None:
+            raise ValueError("A byte limit requires a size_of function!")
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._size_of = size_of
+        self._entries: "OrderedDict[K, V]" = OrderedDict()
+        self._lock = RLock()
+        self.num_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: K) -> Optional[V]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return value
+
+    def get_or_create(self, key: K, create: Callable[[], V]) -> V:
+        value = self.get(key)
+        if value is None:
+            value = create()
+            self.put(key, value)
+        return value
+
+    def put(self, key: K, value: V):
+        with self._lock:
+            self.pop(key)
+            self._entries[key] = value
+            if self._size_of:
+                self.num_bytes += self._size_of(value)
+            self._evict_over_limits()
+
+    def pop(self, key: K) -> Optional[V]:
+        with self._lock:
+            value = self._entries.pop(key, None)
+            if value is not None and self._size_of:
+                self.num_bytes -= self._size_of(value)
+            return value
+
+    def set_limits(self, max_entries: Optional[int] = _UNCHANGED, max_bytes: Optional[int] = _UNCHANGED):
+        """ Change the given limits (None removes a limit). Limits that aren't given are left as they are. """
+        if max_bytes is not None and max_bytes is not _UNCHANGED and self._size_of is None:
+            raise ValueError("A byte limit requires a size_of function!")
+        with self._lock:
+            if max_entries is not _UNCHANGED:
+                self._max_entries = max_entries
+            if max_bytes is not _UNCHANGED:
+                self._max_bytes = max_bytes
+            self._evict_over_limits()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.num_bytes = 0
+
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def _evict_over_limits(self):
+        while self._entries and self._is_over_limits():
+            _, value = self._entries.popitem(last=False)
+            if self._size_of:
+                self.num_bytes -= self._size_of(value)
+            self.evictions += 1
+
+    def _is_over_limits(self) -> bool:
+        if self._max_entries is not None and len(self._entries) > self._max_entries:
+            return True
+        return self._max_bytes is not None and self.num_bytes > self._max_bytes
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __repr__(self):
+        return f"LruCache(entries={len(self)}, bytes={self.num_bytes}, hits={self.hits}, misses={self.misses}, " \
+               f"evictions={self.evictions})"
+
+
+def surface_size_in_bytes(surface) -> int:
+    """ The number of bytes used by a Pygame Surface's pixels. Use as size_of for caches that hold surfaces. """
+    width, height = surface.get_size()
+    return width * height * surface.get_bytesize()
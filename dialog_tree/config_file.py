@@ -1,14 +1,46 @@
+import gc
 import json
-from typing import List, Dict
+import mmap
+import struct
+import sys
+import zlib
+from array import array
+from typing import List, Dict, Tuple, Optional, Callable, Iterator, TextIO, Any, NamedTuple
 
 from constants import Millis
-from graph import DialogGraph, DialogNode, DialogChoice, NodeGraphics
+from graph import DialogGraph, DialogNode, DialogChoice, NodeGraphics, LazyDialogGraph, NodeSource
 
 
 def load_dialog_from_file(file_path: str) -> DialogGraph:
+    """ Load a dialog from a JSON file, building its nodes while the file is read (see parse_dialog_from_stream), or
+    from a compiled dialog (see compile_dialog) """
     print(f"Loading dialog: {file_path}")
+    if is_compiled_dialog_file(file_path):
+        return load_compiled_dialog(file_path)
     with open(file_path) as f:
-        return parse_dialog_from_json(json.load(f))
+        return parse_dialog_from_stream(f)
+
+
+def is_compiled_dialog_file(file_path: str) -> bool:
+    with open(file_path, "rb") as f:
+        return f.read(len(COMPILED_DIALOG_MAGIC)) == COMPILED_DIALOG_MAGIC
+
+
+def parse_dialog_from_stream(stream: TextIO) -> DialogGraph:
+    """
+    Parse a dialog from a JSON file, without first decoding all of it
+
+    The nodes of a graph are built one by one as they are read, so that the decoded JSON of at most one node is held
+    in memory at a time, rather than that of the whole file. The result is the same as that of parse_dialog_from_json
+    on the decoded file, and so are the errors for invalid dialogs (like a choice leading to a missing node). Only
+    invalid JSON, or JSON that isn't shaped like a dialog, makes the file be decoded in full and parsed again, so that
+    those errors are also reported exactly as parse_dialog_from_json would. The stream must be seekable.
+    """
+    try:
+        return _parse_dialog_stream(_JsonReader(stream))
+    except (_Unstreamable, json.JSONDecodeError):
+        stream.seek(0)
+        return parse_dialog_from_json(json.load(stream))
 
 
 def parse_dialog_from_json(dialog_json: Dict) -> DialogGraph:
@@ -25,36 +57,66 @@ def parse_dialog_from_json(dialog_json: Dict) -> DialogGraph:
 
 
 def _parse_sequence_json(sequence_json) -> DialogGraph:
+    shared_graphics = _SharedGraphics()
     root_id = "START"
     initial_step = sequence_json[0]
     next_text = "Next"
     nodes = [
-        DialogNode(root_id, initial_step[0], [DialogChoice(next_text, "1")], NodeGraphics(image_ids=[initial_step[1]]))]
+        DialogNode(root_id, initial_step[0], [DialogChoice(next_text, "1")],
+                   shared_graphics.get(image_id=initial_step[1]))]
     for i in range(1, len(sequence_json) - 1):
         step = sequence_json[i]
         nodes.append(
-            DialogNode(str(i), step[0], [DialogChoice(next_text, str(i + 1))], NodeGraphics(image_ids=[step[1]])))
+            DialogNode(str(i), step[0], [DialogChoice(next_text, str(i + 1))], shared_graphics.get(image_id=step[1])))
     last_step = sequence_json[-1]
     nodes.append(
         DialogNode(str(len(sequence_json) - 1), last_step[0],
-                   [DialogChoice("Play from beginning", root_id)], NodeGraphics(image_ids=[last_step[1]]), ))
+                   [DialogChoice("Play from beginning", root_id)], shared_graphics.get(image_id=last_step[1]), ))
     return DialogGraph(root_id, nodes)
 
 
 def _parse_graph_json(graph_json) -> DialogGraph:
+    parse_node = _node_parser()
+    return DialogGraph(graph_json["root"], [parse_node(node) for node in graph_json["nodes"]])
+
+
+def parse_graph_nodes_from_json(graph_json: Dict) -> Tuple[Optional[str], List[DialogNode], List[str]]:
+    """ The root node ID and the nodes of a "graph" config, without checking that they make up a valid graph (see
+    graph.find_graph_errors). Nodes that can't be parsed are left out, and described in the returned errors. """
+    parse_node = _node_parser()
+    nodes = []
+    errors = [] if "root" in graph_json else ["Graph has no root"]
+    for i, node_json in enumerate(graph_json.get("nodes", [])):
+        try:
+            nodes.append(parse_node(node_json))
+        except (KeyError, IndexError, TypeError, ValueError, AttributeError) as e:
+            description = f"missing {e}" if isinstance(e, KeyError) else str(e)
+            errors.append(f"Invalid config for graph node #{i}: {description}")
+    return graph_json.get("root"), nodes, errors
+
+
+def _node_parser() -> Callable[[Dict], DialogNode]:
+    shared_graphics = _SharedGraphics()
+    # Choices that are identical (like a "Back to start" on every node) are shared between nodes
+    shared_choices: Dict[Tuple[str, str], DialogChoice] = {}
+
     def parse_choice(array: List[str]) -> DialogChoice:
-        return DialogChoice(array[0], array[1])
+        key = (array[0], array[1])
+        choice = shared_choices.get(key)
+        if choice is None:
+            choice = shared_choices[key] = DialogChoice(array[0], array[1])
+        return choice
 
     def parse_graphics(graphics) -> NodeGraphics:
         offset = graphics.get("offset", None)
         screen_shake = Millis(graphics["screen_shake"]) if "screen_shake" in graphics else None
         instant_text = graphics.get("instant_text", False)
         if "image" in graphics:
-            return NodeGraphics(image_ids=[graphics["image"]], offset=offset, screen_shake=screen_shake,
-                                instant_text=instant_text)
+            return shared_graphics.get(image_id=graphics["image"], offset=offset, screen_shake=screen_shake,
+                                       instant_text=instant_text)
         elif "animation" in graphics:
-            return NodeGraphics(animation_id=graphics["animation"], offset=offset,
-                                screen_shake=screen_shake, instant_text=instant_text)
+            return shared_graphics.get(animation_id=graphics["animation"], offset=offset,
+                                       screen_shake=screen_shake, instant_text=instant_text)
         else:
             raise ValueError(f"Missing image/animation config for node!")
 
@@ -64,6 +126,578 @@ def _parse_graph_json(graph_json) -> DialogGraph:
             text=node["text"],
             choices=[parse_choice(choice) for choice in node["choices"]],
             graphics=parse_graphics(node["graphics"]) if "graphics" in node else None,
-            sound_id=node.get("sound", None))
+            sound_id=node.get("sound", None),
+            is_ending=node.get("ending", False))
 
-    return DialogGraph(graph_json["root"], [parse_node(node) for node in graph_json["nodes"]])
+    return parse_node
+
+
+class _SharedGraphics:
+    """ Hands out one NodeGraphics per distinct configuration, as most nodes of a large dialog share their graphics
+    with many others """
+
+    def __init__(self):
+        self._graphics: Dict[Tuple, NodeGraphics] = {}
+
+    def get(self, image_id: Optional[str] = None, animation_id: Optional[str] = None,
+        offset: Optional[List[int]] = None, screen_shake: Optional[Millis] = None,
+        instant_text: bool = False) -> NodeGraphics:
+        key = (image_id, animation_id, tuple(offset) if offset else None, screen_shake, instant_text)
+        graphics = self._graphics.get(key)
+        if graphics is None:
+            graphics = self._graphics[key] = NodeGraphics(
+                animation_id=animation_id, image_ids=[image_id] if image_id is not None else None, offset=offset,
+                screen_shake=screen_shake, instant_text=instant_text)
+        return graphics
+
+
+def _parse_dialog_stream(reader: "_JsonReader") -> DialogGraph:
+    # Mirrors parse_dialog_from_json, except that the graph's nodes are parsed while they are read
+    if reader.peek() != "{":
+        raise _Unstreamable()
+    dialog_json = {}
+    for key in reader.members():
+        if key == "graph":
+            dialog_json[key] = _read_graph(reader)
+        else:
+            dialog_json[key] = reader.value()
+    if reader.peek() != "":
+        raise _Unstreamable()
+
+    if "graph" in dialog_json:
+        graph_json, nodes, node_error = dialog_json["graph"]
+        root_id = graph_json["root"]
+        if nodes is None:
+            raise KeyError("nodes")
+        if node_error is not None:
+            raise node_error
+        dialog_graph = DialogGraph(root_id, nodes)
+    elif "sequence" in dialog_json:
+        dialog_graph = _parse_sequence_json(dialog_json["sequence"])
+    else:
+        raise ValueError(f"Invalid configuration file!")
+
+    dialog_graph.title = dialog_json.get("title", None)
+    dialog_graph.background_image_id = dialog_json.get("background_image_id", None)
+    return dialog_graph
+
+
+def _read_graph(reader: "_JsonReader") -> Tuple[Dict, Optional[List[DialogNode]], Optional[Exception]]:
+    """
+    Read the graph's nodes (parsing each one as soon as it has been read) and its other values
+
+    The first error in a node is returned rather than raised, and the rest of the file is still read. Invalid JSON
+    further on, or a missing root, is then reported instead, as parse_dialog_from_json would.
+    """
+    if reader.peek() != "{":
+        raise _Unstreamable()
+    parse_node = _node_parser()
+    graph_json = {}
+    nodes = None
+    node_error = None
+    for key in reader.members():
+        if key == "nodes":
+            if reader.peek() != "[":
+                raise _Unstreamable()
+            nodes = []
+            node_error = None
+            for _ in reader.elements():
+                node_json = reader.value()
+                if node_error is None:
+                    try:
+                        nodes.append(parse_node(node_json))
+                    except Exception as e:
+                        node_error = e
+        else:
+            graph_json[key] = reader.value()
+    return graph_json, nodes, node_error
+
+
+class _Unstreamable(Exception):
+    """ The file isn't shaped like a dialog, so it has to be decoded in full """
+
+
+class _JsonReader:
+    """
+    Reads a JSON document from a text stream a piece at a time
+
+    Walk through objects and arrays with members() and elements(), and decode the values within them with value().
+    Only the part of the file that is being decoded is kept in memory.
+    """
+
+    _WHITESPACE = " \t\n\r"
+
+    def __init__(self, stream: TextIO, chunk_size: int = 64 * 1024):
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._position = 0
+        self._at_end_of_stream = False
+
+    def peek(self) -> str:
+        """ Return the next non-whitespace character (without consuming it), or "" at the end of the document """
+        while True:
+            while self._position < len(self._buffer) and self._buffer[self._position] in self._WHITESPACE:
+                self._position += 1
+            if self._position < len(self._buffer):
+                return self._buffer[self._position]
+            if not self._read_more():
+                return ""
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._position)
+            except json.JSONDecodeError:
+                # Probably just cut off at the end of the buffer. Read at least as much again as is pending, so that
+                # a long value isn't decoded over and over.
+                if self._read_more(len(self._buffer) - self._position):
+                    continue
+                raise
+            # A number at the very end of the buffer may continue in the next chunk
+            if end == len(self._buffer) and self._read_more():
+                continue
+            self._position = end
+            return value
+
+    def members(self) -> Iterator[str]:
+        """ Step into an object, yielding each key with the reader positioned at its value (which must be consumed
+        before moving on) """
+        self._expect("{")
+        if self.peek() == "}":
+            self._position += 1
+            return
+        while True:
+            key = self.value()
+            if not isinstance(key, str):
+                self._fail("Expecting property name enclosed in double quotes")
+            self._expect(":")
+            yield key
+            if self.peek() != ",":
+                self._expect("}")
+                return
+            self._position += 1
+
+    def elements(self) -> Iterator[None]:
+        """ Step into an array, yielding once per element with the reader positioned at it (the element must be
+        consumed before moving on) """
+        self._expect("[")
+        if self.peek() == "]":
+            self._position += 1
+            return
+        while True:
+            yield
+            if self.peek() != ",":
+                self._expect("]")
+                return
+            self._position += 1
+
+    def _expect(self, char: str):
+        if self.peek() != char:
+            self._fail(f"Expecting '{char}'")
+        self._position += 1
+
+    def _fail(self, message: str):
+        raise json.JSONDecodeError(message, self._buffer, self._position)
+
+    def _read_more(self, min_size: int = 0) -> bool:
+        if self._at_end_of_stream:
+            return False
+        chunk = self._stream.read(max(self._chunk_size, min_size))
+        if not chunk:
+            self._at_end_of_stream = True
+            return False
+        self._buffer = self._buffer[self._position:] + chunk
+        self._position = 0
+        return True
+
+
+# Compiled dialogs
+#
+# A compiled dialog is a header followed by a payload:
+#
+#   header:  magic, format version (u16), reserved (u16), payload size (u64), CRC-32 of the payload (u32)
+#   payload: counts and dialog-level fields (u32 each, see _Counts), then the tables of _TABLES (little-endian u32/i32
+#            arrays), and finally all strings as one block of UTF-8.
+#
+# Strings are referred to by their index in the string table (which holds the byte offset where each string ends),
+# with NO_STRING standing for None. Choices refer to the node that they lead to by its index, and identical choices
+# and graphics are only stored once. As every table has entries of the same size, a single node can be decoded
+# without reading the rest of the file (see open_compiled_dialog).
+
+COMPILED_DIALOG_MAGIC = b"DTDC"
+COMPILED_DIALOG_VERSION = 3
+
+_HEADER = struct.Struct("<4sHHQI")
+_COUNTS = struct.Struct("<10I")
+
+
+class _Counts(NamedTuple):
+    num_strings: int
+    num_string_bytes: int
+    num_nodes: int
+    num_node_choices: int
+    num_choices: int
+    num_graphics: int
+    num_image_ids: int
+    title: int
+    background: int
+    root: int
+
+
+# Name, type and length (a field of _Counts) of each table, in the order that they are stored in
+_TABLES = [
+    ("string_ends", "I", "num_strings"),
+    ("node_ids", "I", "num_nodes"),
+    ("node_texts", "I", "num_nodes"),
+    ("node_sounds", "I", "num_nodes"),
+    ("node_graphics", "I", "num_nodes"),
+    ("node_choice_ends", "I", "num_nodes"),
+    ("node_flags", "I", "num_nodes"),
+    # Node indices, ordered by node ID
+    ("nodes_by_id", "I", "num_nodes"),
+    ("node_choices", "I", "num_node_choices"),
+    ("choice_texts", "I", "num_choices"),
+    ("choice_targets", "I", "num_choices"),
+    ("graphics_animations", "I", "num_graphics"),
+    ("graphics_image_ends", "I", "num_graphics"),
+    ("graphics_offset_xs", "i", "num_graphics"),
+    ("graphics_offset_ys", "i", "num_graphics"),
+    ("graphics_screen_shakes", "i", "num_graphics"),
+    ("graphics_flags", "I", "num_graphics"),
+    ("image_ids", "I", "num_image_ids"),
+]
+_TABLE_ITEM_SIZE = 4
+_NO_STRING = 0xFFFFFFFF
+_NO_GRAPHICS = 0xFFFFFFFF
+_INSTANT_TEXT = 1
+_HAS_SCREEN_SHAKE = 2
+_HAS_IMAGE_IDS = 4
+_IS_ENDING = 1
+
+
+def compile_dialog(dialog_graph: DialogGraph) -> bytes:
+    """ Encode a dialog in the compiled format, which load_compiled_dialog reads much faster than a JSON file """
+    strings = _StringTable()
+    nodes = list(dialog_graph.nodes())
+    index_by_id = {node.node_id: index for index, node in enumerate(nodes)}
+    tables = {name: array(typecode) for name, typecode, _ in _TABLES}
+    tables["string_ends"] = strings.ends
+    choice_index_by_key: Dict[Tuple[str, str], int] = {}
+    graphics_index_by_key: Dict[Tuple, int] = {}
+
+    for node in nodes:
+        tables["node_ids"].append(strings.index(node.node_id))
+        tables["node_texts"].append(strings.index(node.text))
+        tables["node_sounds"].append(strings.index(node.sound_id))
+        for choice in node.choices:
+            key = (choice.text, choice.leads_to_id)
+            choice_index = choice_index_by_key.get(key)
+            if choice_index is None:
+                choice_index = choice_index_by_key[key] = len(choice_index_by_key)
+                tables["choice_texts"].append(strings.index(choice.text))
+                tables["choice_targets"].append(index_by_id[choice.leads_to_id])
+            tables["node_choices"].append(choice_index)
+        tables["node_choice_ends"].append(len(tables["node_choices"]))
+        tables["node_flags"].append(_IS_ENDING if node.is_ending else 0)
+
+        graphics = node.graphics
+        if graphics is None:
+            tables["node_graphics"].append(_NO_GRAPHICS)
+            continue
+        key = (graphics.animation_id, tuple(graphics.image_ids) if graphics.image_ids is not None else None,
+               tuple(graphics.offset), graphics.screen_shake, bool(graphics.instant_text))
+        graphics_index = graphics_index_by_key.get(key)
+        if graphics_index is None:
+            graphics_index = graphics_index_by_key[key] = len(graphics_index_by_key)
+            tables["graphics_animations"].append(strings.index(graphics.animation_id))
+            # Graphics without image IDs are told apart from those with an empty list by the flag below
+            tables["image_ids"].extend(strings.index(image_id) for image_id in graphics.image_ids or [])
+            tables["graphics_image_ends"].append(len(tables["image_ids"]))
+            tables["graphics_offset_xs"].append(graphics.offset[0])
+            tables["graphics_offset_ys"].append(graphics.offset[1])
+            tables["graphics_screen_shakes"].append(graphics.screen_shake or 0)
+            tables["graphics_flags"].append((_INSTANT_TEXT if graphics.instant_text else 0)
+                                            | (_HAS_SCREEN_SHAKE if graphics.screen_shake is not None else 0)
+                                            | (_HAS_IMAGE_IDS if graphics.image_ids is not None else 0))
+        tables["node_graphics"].append(graphics_index)
+    tables["nodes_by_id"] = array("I", sorted(range(len(nodes)), key=lambda index: nodes[index].node_id))
+    title = strings.index(dialog_graph.title)
+    background = strings.index(dialog_graph.background_image_id)
+    string_block = strings.block()
+
+    counts = _Counts(
+        num_strings=len(strings), num_string_bytes=len(string_block), num_nodes=len(nodes),
+        num_node_choices=len(tables["node_choices"]), num_choices=len(choice_index_by_key),
+        num_graphics=len(graphics_index_by_key), num_image_ids=len(tables["image_ids"]),
+        title=title, background=background, root=dialog_graph.root_node_index())
+    payload = b"".join([_COUNTS.pack(*counts)] + [_to_little_endian(tables[name]) for name, _, _ in _TABLES]
+                       + [string_block])
+    header = _HEADER.pack(COMPILED_DIALOG_MAGIC, COMPILED_DIALOG_VERSION, 0, len(payload), zlib.crc32(payload))
+    return header + payload
+
+
+def save_compiled_dialog(dialog_graph: DialogGraph, file_path: str):
+    with open(file_path, "wb") as f:
+        f.write(compile_dialog(dialog_graph))
+
+
+def load_compiled_dialog(file_path: str) -> DialogGraph:
+    with open(file_path, "rb") as f:
+        return parse_compiled_dialog(f.read())
+
+
+def open_compiled_dialog(file_path: str, max_cached_nodes: int = 1024,
+    verify_checksum: bool = False) -> LazyDialogGraph:
+    """
+    Open a compiled dialog without loading it
+
+    The file is memory-mapped, and nodes are only decoded when the dialog reaches them (see LazyDialogGraph), so that
+    opening a dialog of millions of nodes is instant and only the parts of the file that are used are read. The
+    checksum is only verified if verify_checksum is set, as that means reading the whole file.
+    """
+    with open(file_path, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    source = _CompiledNodeSource(_compiled_payload(data, verify_checksum))
+    return LazyDialogGraph(source, max_cached_nodes, title=source.title, background_image_id=source.background_image_id)
+
+
+def parse_compiled_dialog(data: bytes) -> DialogGraph:
+    """ Decode a dialog that was encoded with compile_dialog. Raises ValueError if the data is corrupt or from another
+    version of the format. """
+    payload = _compiled_payload(data, verify_checksum=True)
+    # Decoding creates a few objects per node, none of which can form reference cycles, so the garbage collector
+    # (which would otherwise run over and over as they are created) is paused in the meantime
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _decode_compiled_payload(payload)
+    except (IndexError, struct.error, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid compiled dialog ({e})") from e
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+def _compiled_payload(data, verify_checksum: bool) -> memoryview:
+    if len(data) < _HEADER.size:
+        raise ValueError("Invalid compiled dialog (truncated header)")
+    magic, version, _, payload_size, checksum = _HEADER.unpack_from(data)
+    if magic != COMPILED_DIALOG_MAGIC:
+        raise ValueError("Invalid compiled dialog (not a compiled dialog file)")
+    if version != COMPILED_DIALOG_VERSION:
+        raise ValueError(f"Unsupported compiled dialog version: {version} (expected {COMPILED_DIALOG_VERSION})")
+    payload = memoryview(data)[_HEADER.size:]
+    if len(payload) != payload_size or (verify_checksum and zlib.crc32(payload) != checksum):
+        raise ValueError("Invalid compiled dialog (checksum mismatch)")
+    return payload
+
+
+def _compiled_layout(payload: memoryview) -> Tuple[_Counts, Dict[str, Tuple[str, int, int]], int]:
+    """ The counts, the type, byte offset and length of each table, and the byte offset of the strings """
+    if len(payload) < _COUNTS.size:
+        raise ValueError("Invalid compiled dialog (truncated counts)")
+    counts = _Counts._make(_COUNTS.unpack_from(payload))
+    tables = {}
+    position = _COUNTS.size
+    for name, typecode, length_field in _TABLES:
+        length = getattr(counts, length_field)
+        tables[name] = (typecode, position, length)
+        position += length * _TABLE_ITEM_SIZE
+    if position + counts.num_string_bytes != len(payload):
+        raise ValueError("Invalid compiled dialog (tables don't match the payload size)")
+    return counts, tables, position
+
+
+def _decode_compiled_payload(payload: memoryview) -> DialogGraph:
+    counts, layout, strings_start = _compiled_layout(payload)
+    tables = {}
+    for name, (typecode, start, length) in layout.items():
+        table = array(typecode)
+        table.frombytes(payload[start:start + length * _TABLE_ITEM_SIZE])
+        if sys.byteorder == "big":
+            table.byteswap()
+        tables[name] = table
+
+    string_ends = tables["string_ends"]
+    string_block = payload[strings_start:]
+    starts = [0]
+    starts += string_ends
+    text = str(string_block, "utf-8")
+    if len(text) == len(string_block):
+        # All ASCII, so the strings can be cut out of the decoded text at their byte offsets
+        strings = [text[start:end] for start, end in zip(starts, string_ends)]
+    else:
+        string_bytes = bytes(string_block)
+        strings = [str(string_bytes[start:end], "utf-8") for start, end in zip(starts, string_ends)]
+
+    def string(index: int) -> Optional[str]:
+        return strings[index] if index != _NO_STRING else None
+
+    node_ids = tables["node_ids"]
+    choice_targets = tables["choice_targets"]
+    choices = [DialogChoice(strings[text], strings[node_ids[target]])
+               for text, target in zip(tables["choice_texts"], choice_targets)]
+
+    image_ids = tables["image_ids"]
+    image_starts = [0]
+    image_starts += tables["graphics_image_ends"]
+    graphics_list = [
+        _compiled_graphics(string(animation), [strings[i] for i in image_ids[image_start:image_end]], offset_x,
+                           offset_y, screen_shake, flags)
+        for animation, image_start, image_end, offset_x, offset_y, screen_shake, flags
+        in zip(tables["graphics_animations"], image_starts, tables["graphics_image_ends"],
+               tables["graphics_offset_xs"], tables["graphics_offset_ys"], tables["graphics_screen_shakes"],
+               tables["graphics_flags"])
+    ]
+
+    # Each node's choices are a slice of these
+    node_choices = tables["node_choices"]
+    node_choice_list = [choices[c] for c in node_choices]
+    choice_offsets = array("l", [0])
+    choice_offsets.extend(tables["node_choice_ends"].tolist())
+    nodes = [
+        DialogNode(strings[node_id], strings[text], node_choice_list[start:end],
+                   graphics_list[graphics_index] if graphics_index != _NO_GRAPHICS else None,
+                   strings[sound] if sound != _NO_STRING else None, bool(flags & _IS_ENDING))
+        for node_id, text, start, end, graphics_index, sound, flags
+        in zip(node_ids, tables["node_texts"], choice_offsets, tables["node_choice_ends"], tables["node_graphics"],
+               tables["node_sounds"], tables["node_flags"])
+    ]
+    node_choice_targets = array("l", [choice_targets[c] for c in node_choices])
+
+    return DialogGraph.from_resolved_choices(counts.root, nodes, choice_offsets, node_choice_targets,
+                                             title=string(counts.title), background_image_id=string(counts.background))
+
+
+def _compiled_graphics(animation_id: Optional[str], image_ids: List[str], offset_x: int, offset_y: int,
+    screen_shake: int, flags: int) -> NodeGraphics:
+    return NodeGraphics(
+        animation_id=animation_id,
+        image_ids=image_ids if flags & _HAS_IMAGE_IDS else None,
+        offset=(offset_x, offset_y),
+        screen_shake=Millis(screen_shake) if flags & _HAS_SCREEN_SHAKE else None,
+        instant_text=bool(flags & _INSTANT_TEXT))
+
+
+class _CompiledNodeSource(NodeSource):
+    """ Decodes single nodes of a compiled dialog, reading only the table entries that they are made of """
+
+    _STRUCTS = {"I": struct.Struct("<I"), "i": struct.Struct("<i")}
+
+    def __init__(self, payload: memoryview):
+        counts, layout, self._strings_start = _compiled_layout(payload)
+        self._payload = payload
+        self._counts = counts
+        self._tables = {name: (self._STRUCTS[typecode], start, length)
+                        for name, (typecode, start, length) in layout.items()}
+        if not 0 <= counts.root < counts.num_nodes:
+            raise ValueError(f"Invalid compiled dialog (no node found with index: {counts.root})")
+        self.title = self._string(counts.title)
+        self.background_image_id = self._string(counts.background)
+
+    def __len__(self) -> int:
+        return self._counts.num_nodes
+
+    def root_node_index(self) -> int:
+        return self._counts.root
+
+    def node(self, index: int) -> DialogNode:
+        choices = [self._choice(self._entry("node_choices", i)) for i in self._choice_range(index)]
+        graphics_index = self._entry("node_graphics", index)
+        return DialogNode(
+            node_id=self._string(self._entry("node_ids", index)),
+            text=self._string(self._entry("node_texts", index)),
+            choices=choices,
+            graphics=self._graphics(graphics_index) if graphics_index != _NO_GRAPHICS else None,
+            sound_id=self._string(self._entry("node_sounds", index)),
+            is_ending=bool(self._entry("node_flags", index) & _IS_ENDING))
+
+    def choice_targets(self, index: int) -> List[int]:
+        return [self._entry("choice_targets", self._entry("node_choices", i)) for i in self._choice_range(index)]
+
+    def index_of(self, node_id: str) -> int:
+        # Binary search in the nodes ordered by ID
+        low = 0
+        high = self._counts.num_nodes
+        while low < high:
+            middle = (low + high) // 2
+            index = self._entry("nodes_by_id", middle)
+            middle_id = self._string(self._entry("node_ids", index))
+            if middle_id == node_id:
+                return index
+            if middle_id < node_id:
+                low = middle + 1
+            else:
+                high = middle
+        raise KeyError(node_id)
+
+    def _choice_range(self, index: int) -> range:
+        start = self._entry("node_choice_ends", index - 1) if index > 0 else 0
+        return range(start, self._entry("node_choice_ends", index))
+
+    def _choice(self, choice_index: int) -> DialogChoice:
+        target_index = self._entry("choice_targets", choice_index)
+        return DialogChoice(self._string(self._entry("choice_texts", choice_index)),
+                            self._string(self._entry("node_ids", target_index)))
+
+    def _graphics(self, graphics_index: int) -> NodeGraphics:
+        image_start = self._entry("graphics_image_ends", graphics_index - 1) if graphics_index > 0 else 0
+        image_end = self._entry("graphics_image_ends", graphics_index)
+        return _compiled_graphics(
+            self._string(self._entry("graphics_animations", graphics_index)),
+            [self._string(self._entry("image_ids", i)) for i in range(image_start, image_end)],
+            self._entry("graphics_offset_xs", graphics_index),
+            self._entry("graphics_offset_ys", graphics_index),
+            self._entry("graphics_screen_shakes", graphics_index),
+            self._entry("graphics_flags", graphics_index))
+
+    def _string(self, index: int) -> Optional[str]:
+        if index == _NO_STRING:
+            return None
+        start = self._entry("string_ends", index - 1) if index > 0 else 0
+        end = self._entry("string_ends", index)
+        return str(self._payload[self._strings_start + start:self._strings_start + end], "utf-8")
+
+    def _entry(self, table: str, index: int) -> int:
+        item_struct, start, length = self._tables[table]
+        if not 0 <= index < length:
+            raise IndexError(f"Invalid compiled dialog (index {index} out of range for {table})")
+        return item_struct.unpack_from(self._payload, start + index * _TABLE_ITEM_SIZE)[0]
+
+
+class _StringTable:
+    """ Assigns each distinct string an index, in order of first use """
+
+    def __init__(self):
+        self._index_by_string: Dict[str, int] = {}
+        self._encoded: List[bytes] = []
+        self._num_bytes = 0
+        self.ends = array("I")
+
+    def index(self, string: Optional[str]) -> int:
+        if string is None:
+            return _NO_STRING
+        index = self._index_by_string.get(string)
+        if index is None:
+            index = self._index_by_string[string] = len(self._encoded)
+            encoded = string.encode("utf-8")
+            self._encoded.append(encoded)
+            self._num_bytes += len(encoded)
+            self.ends.append(self._num_bytes)
+        return index
+
+    def block(self) -> bytes:
+        return b"".join(self._encoded)
+
+    def __len__(self):
+        return len(self._encoded)
+
+
+def _to_little_endian(table: array) -> bytes:
+    if sys.byteorder == "big":
+        table = array(table.typecode, table)
+        table.byteswap()
+    return table.tobytes()
@@ -1,11 +1,15 @@
-from typing import Dict, List
+from typing import Mapping, Sequence, Optional, List
 
 from pygame import Surface
+from pygame.rect import Rect
 from pygame.font import Font
 
+from assets import AssetLoader
 from constants import Millis, Vec2
-from graph import DialogGraph
+from graph import DialogGraph, DialogNode, LazyDialogGraph
+from profiling import FrameProfiler, NULL_PROFILER
 from sound import SoundPlayer
+from timing import Scheduler
 from ui import Ui
 
 
@@ -15,17 +19,34 @@ class DialogComponent:
 
     Display this component to the screen by blitting its publicly accessible surface. Make sure to call redraw() so that
     the graphics are updated. Call update(ms) to have it respond to time passing.
+
+    If an asset loader with lazily registered assets is given, the assets of all nodes within prefetch_depth choices
+    of the current node are loaded in the background, and those further away are evicted.
+
+    Call set_profiler() with a FrameProfiler to record where the time of each frame goes.
     """
 
-    def __init__(self, surface: Surface, dialog_font: Font, choice_font: Font, images: Dict[str, Surface],
-        animations: Dict[str, List[Surface]], sound_player: SoundPlayer, dialog_graph: DialogGraph, picture_size: Vec2,
-        select_blip_sound_id: str):
-        self._validate_inputs(dialog_graph, images, sound_player)
+    def __init__(self, surface: Surface, dialog_font: Font, choice_font: Font, images: Mapping[str, Surface],
+        animations: Mapping[str, Sequence[Surface]], sound_player: SoundPlayer, dialog_graph: DialogGraph, picture_size: Vec2,
+        select_blip_sound_id: str, asset_loader: Optional[AssetLoader] = None, prefetch_depth: int = 2):
+        # The nodes of a lazy graph are only decoded as they are reached, so they are checked then rather than up front
+        self._validate_reached_nodes = isinstance(dialog_graph, LazyDialogGraph)
+        self._validate_inputs(dialog_graph, images, sound_player, validate_nodes=not self._validate_reached_nodes)
         self.surface = surface
+        self._images = images
         self._sound_player = sound_player
         self._dialog_graph = dialog_graph
+        self._asset_loader = asset_loader
+        self._prefetch_depth = prefetch_depth
+        self._profiler = NULL_PROFILER
+        # Drives everything that happens over time in the dialog: text appearing, animations and text blips
+        self._scheduler = Scheduler()
+        self._sound_player.use_scheduler(self._scheduler)
 
         self._current_dialog_node = self._dialog_graph.current_node()
+        if self._validate_reached_nodes:
+            self._validate_node(self._current_dialog_node, images, sound_player)
+        self._prefetch_neighborhood()
 
         background_id = self._dialog_graph.background_image_id
         background = images[background_id] if background_id else None
@@ -39,29 +60,51 @@ class DialogComponent:
             animations=animations,
             sound_player=sound_player,
             background=background,
-            select_blip_sound_id=select_blip_sound_id
+            select_blip_sound_id=select_blip_sound_id,
+            scheduler=self._scheduler,
+            background_id=background_id
         )
         self._play_dialog_sound()
 
-    @staticmethod
-    def _validate_inputs(dialog_graph: DialogGraph, images: Dict[str, Surface], sound_player: SoundPlayer):
-        for node in dialog_graph.nodes():
-            if node.graphics.image_ids:
-                for image_id in node.graphics.image_ids:
-                    if image_id not in images:
-                        raise ValueError(
-                            f"Invalid config! Graph node '{node.node_id}' refers to missing image: '{image_id}'")
-            if node.sound_id:
-                if not sound_player.has_sound(node.sound_id):
-                    raise ValueError(
-                        f"Invalid config! Graph node '{node.node_id}' refers to missing sound: '{node.sound_id}")
+    @classmethod
+    def _validate_inputs(cls, dialog_graph: DialogGraph, images: Mapping[str, Surface], sound_player: SoundPlayer,
+        validate_nodes: bool = True):
+        if validate_nodes:
+            for node in dialog_graph.nodes():
+                cls._validate_node(node, images, sound_player)
         background_id = dialog_graph.background_image_id
         if background_id and background_id not in images:
             raise ValueError(f"Invalid config! Graph refers to missing background image: '{background_id}'")
 
+    @staticmethod
+    def _validate_node(node: DialogNode, images: Mapping[str, Surface], sound_player: SoundPlayer):
+        if node.graphics.image_ids:
+            for image_id in node.graphics.image_ids:
+                if image_id not in images:
+                    raise ValueError(
+                        f"Invalid config! Graph node '{node.node_id}' refers to missing image: '{image_id}'")
+        if node.sound_id:
+            if not sound_player.has_sound(node.sound_id):
+                raise ValueError(
+                    f"Invalid config! Graph node '{node.node_id}' refers to missing sound: '{node.sound_id}")
+
+    def set_profiler(self, profiler: Optional[FrameProfiler]):
+        """ Start recording timings with the given profiler, or stop recording if it's None. A frame is counted from
+        one call to update() to the next. """
+        self._profiler = profiler or NULL_PROFILER
+        self._ui.set_profiler(self._profiler)
+
     def update(self, elapsed_time: Millis):
-        self._ui.update(elapsed_time)
-        self._sound_player.update(elapsed_time)
+        self._profiler.start_frame()
+        with self._profiler.section("update"):
+            self._scheduler.update(elapsed_time)
+            self._ui.update(elapsed_time)
+
+    def time_until_update(self) -> Optional[Millis]:
+        """ How long until the next call to update() will change anything, or None if nothing will change until the
+        user interacts with the dialog. Can be used to sleep between frames rather than redrawing continuously. """
+        times = [self._scheduler.time_until_next(), self._ui.time_until_update()]
+        return min((t for t in times if t is not None), default=None)
 
     def skip_text(self):
         self._ui.skip_text()
@@ -85,10 +128,30 @@ class DialogComponent:
             self._commit_choice(chosen_index)
 
     def _commit_choice(self, chosen_index: int):
-        self._dialog_graph.make_choice(chosen_index)
-        self._current_dialog_node = self._dialog_graph.current_node()
-        self._play_dialog_sound()
-        self._ui.set_dialog(self._current_dialog_node)
+        with self._profiler.section("node_transition"):
+            self._dialog_graph.make_choice(chosen_index)
+            self._current_dialog_node = self._dialog_graph.current_node()
+            if self._validate_reached_nodes:
+                self._validate_node(self._current_dialog_node, self._images, self._sound_player)
+            self._prefetch_neighborhood()
+            self._play_dialog_sound()
+            self._ui.set_dialog(self._current_dialog_node)
+
+    def _prefetch_neighborhood(self):
+        if not self._asset_loader:
+            return
+        image_ids = []
+        animation_ids = []
+        sound_ids = []
+        for node in self._dialog_graph.neighborhood(self._current_dialog_node.node_id, self._prefetch_depth):
+            if node.graphics.image_ids:
+                image_ids += node.graphics.image_ids
+            if node.graphics.animation_id:
+                animation_ids.append(node.graphics.animation_id)
+            if node.sound_id:
+                sound_ids.append(node.sound_id)
+        self._asset_loader.evict_all_except(image_ids, animation_ids, sound_ids)
+        self._asset_loader.prefetch(image_ids, animation_ids, sound_ids)
 
     def current_node_id(self) -> str:
         return self._current_dialog_node.node_id
@@ -98,5 +161,7 @@ class DialogComponent:
         if self._current_dialog_node.sound_id:
             self._sound_player.play(self._current_dialog_node.sound_id)
 
-    def redraw(self):
-        self._ui.redraw()
+    def redraw(self) -> List[Rect]:
+        """ Redraw the parts of the surface that have changed, and return those areas (in surface coordinates) """
+        with self._profiler.section("redraw"):
+            return self._ui.redraw()
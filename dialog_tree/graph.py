@@ -1,77 +1,306 @@
-from typing import List, Optional, Dict
+import sys
+from abc import ABC, abstractmethod
+from array import array
+from typing import List, Optional, Dict, Iterator, Sequence, Tuple, Any
 
+from cache import LruCache
 from constants import Vec2, Millis
 
+# Nodes, choices and graphics use __slots__, and the IDs and choice texts that they hold are interned, as a generated
+# dialog can have hundreds of thousands of them, repeating the same few strings ("Next", image IDs, ...). Parsers share
+# one NodeGraphics/DialogChoice between all nodes with the same configuration, so these must not be modified once
+# created (which is why image_ids is a tuple).
+
 
 class DialogChoice:
+    __slots__ = ("text", "leads_to_id")
+
     def __init__(self, text: str, leads_to_id: str):
-        self.text = text
-        self.leads_to_id = leads_to_id
+        self.text = _intern(text)
+        self.leads_to_id = _intern(leads_to_id)
 
 
 class NodeGraphics:
+    __slots__ = ("animation_id", "image_ids", "offset", "screen_shake", "instant_text")
 
-    def __init__(self, animation_id: Optional[str] = None, image_ids: Optional[List[str]] = None,
+    def __init__(self, animation_id: Optional[str] = None, image_ids: Optional[Sequence[str]] = None,
         offset: Optional[Vec2] = None, screen_shake: Optional[Millis] = None,
         instant_text: bool = False):
-        self.animation_id = animation_id
-        self.image_ids = image_ids
-        self.offset: Vec2 = offset or (0, 0)
+        self.animation_id = _intern(animation_id)
+        self.image_ids: Optional[Tuple[str, ...]] = tuple(_intern(i) for i in image_ids) \
+            if image_ids is not None else None
+        self.offset: Vec2 = tuple(offset) if offset else (0, 0)
         self.screen_shake = screen_shake
         self.instant_text = instant_text
 
 
 class DialogNode:
+    """ A node without choices should be marked as an ending, unless it's a mistake that the dialog ends there """
+    __slots__ = ("node_id", "text", "choices", "graphics", "sound_id", "is_ending")
+
     def __init__(self, node_id: str, text: str, choices: List[DialogChoice], graphics: Optional[NodeGraphics] = None,
-        sound_id: Optional[str] = None):
+        sound_id: Optional[str] = None, is_ending: bool = False):
         if not node_id:
             raise ValueError("Invalid node config (missing ID)")
-        self.node_id = node_id
+        self.node_id = _intern(node_id)
         self.text = text
         self.choices = choices
         self.graphics = graphics
-        self.sound_id = sound_id
+        self.sound_id = _intern(sound_id)
+        self.is_ending = is_ending
 
 
 class DialogGraph:
     """
     A graph representation of a dialog
 
-    This class is very central. One instance represents a full dialog. It keeps track of where you are as you progress
-    through a dialog.
+    This class is very central. One instance represents a full dialog. Its structure is never modified once it has been
+    created, so a single graph can be shared by any number of DialogSessions (each keeping track of where one player is
+    in the dialog), which may read from it concurrently from different threads. For the simple case of a single player,
+    current_node() and make_choice() progress through the dialog with a session of the graph's own.
     """
     def __init__(self, root_node_id: str, nodes: List[DialogNode], title: Optional[str] = None,
         background_image_id: Optional[str] = None):
-        self.title = title
-        self.background_image_id = background_image_id
-        self._nodes_by_id: Dict[str, DialogNode] = {}
-        self._active_node_id = root_node_id
+        # Nodes are referred to by their index in this list. The choices of node i lead to the nodes
+        # choice_targets[choice_offsets[i]:choice_offsets[i + 1]].
+        self._nodes: List[DialogNode] = []
+        self._index_by_id: Dict[str, int] = {}
         for node in nodes:
             node_id = node.node_id
-            if node_id in self._nodes_by_id:
+            if node_id in self._index_by_id:
                 raise ValueError(f"Duplicate node ID found: {node_id}")
-            self._nodes_by_id[node_id] = node
+            self._index_by_id[node_id] = len(self._nodes)
+            self._nodes.append(node)
 
+        self._choice_offsets = array("l", [0])
+        self._choice_targets = array("l")
         for node in nodes:
             for choice in node.choices:
-                if choice.leads_to_id not in self._nodes_by_id:
+                target_index = self._index_by_id.get(choice.leads_to_id)
+                if target_index is None:
                     raise ValueError(
                         f"Dialog choice leading to missing node: {choice.leads_to_id}")
+                self._choice_targets.append(target_index)
+            self._choice_offsets.append(len(self._choice_targets))
 
-        if root_node_id not in self._nodes_by_id:
+        if root_node_id not in self._index_by_id:
             raise ValueError(f"No node found with ID: {root_node_id}")
+        self._set_up(self._index_by_id[root_node_id], title, background_image_id)
+
+    @classmethod
+    def from_resolved_choices(cls, root_node_index: int, nodes: List[DialogNode], choice_offsets: array,
+        choice_targets: array, title: Optional[str] = None,
+        background_image_id: Optional[str] = None) -> "DialogGraph":
+        """ Create a graph whose choices have already been resolved to node indices (see __init__ for the layout),
+        like those of a compiled dialog. This skips looking up every choice's target by ID. """
+        if len(choice_offsets) != len(nodes) + 1 or choice_offsets[-1] != len(choice_targets):
+            raise ValueError("Choice offsets don't match the nodes")
+        if choice_targets and not 0 <= min(choice_targets) <= max(choice_targets) < len(nodes):
+            raise ValueError("Dialog choice leading to missing node")
+        if not 0 <= root_node_index < len(nodes):
+            raise ValueError(f"No node found with index: {root_node_index}")
+        graph = cls.__new__(cls)
+        graph._nodes = list(nodes)
+        graph._index_by_id = {node.node_id: index for index, node in enumerate(nodes)}
+        if len(graph._index_by_id) != len(nodes):
+            raise ValueError("Duplicate node ID found")
+        graph._choice_offsets = array("l", choice_offsets)
+        graph._choice_targets = array("l", choice_targets)
+        graph._set_up(root_node_index, title, background_image_id)
+        return graph
+
+    def _set_up(self, root_node_index: int, title: Optional[str], background_image_id: Optional[str]):
+        """ Set the fields that every kind of graph has, once its nodes are in place """
+        self.title = title
+        self.background_image_id = background_image_id
+        self._root_node_index = root_node_index
+        self._session = DialogSession(self)
 
     def current_node(self) -> DialogNode:
-        return self._nodes_by_id[self._active_node_id]
+        return self._session.current_node()
 
     def make_choice(self, choice_index: int):
-        node = self._nodes_by_id[self._active_node_id]
-        self._active_node_id = node.choices[choice_index].leads_to_id
+        self._session.make_choice(choice_index)
+
+    def new_session(self, max_history: int = 32) -> "DialogSession":
+        """ Start a separate traversal of this graph, at the root node """
+        return DialogSession(self, max_history)
 
-    def nodes(self) -> List[DialogNode]:
-        """ Return the nodes of this graph as a list. Should not needed for normal usage,
+    def neighborhood(self, node_id: str, max_choices: int) -> List[DialogNode]:
+        """ Return the nodes that can be reached from the given node by making at most max_choices choices, ordered
+        by how many choices it takes to get there (starting with the given node itself). """
+        node_index = self._index_of(node_id)
+        visited = {node_index}
+        reached = [node_index]
+        frontier = reached
+        for _ in range(max_choices):
+            next_frontier = []
+            for index in frontier:
+                for target_index in self._choice_targets_of(index):
+                    if target_index not in visited:
+                        visited.add(target_index)
+                        next_frontier.append(target_index)
+            reached += next_frontier
+            frontier = next_frontier
+        return [self._node_at(index) for index in reached]
+
+    def nodes(self) -> Iterator[DialogNode]:
+        """ Iterate over the nodes of this graph. Should not needed for normal usage,
          but is used when visualizing the graph with graphviz. """
-        return list(self._nodes_by_id.values())
+        return iter(self._nodes)
+
+    def adjacency(self) -> Tuple[array, array]:
+        """ The choices of all nodes as (choice_offsets, choice_targets): the choices of the i:th node (in the order of
+        nodes()) lead to the nodes at the indices choice_targets[choice_offsets[i]:choice_offsets[i + 1]]. Meant for
+        analyzing the whole graph; the arrays must not be modified. """
+        return self._choice_offsets, self._choice_targets
+
+    def root_node_index(self) -> int:
+        """ The index (in the order of nodes()) of the node that the dialog starts at """
+        return self._root_node_index
+
+    def _node_at(self, index: int) -> DialogNode:
+        return self._nodes[index]
+
+    def _index_of(self, node_id: str) -> int:
+        return self._index_by_id[node_id]
+
+    def _choice_targets_of(self, index: int) -> Sequence[int]:
+        return self._choice_targets[self._choice_offsets[index]:self._choice_offsets[index + 1]]
 
     def __repr__(self):
         return str(self.__dict__)
+
+
+def find_graph_errors(root_node_id: Optional[str], nodes: List[DialogNode]) -> List[str]:
+    """ Everything that would make DialogGraph(root_node_id, nodes) fail, rather than just the first problem """
+    errors = []
+    node_ids = set()
+    for node in nodes:
+        if node.node_id in node_ids:
+            errors.append(f"Duplicate node ID found: {node.node_id}")
+        node_ids.add(node.node_id)
+    for node in nodes:
+        for choice in node.choices:
+            if choice.leads_to_id not in node_ids:
+                errors.append(
+                    f"Graph node '{node.node_id}': Dialog choice leading to missing node: {choice.leads_to_id}")
+    if root_node_id not in node_ids:
+        errors.append(f"No node found with ID: {root_node_id}")
+    return errors
+
+
+class NodeSource(ABC):
+    """ Where a LazyDialogGraph gets its nodes from. Nodes are referred to by their index, from 0 to len(source) - 1.
+    """
+
+    @abstractmethod
+    def __len__(self) -> int:
+        pass
+
+    @abstractmethod
+    def root_node_index(self) -> int:
+        pass
+
+    @abstractmethod
+    def node(self, index: int) -> DialogNode:
+        """ Decode the node at the given index """
+
+    @abstractmethod
+    def choice_targets(self, index: int) -> Sequence[int]:
+        """ The indices of the nodes that the choices of the given node lead to """
+
+    @abstractmethod
+    def index_of(self, node_id: str) -> int:
+        """ Raises KeyError if there's no node with the given ID """
+
+
+class LazyDialogGraph(DialogGraph):
+    """
+    A dialog graph that only decodes nodes once they are needed
+
+    Meant for huge dialogs (like a compiled dialog opened with config_file.open_compiled_dialog) of which a session
+    only visits a small part. Nodes are decoded by a NodeSource as current_node() or neighborhood() reaches them, and
+    the most recently used ones are kept in a bounded cache. Iterating over nodes() decodes every node, but doesn't
+    hold on to them.
+    """
+
+    def __init__(self, source: NodeSource, max_cached_nodes: int = 1024, title: Optional[str] = None,
+        background_image_id: Optional[str] = None):
+        self._source = source
+        self._node_cache: LruCache[int, DialogNode] = LruCache(max_entries=max_cached_nodes)
+        self._set_up(source.root_node_index(), title, background_image_id)
+
+    def nodes(self) -> Iterator[DialogNode]:
+        source = self._source
+        return (source.node(index) for index in range(len(source)))
+
+    def adjacency(self) -> Tuple[array, array]:
+        choice_offsets = array("l", [0])
+        choice_targets = array("l")
+        for index in range(len(self._source)):
+            choice_targets.extend(self._source.choice_targets(index))
+            choice_offsets.append(len(choice_targets))
+        return choice_offsets, choice_targets
+
+    def _node_at(self, index: int) -> DialogNode:
+        return self._node_cache.get_or_create(index, lambda: self._source.node(index))
+
+    def _index_of(self, node_id: str) -> int:
+        return self._source.index_of(node_id)
+
+    def _choice_targets_of(self, index: int) -> Sequence[int]:
+        return self._source.choice_targets(index)
+
+
+class DialogSession:
+    """
+    One traversal of a dialog graph: the node that it's at, and the nodes that it went through to get there
+
+    A session only refers to nodes by their index in the graph, and remembers at most max_history of the nodes it went
+    through, so that it takes a few hundred bytes no matter how large the graph is or how long the session goes on.
+    """
+    __slots__ = ("_graph", "_node_index", "_history", "_max_history")
+
+    def __init__(self, graph: DialogGraph, max_history: int = 32):
+        self._graph = graph
+        self._node_index = graph.root_node_index()
+        self._history = array("l")
+        self._max_history = max_history
+
+    @property
+    def graph(self) -> DialogGraph:
+        return self._graph
+
+    def current_node(self) -> DialogNode:
+        return self._graph._node_at(self._node_index)
+
+    def make_choice(self, choice_index: int):
+        target_index = self._graph._choice_targets_of(self._node_index)[choice_index]
+        if self._max_history > 0:
+            if len(self._history) >= self._max_history:
+                del self._history[0]
+            self._history.append(self._node_index)
+        self._node_index = target_index
+
+    def can_go_back(self) -> bool:
+        return len(self._history) > 0
+
+    def go_back(self):
+        """ Return to the node that the last choice was made at """
+        if not self._history:
+            raise ValueError("There's no earlier node to go back to")
+        self._node_index = self._history.pop()
+
+    def history(self) -> List[str]:
+        """ The IDs of the remembered nodes that the session went through, oldest first """
+        return [self._graph._node_at(index).node_id for index in self._history]
+
+    def restart(self):
+        self._node_index = self._graph.root_node_index()
+        del self._history[:]
+
+
+def _intern(value: Any) -> Any:
+    # Only strings can be interned. Other values (like IDs that a JSON file gives as numbers) are kept as they are.
+    return sys.intern(value) if type(value) is str else value
@@ -0,0 +1,145 @@
+import heapq
+import json
+import threading
+import time
+from collections import deque, defaultdict
+from contextlib import contextmanager
+from typing import Deque, Dict, List, Tuple, ContextManager, Iterator
+
+# How many of the slowest frames are kept, with a breakdown of where their time went
+NUM_WORST_FRAMES = 10
+
+
+class NullProfiler:
+    """ Used when profiling is turned off. Its sections do nothing, so that instrumented code costs next to nothing. """
+
+    def start_frame(self):
+        pass
+
+    def section(self, name: str) -> ContextManager:
+        return _NULL_SECTION
+
+    def percentiles(self, percentiles: Tuple[int, ...] = (50, 90, 99)) -> Dict[str, Dict[str, float]]:
+        return {}
+
+    def worst_frames(self) -> List[Tuple[int, float, Dict[str, float]]]:
+        return []
+
+    def chrome_trace(self) -> Dict:
+        return {"traceEvents": [], "displayTimeUnit": "ms"}
+
+
+class FrameProfiler(NullProfiler):
+    """
+    Records how long each part of each frame takes
+
+    Wrap code in section(name) to time it, and call start_frame() at the start of every frame. Sections may be nested
+    (text layout within an update, for example), and a frame's time is that of its outermost sections. Timings are
+    summarized as percentiles per section along with the slowest frames, and can be exported as Chrome trace events
+    (to be opened in chrome://tracing or Perfetto).
+
+    At most max_samples timings per section, and max_events trace events, are kept (the oldest ones are dropped).
+    """
+
+    def __init__(self, max_samples: int = 10_000, max_events: int = 100_000):
+        self._origin = time.perf_counter()
+        self._durations: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=max_samples))
+        # name, start time and duration (seconds since origin), frame index, thread
+        self._events: Deque[Tuple[str, float, float, int, int]] = deque(maxlen=max_events)
+        # (frame time, frame index, time per section), as a min-heap of the slowest frames
+        self._worst_frames: List[Tuple[float, int, Dict[str, float]]] = []
+        self._frame_index = -1
+        self._frame_time = 0.0
+        self._frame_sections: Dict[str, float] = {}
+        self._depth = 0
+
+    def start_frame(self):
+        if self._frame_sections:
+            self._finish_frame()
+        self._frame_index += 1
+        self._frame_time = 0.0
+        self._frame_sections = {}
+
+    @contextmanager
+    def section(self, name: str) -> Iterator[None]:
+        self._depth += 1
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start_time
+            self._depth -= 1
+            self._durations[name].append(duration)
+            self._events.append((name, start_time - self._origin, duration, self._frame_index, threading.get_ident()))
+            self._frame_sections[name] = self._frame_sections.get(name, 0.0) + duration
+            if self._depth == 0:
+                self._frame_time += duration
+
+    def percentiles(self, percentiles: Tuple[int, ...] = (50, 90, 99)) -> Dict[str, Dict[str, float]]:
+        """ For each section (and for whole frames, as "frame"): the given percentiles, the max and the number of
+        samples, with times in milliseconds. The frame that is still in progress isn't counted as a frame yet. """
+        stats = {}
+        for name, durations in self._durations.items():
+            ordered = sorted(durations)
+            stats[name] = {f"p{p}": _percentile(ordered, p) * 1000 for p in percentiles}
+            stats[name]["max"] = ordered[-1] * 1000
+            stats[name]["count"] = len(ordered)
+        return stats
+
+    def worst_frames(self) -> List[Tuple[int, float, Dict[str, float]]]:
+        """ The slowest finished frames, slowest first, as (frame index, frame time, time per section), in milliseconds
+        """
+        return [(index, frame_time * 1000, {name: t * 1000 for name, t in sections.items()})
+                for frame_time, index, sections in sorted(self._worst_frames, reverse=True)]
+
+    def report(self) -> str:
+        lines = [f"{'section':<20}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}{'count':>8}   (ms)"]
+        for name, stats in sorted(self.percentiles().items()):
+            lines.append(f"{name:<20}{stats['p50']:>10.3f}{stats['p90']:>10.3f}{stats['p99']:>10.3f}"
+                         f"{stats['max']:>10.3f}{stats['count']:>8}")
+        lines.append("Slowest frames:")
+        for index, frame_time, sections in self.worst_frames():
+            breakdown = ", ".join(f"{name} {t:.2f}" for name, t in sorted(sections.items(), key=lambda s: -s[1]))
+            lines.append(f"  #{index}: {frame_time:.2f} ms ({breakdown})")
+        return "\n".join(lines)
+
+    def chrome_trace(self) -> Dict:
+        """ The recorded sections in Chrome's trace event format """
+        return {
+            "traceEvents": [
+                {"name": name, "ph": "X", "ts": start * 1_000_000, "dur": duration * 1_000_000, "pid": 1,
+                 "tid": thread, "args": {"frame": frame_index}}
+                for name, start, duration, frame_index, thread in self._events
+            ],
+            "displayTimeUnit": "ms",
+        }
+
+    def export_chrome_trace(self, filepath: str):
+        with open(filepath, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+    def _finish_frame(self):
+        self._durations["frame"].append(self._frame_time)
+        entry = (self._frame_time, self._frame_index, self._frame_sections)
+        if len(self._worst_frames) < NUM_WORST_FRAMES:
+            heapq.heappush(self._worst_frames, entry)
+        elif entry > self._worst_frames[0]:
+            heapq.heapreplace(self._worst_frames, entry)
+
+
+class _NullSection:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_NULL_SECTION = _NullSection()
+NULL_PROFILER = NullProfiler()
+
+
+def _percentile(ordered: List[float], percentile: int) -> float:
+    """ Nearest-rank percentile of the sorted values """
+    index = max(0, min(len(ordered) - 1, -(-percentile * len(ordered) // 100) - 1))
+    return ordered[index]
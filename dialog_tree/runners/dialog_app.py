@@ -1,17 +1,20 @@
 import argparse
 import os
 from pathlib import Path
-from typing import Dict, Optional, List, Tuple
+from typing import Optional, List, Callable, Mapping, Sequence
 
 import pygame
+from pygame.event import Event
 from pygame.font import Font
-from pygame.mixer import Sound
+from pygame.rect import Rect
 from pygame.surface import Surface
 
+from assets import AssetLoader, FrameBudget, SurfaceDiskCache
 from config_file import load_dialog_from_file
-from constants import BLACK, Millis
+from constants import BLACK, WHITE, Millis
 from dialog_component import DialogComponent
 from graph import DialogGraph
+from profiling import FrameProfiler
 from sound import SoundPlayer
 
 FONT_DIR = "resources/fonts"
@@ -23,10 +26,13 @@ PICTURE_SIZE = (SCREEN_SIZE[0] - UI_MARGIN * 2, 380)
 
 
 class App:
-    def __init__(self, screen: Surface, dialog_font: Font, choice_font: Font, images: Dict[str, Surface],
-        animations: Dict[str, List[Surface]], sound_player: SoundPlayer, dialog_graph: DialogGraph,
-        select_blip_sound_id: str):
+    def __init__(self, screen: Surface, dialog_font: Font, choice_font: Font, images: Mapping[str, Surface],
+        animations: Mapping[str, Sequence[Surface]], sound_player: SoundPlayer, dialog_graph: DialogGraph,
+        select_blip_sound_id: str, asset_loader: Optional[AssetLoader] = None, prefetch_depth: Optional[int] = None,
+        event_driven: bool = False, profile_trace_filepath: Optional[str] = None):
         self._screen = screen
+        self._event_driven = event_driven
+        self._asset_loader = asset_loader
         self._dialog_component = DialogComponent(
             surface=Surface((SCREEN_SIZE[0] - UI_MARGIN * 2, SCREEN_SIZE[1] - UI_MARGIN * 2)),
             dialog_font=dialog_font,
@@ -37,20 +43,39 @@ class App:
             dialog_graph=dialog_graph,
             picture_size=PICTURE_SIZE,
             select_blip_sound_id=select_blip_sound_id,
+            asset_loader=asset_loader if prefetch_depth is not None else None,
+            prefetch_depth=prefetch_depth or 0,
         )
         self._clock = pygame.time.Clock()
+        self._needs_full_update = True
+        self._profile_trace_filepath = profile_trace_filepath
+        self._profiler = FrameProfiler() if profile_trace_filepath else None
+        self._dialog_component.set_profiler(self._profiler)
 
     def run(self):
         while True:
-            self._handle_events()
+            # Rendering before handling events, so that the first frame is shown before waiting for any input
             self._update()
             self._render()
+            self._handle_events()
 
     def _handle_events(self):
-        for event in pygame.event.get():
+        events = _wait_for_events(self._dialog_component.time_until_update()) if self._event_driven \
+            else pygame.event.get()
+        for event in events:
             if event.type == pygame.QUIT:
+                if self._asset_loader:
+                    print(f"Asset lookups: {self._asset_loader.hits} hits, {self._asset_loader.misses} misses, "
+                          f"{self._asset_loader.stall_time()}ms stalled")
+                if self._profiler:
+                    print(self._profiler.report())
+                    self._profiler.export_chrome_trace(self._profile_trace_filepath)
+                    print(f"Wrote trace to {self._profile_trace_filepath}")
                 _exit_game()
 
+            if event.type == pygame.VIDEOEXPOSE:
+                self._needs_full_update = True
+
             if event.type == pygame.KEYDOWN:
                 self._dialog_component.skip_text()
                 if event.key in [pygame.K_DOWN, pygame.K_RIGHT]:
@@ -61,17 +86,27 @@ class App:
                     self._dialog_component.commit_selected_choice()
 
     def _update(self):
+        if self._asset_loader:
+            self._asset_loader.raise_first_error()
         elapsed_time = Millis(self._clock.tick())
         self._dialog_component.update(elapsed_time)
 
     def _render(self):
-        self._dialog_component.redraw()
-        self._screen.fill(BLACK)
-        self._screen.blit(self._dialog_component.surface, (UI_MARGIN, UI_MARGIN))
-        pygame.display.update()
-
-
-def start(dialog_filepath: Optional[str] = None, image_dir: Optional[str] = None, sound_dir: Optional[str] = None):
+        dirty_rects = self._dialog_component.redraw()
+        if self._needs_full_update:
+            self._needs_full_update = False
+            self._screen.fill(BLACK)
+            self._screen.blit(self._dialog_component.surface, (UI_MARGIN, UI_MARGIN))
+            pygame.display.update()
+        elif dirty_rects:
+            surface = self._dialog_component.surface
+            self._screen.blits([(surface, rect.move(UI_MARGIN, UI_MARGIN), rect) for rect in dirty_rects])
+            pygame.display.update([rect.move(UI_MARGIN, UI_MARGIN) for rect in dirty_rects])
+
+
+def start(dialog_filepath: Optional[str] = None, image_dir: Optional[str] = None, sound_dir: Optional[str] = None,
+    num_load_workers: Optional[int] = None, frame_budget_mb: Optional[int] = None, cache_dir: Optional[str] = None,
+    prefetch_depth: Optional[int] = None, event_driven: bool = False, profile_trace_filepath: Optional[str] = None):
 
     pygame.init()
     dialog_font = Font(f"{FONT_DIR}/Monaco.dfont", 17)
@@ -79,77 +114,120 @@ def start(dialog_filepath: Optional[str] = None, image_dir: Optional[str] = None
 
     dialog_graph = load_dialog_from_file(dialog_filepath)
 
+    screen = pygame.display.set_mode(SCREEN_SIZE)
+    pygame.display.set_caption(dialog_graph.title or dialog_filepath)
+
+    disk_cache = SurfaceDiskCache(Path(cache_dir)) if cache_dir else None
+    asset_loader = AssetLoader(PICTURE_SIZE, num_load_workers, disk_cache)
+    text_blip_sound_id = "text_blip.ogg"
+    select_blip_sound_id = "select_blip.ogg"
+    asset_loader.load_sound(text_blip_sound_id, Path(SOUND_DIR).joinpath(text_blip_sound_id))
+    asset_loader.load_sound(select_blip_sound_id, Path(SOUND_DIR).joinpath(select_blip_sound_id))
+
+    # The root node's assets are scheduled first, so that the dialog can start before everything else is loaded
+    root_node = dialog_graph.current_node()
+    nodes = [root_node] + [n for n in dialog_graph.nodes() if n.node_id != root_node.node_id]
+    if dialog_graph.background_image_id:
+        load_images(asset_loader, image_dir, [dialog_graph.background_image_id], [])
     image_ids = []
     animation_ids = []
-    if dialog_graph.background_image_id:
-        image_ids.append(dialog_graph.background_image_id)
-    for node in dialog_graph.nodes():
+    for node in nodes:
         graphics = node.graphics
         if graphics.image_ids:
             image_ids += graphics.image_ids
         if graphics.animation_id:
             animation_ids.append(graphics.animation_id)
-    images, animations = load_images(image_dir, image_ids, animation_ids)
-
-    text_blip_sound_id = "text_blip.ogg"
-    select_blip_sound_id = "select_blip.ogg"
-    sound_ids = [n.sound_id for n in dialog_graph.nodes() if n.sound_id is not None]
-    sounds = load_sounds(sound_dir, sound_ids)
-    sounds[text_blip_sound_id] = load_sound_file(str(Path(SOUND_DIR).joinpath(text_blip_sound_id)))
-    sounds[select_blip_sound_id] = load_sound_file(str(Path(SOUND_DIR).joinpath(select_blip_sound_id)))
-
-    sound_player = SoundPlayer(sounds, sounds[text_blip_sound_id])
-
-    screen = pygame.display.set_mode(SCREEN_SIZE)
-    pygame.display.set_caption(dialog_graph.title or dialog_filepath)
-    app = App(screen, dialog_font, choice_font, images, animations, sound_player, dialog_graph, select_blip_sound_id)
+    sound_ids = [n.sound_id for n in nodes if n.sound_id is not None]
+    frame_budget = FrameBudget(frame_budget_mb * 1024 * 1024) if frame_budget_mb is not None else None
+    # With a prefetch depth, node assets are only loaded when the dialog gets close to them
+    lazy = prefetch_depth is not None
+    load_images(asset_loader, image_dir, image_ids, animation_ids, frame_budget, lazy)
+    load_sounds(asset_loader, sound_dir, sound_ids, lazy)
+
+    asset_loader.prefetch(root_node.graphics.image_ids or [], [root_node.graphics.animation_id],
+                          [root_node.sound_id])
+    _show_loading_screen(screen, dialog_font, asset_loader, lambda: asset_loader.is_loaded(
+        image_ids=[dialog_graph.background_image_id, *(root_node.graphics.image_ids or [])],
+        animation_ids=[root_node.graphics.animation_id],
+        sound_ids=[text_blip_sound_id, select_blip_sound_id, root_node.sound_id]))
+
+    sound_player = SoundPlayer(asset_loader.sounds, asset_loader.sounds[text_blip_sound_id])
+
+    app = App(screen, dialog_font, choice_font, asset_loader.images, asset_loader.animations, sound_player,
+              dialog_graph, select_blip_sound_id, asset_loader, prefetch_depth, event_driven,
+              profile_trace_filepath)
     app.run()
 
 
-def load_images(directory: str, image_ids: List[str], animation_ids: List[str]) -> Tuple[
-    Dict[str, Surface], Dict[str, List[Surface]]]:
-    images: Dict[str, Surface] = {}
-    animations: Dict[str, List[Surface]] = {}
-    for filename in os.listdir(directory):
-        filepath = Path(directory).joinpath(filename)
-        if filepath.is_dir() and filename in animation_ids:
+def _show_loading_screen(screen: Surface, font: Font, asset_loader: AssetLoader, is_ready: Callable[[], bool]):
+    clock = pygame.time.Clock()
+    bar_rect = Rect(50, SCREEN_SIZE[1] // 2, SCREEN_SIZE[0] - 100, 20)
+    while not is_ready():
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                _exit_game()
+        asset_loader.raise_first_error()
+        num_loaded, num_total = asset_loader.progress()
+        screen.fill(BLACK)
+        screen.blit(font.render(f"Loading... {num_loaded}/{num_total}", True, WHITE),
+                    (bar_rect.x, bar_rect.y - 30))
+        pygame.draw.rect(screen, WHITE, bar_rect, width=1)
+        if num_total:
+            filled_rect = Rect(bar_rect.topleft, (bar_rect.w * num_loaded // num_total, bar_rect.h))
+            pygame.draw.rect(screen, WHITE, filled_rect)
+        pygame.display.update()
+        clock.tick(30)
+
+
+def load_images(asset_loader: AssetLoader, directory: str, image_ids: List[str], animation_ids: List[str],
+    frame_budget: Optional[FrameBudget] = None, lazy: bool = False):
+    """ Schedule loading of the image files and animation directories that are found in the given directory, in the
+    order that their IDs are given. If a frame budget is given, animation frames are streamed instead. If lazy, the
+    files are only registered, and are loaded when prefetched or used. """
+    filenames = set(os.listdir(directory))
+    num_files = 0
+    for asset_id in _unique(image_ids + animation_ids):
+        if asset_id not in filenames:
+            continue
+        filepath = Path(directory).joinpath(asset_id)
+        if filepath.is_dir() and asset_id in animation_ids:
             frame_filenames = os.listdir(filepath)
             frame_filenames.sort()
-            animations[filename] = [load_and_scale(filepath.joinpath(frame_filename))
-                                    for frame_filename in frame_filenames]
-        else:
-            if filename in image_ids:
-                images[filename] = load_and_scale(filepath)
-    print(f"Loaded {len(images) + sum((len(d) for d in animations.values()))} image files.")
-    return images, animations
-
-
-def load_sounds(directory: str, sound_ids: List[str]) -> Dict[str, Sound]:
-    sounds: Dict[str, Sound] = {}
-    for filename in os.listdir(directory):
-        if filename in sound_ids:
-            filepath = str(Path(directory).joinpath(filename))
-            sounds[filename] = load_sound_file(filepath)
-    print(f"Loaded {len(sounds)} sound files.")
-    return sounds
-
-
-def load_sound_file(filepath: str):
-    try:
-        sound = Sound(filepath)
-        sound.set_volume(0.2)
-        return sound
-    except Exception as e:
-        raise Exception(f"Failed to load sound file '{filepath}': {e}")
-
-
-def load_and_scale(filepath: Path) -> Surface:
-    try:
-        # print(f"Loading image: {filepath}")
-        surface = pygame.image.load(str(filepath))
-        return pygame.transform.scale(surface, PICTURE_SIZE)
-    except pygame.error as e:
-        raise Exception(f"Failed to load image '{filepath}': {e}")
+            frame_filepaths = [filepath.joinpath(f) for f in frame_filenames]
+            if frame_budget:
+                asset_loader.stream_animation(asset_id, frame_filepaths, frame_budget)
+            else:
+                asset_loader.load_animation(asset_id, frame_filepaths, lazy)
+                num_files += len(frame_filenames)
+        elif asset_id in image_ids:
+            asset_loader.load_image(asset_id, filepath, lazy)
+            num_files += 1
+    print(f"{'Registered' if lazy else 'Loading'} {num_files} image files.")
+
+
+def load_sounds(asset_loader: AssetLoader, directory: str, sound_ids: List[str], lazy: bool = False):
+    filenames = set(os.listdir(directory))
+    sound_ids = [sound_id for sound_id in _unique(sound_ids) if sound_id in filenames]
+    for sound_id in sound_ids:
+        asset_loader.load_sound(sound_id, Path(directory).joinpath(sound_id), lazy)
+    print(f"{'Registered' if lazy else 'Loading'} {len(sound_ids)} sound files.")
+
+
+def _wait_for_events(timeout: Optional[Millis], wait: Callable[..., Event] = pygame.event.wait,
+    get: Callable[[], List[Event]] = pygame.event.get) -> List[Event]:
+    """ Sleep until there's input, or until the timeout (the time until the dialog changes by itself) has passed. A
+    timeout of None means that nothing will change until there's input. """
+    if timeout is None:
+        events = [wait()]
+    elif timeout > 0:
+        events = [wait(timeout)]
+    else:
+        events = []
+    return [e for e in events if e.type != pygame.NOEVENT] + get()
+
+
+def _unique(ids: List[str]) -> List[str]:
+    return list(dict.fromkeys(ids))
 
 
 def _exit_game():
@@ -160,22 +238,46 @@ def _exit_game():
 
 def main():
     parser = argparse.ArgumentParser(description="Run a dialog from a JSON configuration file.")
-    parser.add_argument("json_file", type=str, help="The JSON file.")
+    parser.add_argument("json_file", type=str, help="The JSON file (or a dialog compiled with dialog_compiler).")
     parser.add_argument("--image_dir", type=str, help="The directory that we should look for image files in.")
     parser.add_argument("--sound_dir", type=str, help="The directory that we should look for sound files in.")
+    parser.add_argument("--load_workers", type=int, default=None,
+                        help="The number of threads used for loading images and sounds. (Default: based on CPU count)")
+    parser.add_argument("--stream_animations", action="store_true",
+                        help="Decode animation frames when they are shown, rather than loading all of them up front.")
+    parser.add_argument("--frame_budget_mb", type=int, default=128,
+                        help="Max memory used for decoded frames when streaming animations. (Default: 128)")
+    parser.add_argument("--cache_dir", type=str,
+                        help="A directory for caching decoded and scaled images between runs, for faster startup.")
+    parser.add_argument("--prefetch_depth", type=int,
+                        help="Load assets lazily, prefetching those of nodes at most this many choices away from the "
+                             "current node. (Default: load all assets up front)")
+    parser.add_argument("--event_driven", action="store_true",
+                        help="Sleep until there's input or something to animate, rather than redrawing continuously.")
+    parser.add_argument("--profile_trace", type=str,
+                        help="Record frame timings, print a summary on exit and write them to this file as a Chrome "
+                             "trace (for chrome://tracing or Perfetto).")
 
     args = vars(parser.parse_args())
 
     dialog_filepath = args.get("json_file", None)
     image_dir = args["image_dir"]
     sound_dir = args["sound_dir"]
+    num_load_workers = args["load_workers"]
+    frame_budget_mb = args["frame_budget_mb"] if args["stream_animations"] else None
+    cache_dir = args["cache_dir"]
+    prefetch_depth = args["prefetch_depth"]
+    event_driven = args["event_driven"]
+    profile_trace_filepath = args["profile_trace"]
 
     print("Starting application...")
     print(f"dialog filepath={dialog_filepath}")
     print(f"image dir={image_dir}")
     print(f"sound dir={sound_dir}")
 
-    start(dialog_filepath=dialog_filepath, image_dir=image_dir, sound_dir=sound_dir)
+    start(dialog_filepath=dialog_filepath, image_dir=image_dir, sound_dir=sound_dir,
+          num_load_workers=num_load_workers, frame_budget_mb=frame_budget_mb, cache_dir=cache_dir,
+          prefetch_depth=prefetch_depth, event_driven=event_driven, profile_trace_filepath=profile_trace_filepath)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,25 @@
+import argparse
+from pathlib import Path
+
+from config_file import load_dialog_from_file, save_compiled_dialog
+
+COMPILED_SUFFIX = ".dialog"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compile a dialog JSON file into a compact binary file that loads much faster.")
+    parser.add_argument("json_file", type=str, help="The JSON file.")
+    parser.add_argument("-o", "--output", type=str,
+                        help=f"The compiled file. (Default: the JSON file with the suffix {COMPILED_SUFFIX})")
+    args = parser.parse_args()
+
+    output = args.output or str(Path(args.json_file).with_suffix(COMPILED_SUFFIX))
+    # Loading the dialog validates it, so that the compiled file only holds resolved references
+    dialog_graph = load_dialog_from_file(args.json_file)
+    save_compiled_dialog(dialog_graph, output)
+    print(f"Saved compiled dialog in: {output}")
+
+
+if __name__ == '__main__':
+    main()
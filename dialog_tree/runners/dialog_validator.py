@@ -0,0 +1,227 @@
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import List, Optional, Dict, Tuple, NamedTuple, Iterable
+
+import pygame
+
+from analysis import analyze_graph
+from assets import load_image_file, load_sound_file
+from config_file import is_compiled_dialog_file, load_compiled_dialog, parse_dialog_from_stream, \
+    parse_dialog_from_json, parse_graph_nodes_from_json
+from graph import DialogGraph, DialogNode, find_graph_errors
+
+DIALOG_SUFFIXES = {".json", ".dialog"}
+# Where assets are looked for, relative to a dialog file, unless directories are given
+DEFAULT_ASSET_DIR = "data"
+
+
+class FileReport(NamedTuple):
+    file_path: str
+    num_nodes: int
+    # Problems that would make the dialog fail to load or run
+    errors: List[str]
+    # Problems with the structure of the dialog (see analysis.GraphAnalysis)
+    warnings: List[str]
+
+
+class _LoadedDialog(NamedTuple):
+    # The nodes that could be parsed
+    nodes: Iterable[DialogNode]
+    background_image_id: Optional[str]
+    # None if the nodes don't make up a valid graph, in which case errors says why
+    dialog_graph: Optional[DialogGraph]
+    errors: List[str]
+
+
+def find_dialog_files(paths: Iterable[str]) -> List[str]:
+    """ The given files, along with all dialog files (JSON or compiled) found under the given directories """
+    file_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            file_paths += sorted(str(p) for p in Path(path).rglob("*") if p.suffix in DIALOG_SUFFIXES and p.is_file())
+        else:
+            file_paths.append(path)
+    return file_paths
+
+
+def validate_files(file_paths: List[str], image_dir: Optional[str] = None, sound_dir: Optional[str] = None,
+    num_workers: Optional[int] = None) -> List[FileReport]:
+    """ Validate the files on a pool of worker processes. The reports are in the same order as the files. """
+    validate = partial(validate_file, image_dir=image_dir, sound_dir=sound_dir)
+    num_workers = num_workers or os.cpu_count() or 1
+    if num_workers == 1 or len(file_paths) <= 1:
+        return [validate(file_path) for file_path in file_paths]
+    # Files are handed out a few at a time, as most of them take next to no time to validate
+    chunk_size = max(1, len(file_paths) // (num_workers * 4))
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        return list(executor.map(validate, file_paths, chunksize=chunk_size))
+
+
+def validate_file(file_path: str, image_dir: Optional[str] = None, sound_dir: Optional[str] = None) -> FileReport:
+    """ Check that the dialog can be loaded, and that all assets that it refers to exist and can be decoded. All
+    problems are reported, rather than just the first one. """
+    try:
+        dialog = _load_dialog(file_path)
+    except Exception as e:
+        return FileReport(file_path, 0, [f"Failed to load dialog: {_describe_error(e)}"], [])
+
+    asset_dir = Path(file_path).parent.joinpath(DEFAULT_ASSET_DIR)
+    image_dir = Path(image_dir) if image_dir else asset_dir
+    sound_dir = Path(sound_dir) if sound_dir else asset_dir
+    errors = [f"Failed to load dialog: {error}" for error in dialog.errors]
+    # For each asset: the first node that refers to it, and by how many nodes it's referred to
+    references: Dict[Tuple[str, str], Tuple[str, int]] = {}
+
+    def refer(kind: str, asset_id: str, node_id: str):
+        first_node_id, count = references.get((kind, asset_id), (node_id, 0))
+        references[(kind, asset_id)] = (first_node_id, count + 1)
+
+    num_nodes = 0
+    for node in dialog.nodes:
+        num_nodes += 1
+        graphics = node.graphics
+        if graphics is None:
+            errors.append(f"Graph node '{node.node_id}' has no graphics")
+        else:
+            for image_id in graphics.image_ids or []:
+                refer("image", image_id, node.node_id)
+            if graphics.animation_id:
+                refer("animation", graphics.animation_id, node.node_id)
+        if node.sound_id:
+            refer("sound", node.sound_id, node.node_id)
+
+    if dialog.background_image_id:
+        error = _check_asset("image", image_dir.joinpath(dialog.background_image_id))
+        if error:
+            errors.append(f"Background image: {error}")
+    for (kind, asset_id), (node_id, count) in references.items():
+        directory = sound_dir if kind == "sound" else image_dir
+        error = _check_asset(kind, directory.joinpath(asset_id))
+        if error:
+            others = f" and {count - 1} other nodes" if count > 1 else ""
+            errors.append(f"Graph node '{node_id}'{others}: {error}")
+
+    warnings = analyze_graph(dialog.dialog_graph).problems() if dialog.dialog_graph else []
+    return FileReport(file_path, num_nodes, errors, warnings)
+
+
+def _load_dialog(file_path: str) -> _LoadedDialog:
+    if is_compiled_dialog_file(file_path):
+        dialog_graph = load_compiled_dialog(file_path)
+    else:
+        with open(file_path) as f:
+            try:
+                dialog_graph = parse_dialog_from_stream(f)
+            except json.JSONDecodeError:
+                raise
+            except (KeyError, ValueError):
+                # The graph is broken. Parse it again, node by node, to find all of its problems.
+                f.seek(0)
+                return _load_broken_dialog(json.load(f))
+    return _LoadedDialog(dialog_graph.nodes(), dialog_graph.background_image_id, dialog_graph, [])
+
+
+def _load_broken_dialog(dialog_json: Dict) -> _LoadedDialog:
+    if not isinstance(dialog_json, dict) or not isinstance(dialog_json.get("graph"), dict):
+        # Not a graph config, so there are no nodes to check separately. This raises the same error as the first time.
+        dialog_graph = parse_dialog_from_json(dialog_json)
+        return _LoadedDialog(dialog_graph.nodes(), dialog_graph.background_image_id, dialog_graph, [])
+    root_node_id, nodes, errors = parse_graph_nodes_from_json(dialog_json["graph"])
+    errors += find_graph_errors(root_node_id, nodes)
+    title = dialog_json.get("title")
+    background_image_id = dialog_json.get("background_image_id")
+    dialog_graph = None if errors else DialogGraph(root_node_id, nodes, title, background_image_id)
+    return _LoadedDialog(nodes, background_image_id, dialog_graph, errors)
+
+
+# The outcome of checking each asset, as many dialogs share the same assets (kept per worker process)
+_checked_assets: Dict[Tuple[str, Path], Optional[str]] = {}
+
+
+def _check_asset(kind: str, path: Path) -> Optional[str]:
+    """ A description of what's wrong with the asset, or None if it's fine """
+    key = (kind, path.resolve())
+    if key not in _checked_assets:
+        try:
+            _checked_assets[key] = _find_asset_error(kind, path)
+        except Exception as e:
+            _checked_assets[key] = f"Failed to decode {kind} '{path}': {_describe_error(e)}"
+    return _checked_assets[key]
+
+
+def _find_asset_error(kind: str, path: Path) -> Optional[str]:
+    if kind == "animation":
+        if not path.is_dir():
+            return f"Missing animation directory: '{path}'"
+        frame_paths = sorted(path.iterdir())
+        if not frame_paths:
+            return f"Animation directory has no frames: '{path}'"
+        for frame_path in frame_paths:
+            load_image_file(frame_path)
+    elif not path.is_file():
+        return f"Missing {kind}: '{path}'"
+    elif kind == "image":
+        load_image_file(path)
+    else:
+        _init_mixer()
+        load_sound_file(str(path))
+    return None
+
+
+def _init_mixer():
+    # Sounds can only be decoded once the mixer has been initialized, which needs an audio device
+    if not pygame.mixer.get_init():
+        os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+        pygame.mixer.init()
+
+
+def _describe_error(error: Exception) -> str:
+    return str(error) if isinstance(error, (ValueError, OSError)) or type(error) is Exception \
+        else f"{type(error).__name__}: {error}"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Validate dialog files (JSON or compiled), along with the images, animations and sounds that they "
+                    "refer to. All problems are reported, rather than just the first one.")
+    parser.add_argument("paths", type=str, nargs="+", help="Dialog files, or directories to search for them in.")
+    parser.add_argument("--image_dir", type=str,
+                        help=f"The directory that images and animations are looked for in. (Default: the "
+                             f"'{DEFAULT_ASSET_DIR}' directory next to each dialog file)")
+    parser.add_argument("--sound_dir", type=str,
+                        help=f"The directory that sounds are looked for in. (Default: the '{DEFAULT_ASSET_DIR}' "
+                             f"directory next to each dialog file)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="The number of processes that validate files. (Default: based on CPU count)")
+    parser.add_argument("--report", type=str, help="Also write the results to this file, as JSON.")
+    args = parser.parse_args()
+
+    file_paths = find_dialog_files(args.paths)
+    reports = validate_files(file_paths, args.image_dir, args.sound_dir, args.workers)
+
+    for report in reports:
+        if report.errors or report.warnings:
+            print(f"{report.file_path} ({report.num_nodes} nodes)")
+            for error in report.errors:
+                print(f"  ERROR: {error}")
+            for warning in report.warnings:
+                print(f"  WARNING: {warning}")
+    num_errors = sum(len(report.errors) for report in reports)
+    num_warnings = sum(len(report.warnings) for report in reports)
+    num_failed = sum(1 for report in reports if report.errors)
+    print(f"Validated {len(reports)} files: {num_failed} with errors ({num_errors} errors, {num_warnings} warnings)")
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump([report._asdict() for report in reports], f, indent=2)
+        print(f"Wrote report to {args.report}")
+    sys.exit(1 if num_errors else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,21 +1,35 @@
+import argparse
+import hashlib
 import os
-import sys
+import shutil
+import tempfile
+import time
+from collections import defaultdict
+from itertools import islice
+from multiprocessing import Process
 from pathlib import Path
+from typing import Optional, TextIO, List, Dict, Iterable, Set, Tuple, NamedTuple, Callable
 
+import graphviz
 from graphviz import Digraph
 
 from config_file import load_dialog_from_file
-from graph import DialogGraph
+from graph import DialogGraph, DialogNode
 from text_util import layout_text_in_area
 
 TMP_DIR = Path(".tmpfiles")
+# How many rendered graphs are kept in TMP_DIR (the least recently used ones are deleted)
+MAX_CACHED_RENDERS = 20
+
+NODE_COLOR = "#BBCCFF"
+FOCUS_NODE_COLOR = "#FFCC88"
 
 
 def generate_graphviz(graph_name: str, dialog_graph: DialogGraph) -> Digraph:
     graph = Digraph(
         name=graph_name,
         comment=f"generated with Graphviz from {graph_name}",
-        node_attr={"shape": "box", "style": "filled", "color": "#BBCCFF"},
+        node_attr={"shape": "box", "style": "filled", "color": NODE_COLOR},
         edge_attr={"fontsize": "11"}
     )
     for node in dialog_graph.nodes():
@@ -27,31 +41,298 @@ def generate_graphviz(graph_name: str, dialog_graph: DialogGraph) -> Digraph:
     return graph
 
 
+def write_dot(dialog_graph: DialogGraph, out: TextIO, graph_name: str, focus_node_id: Optional[str] = None,
+    max_choices: int = 2, collapse_chains: bool = False, cluster_separator: Optional[str] = None,
+    max_nodes: Optional[int] = None) -> int:
+    """
+    Write the graph in the DOT language, straight to the given stream, and return the number of nodes written
+
+    Unlike generate_graphviz, this doesn't build up the whole graph in memory, and it can cut a large dialog down to
+    something that graphviz can lay out in reasonable time:
+
+    - focus_node_id: only include the nodes that are at most max_choices choices away from this node
+    - collapse_chains: draw each chain of nodes that simply lead from one to the next (every node having a single
+      choice, leading to a node that can't be reached any other way) as a single box
+    - cluster_separator: group nodes whose IDs start with the same prefix (up to the separator) in boxes
+    - max_nodes: include at most this many nodes
+
+    Nodes that have choices leading to nodes that were left out are drawn with a dashed border.
+    """
+    if focus_node_id is not None:
+        nodes: Iterable[DialogNode] = dialog_graph.neighborhood(focus_node_id, max_choices)
+    else:
+        nodes = dialog_graph.nodes()
+    if max_nodes is not None:
+        nodes = islice(nodes, max_nodes)
+    is_partial = focus_node_id is not None or max_nodes is not None
+    if is_partial or collapse_chains or cluster_separator:
+        nodes = list(nodes)
+    included_ids = {node.node_id for node in nodes} if is_partial else None
+    # For each node that is drawn: the last node of its chain, and the number of nodes in the chain
+    chains = _find_chains(nodes) if collapse_chains else None
+
+    out.write(f"digraph {_quote(graph_name)} {{\n")
+    out.write(f"\t// generated from {graph_name}\n")
+    out.write(f'\tnode [color="{NODE_COLOR}" shape=box style=filled]\n')
+    out.write("\tedge [fontsize=11]\n")
+    num_written = 0
+    if cluster_separator:
+        # All nodes are written (cluster by cluster) before the edges, as edges between clusters are drawn outside
+        clusters: Dict[Optional[str], List[DialogNode]] = defaultdict(list)
+        for node in nodes:
+            if chains is None or node.node_id in chains:
+                prefix, separator, _ = node.node_id.partition(cluster_separator)
+                clusters[prefix if separator else None].append(node)
+        for cluster_index, (prefix, cluster_nodes) in enumerate(clusters.items()):
+            indent = "\t"
+            if prefix is not None:
+                out.write(f"\tsubgraph cluster_{cluster_index} {{\n\t\tlabel={_quote(prefix)}\n")
+                indent = "\t\t"
+            for node in cluster_nodes:
+                _write_node(out, indent, node, chains, included_ids, node.node_id == focus_node_id)
+                num_written += 1
+            if prefix is not None:
+                out.write("\t}\n")
+        for cluster_nodes in clusters.values():
+            for node in cluster_nodes:
+                _write_edges(out, node, chains, included_ids)
+    else:
+        for node in nodes:
+            if chains is None or node.node_id in chains:
+                _write_node(out, "\t", node, chains, included_ids, node.node_id == focus_node_id)
+                _write_edges(out, node, chains, included_ids)
+                num_written += 1
+    out.write("}\n")
+    return num_written
+
+
+def _find_chains(nodes: List[DialogNode]) -> Dict[str, Tuple[DialogNode, int]]:
+    node_by_id = {node.node_id: node for node in nodes}
+    num_incoming: Dict[str, int] = defaultdict(int)
+    for node in nodes:
+        for choice in node.choices:
+            num_incoming[choice.leads_to_id] += 1
+
+    def next_in_chain(node: DialogNode) -> Optional[DialogNode]:
+        """ The node that the given node's only choice leads to, if it can't be reached in any other way """
+        if len(node.choices) != 1:
+            return None
+        next_id = node.choices[0].leads_to_id
+        if num_incoming[next_id] != 1:
+            return None
+        return node_by_id.get(next_id)
+
+    # Nodes in the middle or at the end of a chain
+    followers = set()
+    for node in nodes:
+        next_node = next_in_chain(node)
+        if next_node is not None:
+            followers.add(next_node.node_id)
+
+    chains = {}
+    visited = set()
+
+    def follow_chain(first: DialogNode):
+        visited.add(first.node_id)
+        last = first
+        length = 1
+        next_node = next_in_chain(last)
+        while next_node is not None and next_node.node_id not in visited:
+            visited.add(next_node.node_id)
+            last = next_node
+            length += 1
+            next_node = next_in_chain(last)
+        chains[first.node_id] = (last, length)
+
+    for node in nodes:
+        if node.node_id not in followers:
+            follow_chain(node)
+    # What remains are chains that loop back to their start, where every node is a follower
+    for node in nodes:
+        if node.node_id not in visited:
+            follow_chain(node)
+    return chains
+
+
+def _write_node(out: TextIO, indent: str, node: DialogNode, chains: Optional[Dict[str, Tuple[DialogNode, int]]],
+    included_ids: Optional[Set[str]], is_focus: bool):
+    last, length = chains[node.node_id] if chains is not None else (node, 1)
+    label = _add_newlines(node.text, 30)
+    if length > 2:
+        label += f"\n\n[{length - 2} more nodes]"
+    if length > 1:
+        label += f"\n\n{_add_newlines(last.text, 30)}"
+    attributes = [f"label={_quote(label)}"]
+    if is_focus:
+        attributes.append(f'color="{FOCUS_NODE_COLOR}"')
+    if included_ids is not None and any(c.leads_to_id not in included_ids for c in last.choices):
+        attributes.append('style="filled,dashed" penwidth=2')
+    out.write(f"{indent}{_quote(node.node_id)} [{' '.join(attributes)}]\n")
+
+
+def _write_edges(out: TextIO, node: DialogNode, chains: Optional[Dict[str, Tuple[DialogNode, int]]],
+    included_ids: Optional[Set[str]]):
+    # A chain's choices are those of its last node (and they always lead to the start of a chain)
+    last = chains[node.node_id][0] if chains is not None else node
+    for choice in last.choices:
+        if included_ids is None or choice.leads_to_id in included_ids:
+            out.write(f"\t{_quote(node.node_id)} -> {_quote(choice.leads_to_id)} "
+                      f"[label={_quote(_add_newlines(choice.text, 20))}]\n")
+
+
+def _quote(text: str) -> str:
+    escaped = text.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return f'"{escaped}"'
+
+
 def _add_newlines(text: str, max_chars_per_line: int) -> str:
-    lines_iterator = layout_text_in_area(text, len, max_chars_per_line)
-    text_with_newlines = next(lines_iterator)
-    for additional_line in lines_iterator:
-        text_with_newlines += f"\n{additional_line}"
-    return text_with_newlines
+    return "\n".join(layout_text_in_area(text, len, max_chars_per_line))
+
+
+class RenderOptions(NamedTuple):
+    """ What to render (see write_dot for the details), and how """
+    focus_node_id: Optional[str] = None
+    max_choices: int = 2
+    collapse_chains: bool = False
+    cluster_separator: Optional[str] = None
+    max_nodes: Optional[int] = None
+    output_format: str = "pdf"
+    engine: str = "dot"
+
+
+def render_graph(dialog_graph: DialogGraph, graph_name: str, options: RenderOptions = RenderOptions(),
+    directory: Path = TMP_DIR, render_file: Callable[[str, str, str], str] = graphviz.render) -> Path:
+    """
+    Render the graph with graphviz, unless an identical graph has been rendered before, and return the rendered file
+
+    Renders are cached in the directory under a hash of the DOT text (which covers the graph's content and the options)
+    along with the output format and layout engine, so a graph that hasn't changed is returned right away. The hash
+    doesn't depend on the order of the DOT statements, so the same graph with its nodes or choices listed in a different
+    order is found in the cache too. The latest render of each graph is also copied to <graph_name>.<format>, so that a
+    viewer can keep that file open.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile("w", dir=directory, suffix=".gv.partial", delete=False) as f:
+        partial_filepath = f.name
+        writer = _HashingWriter(f)
+        write_dot(dialog_graph, writer, graph_name, options.focus_node_id, options.max_choices,
+                  options.collapse_chains, options.cluster_separator, options.max_nodes)
+    key_text = f"{options.engine} {options.output_format} {writer.hexdigest()}"
+    key = hashlib.sha256(key_text.encode("utf-8")).hexdigest()[:32]
+    dot_filepath = directory.joinpath(f"{key}.gv")
+    rendered_filepath = directory.joinpath(f"{key}.gv.{options.output_format}")
+    if rendered_filepath.exists():
+        os.remove(partial_filepath)
+        # Marks the render as recently used
+        os.utime(dot_filepath)
+        print(f"Graph is unchanged since it was last rendered: {rendered_filepath}")
+    else:
+        os.replace(partial_filepath, dot_filepath)
+        render_file(options.engine, options.output_format, str(dot_filepath))
+        _evict_old_renders(directory)
+    output_filepath = directory.joinpath(f"{graph_name}.{options.output_format}")
+    shutil.copyfile(rendered_filepath, output_filepath)
+    return output_filepath
+
+
+def watch(dialog_filepath: str, options: RenderOptions = RenderOptions(), directory: Path = TMP_DIR,
+    poll_interval: float = 0.5, render_file: Callable[[str, str, str], str] = graphviz.render) -> Process:
+    """ Render the dialog whenever its file changes, in a background process (which is returned, already started) """
+    process = Process(target=_watch_file, args=(dialog_filepath, options, directory, poll_interval, render_file),
+                      daemon=True)
+    process.start()
+    return process
+
 
+def _watch_file(dialog_filepath: str, options: RenderOptions, directory: Path, poll_interval: float,
+    render_file: Callable[[str, str, str], str]):
+    last_modified = None
+    while True:
+        try:
+            modified = os.stat(dialog_filepath).st_mtime_ns
+        except FileNotFoundError:
+            # Editors often save by replacing the file, so it can be missing for a moment. Treat it as unchanged.
+            modified = last_modified
+        if modified != last_modified:
+            last_modified = modified
+            try:
+                dialog_graph = load_dialog_from_file(dialog_filepath)
+                output_filepath = render_graph(dialog_graph, Path(dialog_filepath).name, options, directory,
+                                               render_file)
+                print(f"Rendered: {output_filepath}")
+            except Exception as e:
+                # Most likely the file is being edited, so try again when it changes
+                print(f"Failed to render {dialog_filepath}: {e}")
+        time.sleep(poll_interval)
 
-def _init_tmp_dir():
-    if not TMP_DIR.exists():
-        print(f"Creating directory: {TMP_DIR}")
-        os.mkdir(TMP_DIR)
-    for existing_file in [TMP_DIR.joinpath(f) for f in os.listdir(TMP_DIR)]:
-        print(f"Cleaning up old file: {existing_file}")
-        os.remove(existing_file)
+
+def _evict_old_renders(directory: Path):
+    dot_filepaths = sorted(directory.glob("*.gv"), key=lambda path: path.stat().st_mtime, reverse=True)
+    for dot_filepath in dot_filepaths[MAX_CACHED_RENDERS:]:
+        for filepath in directory.glob(f"{dot_filepath.name}*"):
+            os.remove(filepath)
+
+
+class _HashingWriter:
+    """
+    Passes written text on to a file, hashing it on the way
+
+    Each line is hashed on its own, and the line hashes are added up, so the result doesn't depend on the order of the
+    lines. write_dot puts each node and each edge on a line of its own, so this hashes the graph's content rather than
+    the order that its nodes and choices happen to be listed in.
+    """
+
+    def __init__(self, out: TextIO):
+        self._out = out
+        self._partial_line = ""
+        self._sum = 0
+
+    def write(self, text: str):
+        self._out.write(text)
+        *lines, self._partial_line = (self._partial_line + text).split("\n")
+        for line in lines:
+            self._add(line)
+
+    def hexdigest(self) -> str:
+        if self._partial_line:
+            self._add(self._partial_line)
+            self._partial_line = ""
+        return f"{self._sum:064x}"
+
+    def _add(self, line: str):
+        line_hash = int.from_bytes(hashlib.sha256(line.encode("utf-8")).digest(), "big")
+        self._sum = (self._sum + line_hash) % 2 ** 256
 
 
 def main():
-    args = sys.argv[1:]
-    dialog_filepath = args[0]
-    dialog_graph = load_dialog_from_file(dialog_filepath)
-    _init_tmp_dir()
-    graph = generate_graphviz(Path(dialog_filepath).name, dialog_graph)
-    graph.render(directory=TMP_DIR, view=True)
+    parser = argparse.ArgumentParser(description="Render a dialog as a graph, using graphviz.")
+    parser.add_argument("json_file", type=str, help="The JSON file (or a dialog compiled with dialog_compiler).")
+    parser.add_argument("--focus", type=str, help="Only render the nodes near the node with this ID.")
+    parser.add_argument("--depth", type=int, default=2,
+                        help="With --focus, how many choices away from the focused node to go. (Default: 2)")
+    parser.add_argument("--collapse_chains", action="store_true",
+                        help="Render chains of nodes that simply lead from one to the next as single boxes.")
+    parser.add_argument("--cluster_separator", type=str,
+                        help="Group nodes whose IDs have the same prefix up to this separator (like '.' or '_').")
+    parser.add_argument("--max_nodes", type=int, help="Render at most this many nodes.")
+    parser.add_argument("--format", type=str, default="pdf", help="The output format. (Default: pdf)")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep running, and render again whenever the file changes.")
+    args = parser.parse_args()
+
+    options = RenderOptions(args.focus, args.depth, args.collapse_chains, args.cluster_separator, args.max_nodes,
+                            args.format)
+    dialog_graph = load_dialog_from_file(args.json_file)
+    output_filepath = render_graph(dialog_graph, Path(args.json_file).name, options)
     print(f"Saved rendered outputs in: {TMP_DIR}")
+    graphviz.view(str(output_filepath))
+    if args.watch:
+        print(f"Watching {args.json_file} for changes. Press Ctrl+C to stop.")
+        process = watch(args.json_file, options)
+        try:
+            process.join()
+        except KeyboardInterrupt:
+            process.terminate()
 
 
 if __name__ == '__main__':
@@ -1,35 +1,50 @@
-from typing import Dict
+from typing import Mapping, Optional
 
 import pygame.mixer
 from pygame.mixer import Sound
 
 from constants import Millis
-from timing import PeriodicAction
+from timing import Scheduler, Timer
 
 
 class SoundPlayer:
-    def __init__(self, sounds: Dict[str, Sound], text_blip_sound: Sound):
+    def __init__(self, sounds: Mapping[str, Sound], text_blip_sound: Sound):
         self._sounds = sounds
         self._text_blip_sound = text_blip_sound
 
-        self._periodic_text_blip = PeriodicAction(Millis(75), self._play_queued_text_blip)
+        self._scheduler: Optional[Scheduler] = None
+        self._text_blip_timer: Optional[Timer] = None
         self._text_blip_queued = False
 
-    def update(self, elapsed_time: Millis):
-        self._periodic_text_blip.update(elapsed_time)
+    def use_scheduler(self, scheduler: Scheduler):
+        """ Text blips are played at a fixed pace, driven by the scheduler. Without one, they are played right away. """
+        if self._text_blip_timer:
+            self._text_blip_timer.cancel()
+            self._text_blip_timer = None
+        self._scheduler = scheduler
 
     def _play_queued_text_blip(self):
         if self._text_blip_queued:
             self._text_blip_queued = False
             self._text_blip_sound.play()
+        else:
+            # Nothing more to play for now. Stop the timer rather than have it fire for nothing.
+            self._text_blip_timer.cancel()
+            self._text_blip_timer = None
 
     def play(self, sound_id: str):
         sound = self._sounds[sound_id]
         sound.play()
 
     def play_text_blip(self):
+        if self._scheduler is None:
+            self._text_blip_sound.play()
+            return
         # We do it this way to avoid excessive spam of this sound effect (which sounds bad)
         self._text_blip_queued = True
+        if self._text_blip_timer is None:
+            self._text_blip_timer = self._scheduler.call_periodically(
+                Millis(75), self._play_queued_text_blip, catch_up=False)
 
     @staticmethod
     def stop_all_playing_sounds():
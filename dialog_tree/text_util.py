@@ -1,4 +1,6 @@
-from typing import Callable, Iterator
+from bisect import bisect_right
+from itertools import accumulate
+from typing import Callable, Iterator, List, Dict
 
 
 def layout_text_in_area(text: str, font_width: Callable[[str], int], width: int) -> Iterator[str]:
@@ -6,42 +8,52 @@ def layout_text_in_area(text: str, font_width: Callable[[str], int], width: int)
         yield ""
         return
 
+    # Each distinct glyph is measured once. The width of any substring [a, b) is then offsets[b] - offsets[a].
+    offsets = _cumulative_advances(text, font_width)
+
     start = 0
-    end = 0
     while True:
 
-        if text[start] == ' ':
-            # Our line is starting with whitespace --> advance forward to skip whitespace
-            for i in range(start + 1, len(text) + 1):
-                if text[i] != ' ':
-                    start = i
-                    break
+        # Our line is starting with whitespace --> advance forward to skip whitespace
+        while start < len(text) and text[start] == ' ':
+            start += 1
+        if start == len(text):
+            # Only whitespace remained after the last line break --> we're done
+            return
 
+        # Find the first character that doesn't fit on the line, i.e. the smallest end where [start->end] is wider
+        # than allowed
+        end = max(start, bisect_right(offsets, offsets[start] + width, lo=start) - 1)
         if end >= len(text):
             # We have reached the end of the string --> we're done
             yield text[start:]
             return
-        substr = text[start:end + 1]
-        overflow = font_width(substr) > width
-        if overflow:
-            # we have a substring [start->end] that is wider than allowed
-            if text[end] == ' ':
-                # we are at a word-boundary so we can return all previous text
+
+        if text[end] == ' ':
+            # we are at a word-boundary so we can return all previous text
+            yield text[start:end]
+            start = end
+        else:
+            # mid-word --> we need to go back left to find a word-boundary to wrap line at
+            word_boundary = text.rfind(' ', start + 1, end)
+            if word_boundary != -1:
+                # we found a word boundary --> yield line and go on with main loop
+                yield text[start:word_boundary + 1]
+                start = word_boundary + 1
+            else:
+                # failed to find a word-boundary --> resort to returning mid-word (but always make progress, even if
+                # a single character is wider than the area)
+                end = max(end, start + 1)
                 yield text[start:end]
                 start = end
-            else:
-                # mid-word --> we need to go back left to find a word-boundary to wrap line at
-                found = False
-                for i in range(end - 1, start, -1):
-                    if text[i] == ' ':
-                        # we found a word boundary --> yield line and go on with main loop
-                        yield text[start:i + 1]
-                        start = end = i + 1
-                        found = True
-                        break
-                if not found:
-                    # failed to find a word-boundary --> resort to returning mid-word
-                    yield text[start:end]
-                    start = end
-        else:
-            end += 1
+
+
+def _cumulative_advances(text: str, font_width: Callable[[str], int]) -> List[int]:
+    glyph_widths: Dict[str, int] = {}
+    advances = []
+    for char in text:
+        advance = glyph_widths.get(char)
+        if advance is None:
+            advance = glyph_widths[char] = font_width(char)
+        advances.append(advance)
+    return list(accumulate(advances, initial=0))
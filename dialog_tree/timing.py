@@ -1,16 +1,101 @@
-from typing import Callable, Any
+from heapq import heappush, heappop, heapify
+from itertools import count
+from typing import Callable, Any, List, Tuple, Optional
 
 from constants import Millis
 
 
-class PeriodicAction:
-    def __init__(self, cooldown: Millis, callback: Callable[[], Any]):
-        self._cooldown = cooldown
+class Timer:
+    """ A callback registered with a Scheduler. Call cancel() to stop it from being called (again). """
+
+    def __init__(self, scheduler: "Scheduler", callback: Callable[[], Any], interval: Optional[Millis], catch_up: bool):
+        self._scheduler = scheduler
         self._callback = callback
-        self._time_since_last_action = 0
+        self.interval = interval
+        self.catch_up = catch_up
+        self.cancelled = False
+        self._queued = False
+
+    def cancel(self):
+        if not self.cancelled:
+            self.cancelled = True
+            if self._queued:
+                self._scheduler._on_cancelled()
+
+
+class Scheduler:
+    """
+    Calls registered callbacks when their time has come, as time is advanced with update(ms)
+
+    Timers are kept in a heap ordered by deadline, so an update only has to look at the timers that are due, however
+    many timers exist. All callbacks that are due within one update are called in deadline order, including every
+    missed run of a periodic timer that catches up.
+    """
+
+    def __init__(self):
+        self._now = 0
+        # (deadline, sequence number, timer). The sequence number breaks ties in registration order. Cancelled timers
+        # are left in place and skipped when they come up, until they make up most of the heap.
+        self._queue: List[Tuple[int, int, Timer]] = []
+        self._sequence = count()
+        self._num_cancelled = 0
+
+    def call_later(self, delay: Millis, callback: Callable[[], Any]) -> Timer:
+        timer = Timer(self, callback, None, False)
+        self._push(timer, self._now + delay)
+        return timer
+
+    def call_periodically(self, interval: Millis, callback: Callable[[], Any], catch_up: bool = True) -> Timer:
+        """
+        Call the callback every interval ms, starting one interval from now
+
+        If an update covers several intervals, the callback is called once per interval if catch_up is set, and
+        otherwise only once, with the following runs kept on the original beat.
+        """
+        if interval <= 0:
+            raise ValueError(f"Interval must be positive: {interval}")
+        timer = Timer(self, callback, interval, catch_up)
+        self._push(timer, self._now + interval)
+        return timer
 
     def update(self, elapsed_time: Millis):
-        self._time_since_last_action += elapsed_time
-        if self._time_since_last_action >= self._cooldown:
-            self._time_since_last_action -= self._cooldown
-            self._callback()
+        self._now += elapsed_time
+        while self._queue and self._queue[0][0] <= self._now:
+            deadline, _, timer = heappop(self._queue)
+            timer._queued = False
+            if timer.cancelled:
+                self._num_cancelled -= 1
+                continue
+            if timer.interval is not None:
+                if timer.catch_up:
+                    next_deadline = deadline + timer.interval
+                else:
+                    next_deadline = deadline + timer.interval * ((self._now - deadline) // timer.interval + 1)
+                # Queued before the call, so that the callback can cancel its own timer
+                self._push(timer, next_deadline)
+            timer._callback()
+
+    def time_until_next(self) -> Optional[Millis]:
+        """ How long until the next callback is due, or None if no timers are active """
+        while self._queue and self._queue[0][2].cancelled:
+            heappop(self._queue)[2]._queued = False
+            self._num_cancelled -= 1
+        if self._queue:
+            return Millis(max(0, self._queue[0][0] - self._now))
+
+    def __len__(self):
+        return len(self._queue) - self._num_cancelled
+
+    def _push(self, timer: Timer, deadline: int):
+        timer._queued = True
+        heappush(self._queue, (deadline, next(self._sequence), timer))
+
+    def _on_cancelled(self):
+        self._num_cancelled += 1
+        if self._num_cancelled > 16 and self._num_cancelled * 2 > len(self._queue):
+            for _, _, timer in self._queue:
+                if timer.cancelled:
+                    timer._queued = False
+            self._queue = [entry for entry in self._queue if not entry[2].cancelled]
+            heapify(self._queue)
+            self._num_cancelled = 0
@@ -1,28 +1,67 @@
 from abc import ABC
+from itertools import count
 from random import randint
-from typing import Tuple, List, Optional, Dict
+from typing import Tuple, List, Optional, Sequence, Mapping, Hashable
 
 import pygame
 from pygame.font import Font
 from pygame.rect import Rect
 from pygame.surface import Surface
 
+from cache import LruCache, surface_size_in_bytes
 from constants import WHITE, GREEN, BLACK, Vec2, Vec3, Millis
 from graph import DialogNode
+from profiling import NullProfiler, NULL_PROFILER
 from sound import SoundPlayer
 from text_util import layout_text_in_area
-from timing import PeriodicAction
+from timing import Scheduler, Timer
+
+# Shared by all text boxes, so that revisiting a dialog node doesn't require any text layout or line rendering. The
+# limits can be changed with set_limits().
+text_layout_cache: LruCache[Tuple[str, Font, int], Tuple[str, ...]] = LruCache(max_entries=1024)
+rendered_line_cache: LruCache[Tuple[str, Font, Vec3], Surface] = LruCache(max_bytes=8 * 1024 * 1024,
+                                                                           size_of=surface_size_in_bytes)
+# Pictures composited from a background and an animation frame, keyed by (namespace, picture size, background id,
+# animation key, frame index, offset). Shared by all pictures, so that an animation only has to be composited once per
+# frame. Asset IDs are only unique within the asset mappings of one Ui, so each Ui has a namespace of its own.
+picture_frame_cache: LruCache[Tuple[Hashable, Vec2, Hashable, Hashable, int, Vec2], Surface] = LruCache(
+    max_bytes=64 * 1024 * 1024, size_of=surface_size_in_bytes)
+# Animations with more frames than this are composited into a buffer of their own instead, as they would take up much
+# of the cache (at around 750 KB per full-size frame) and keep evicting each other's frames.
+MAX_CACHED_ANIMATION_FRAMES = 32
+_cache_namespaces = count()
+# Choice buttons, keyed by (text, font, size, highlighted). Shared by all nodes, as many of them have the same choices
+# (like "Next" in a sequence).
+choice_button_cache: LruCache[Tuple[str, Font, Vec2, bool], Surface] = LruCache(max_bytes=4 * 1024 * 1024,
+                                                                                size_of=surface_size_in_bytes)
 
 
 class _Component(ABC):
     def __init__(self, surface: Surface):
         self.surface = surface
+        self._dirty_rects: List[Rect] = []
+        self._timers: List[Timer] = []
 
-    def update(self, elapsed_time: Millis):
-        pass
+    def stop(self):
+        """ Cancel the component's timers, once it's no longer shown """
+        for timer in self._timers:
+            timer.cancel()
+        self._timers = []
+
+    def mark_dirty(self, rect: Optional[Rect] = None):
+        """ Report that (a part of) the surface has changed since it was last drawn to the screen """
+        self._dirty_rects.append(rect or self.surface.get_rect())
+
+    def take_dirty_rects(self) -> List[Rect]:
+        dirty_rects = self._dirty_rects
+        self._dirty_rects = []
+        return dirty_rects
 
 
 class _ScreenShake:
+    # How often the shaking picture moves
+    INTERVAL = Millis(16)
+
     def __init__(self):
         self.x = 0
         self.y = 0
@@ -31,6 +70,9 @@ class _ScreenShake:
     def start(self, duration: Millis):
         self._remaining = duration
 
+    def is_active(self) -> bool:
+        return self._remaining > 0
+
     def update(self, elapsed_time: Millis):
         self._remaining = max(0, self._remaining - elapsed_time)
         if self._remaining == 0:
@@ -42,8 +84,9 @@ class _ScreenShake:
 class Ui:
     """The graphical user interface used for presenting a dialog on the screen"""
     def __init__(self, surface: Surface, picture_size: Vec2, dialog_node: DialogNode, dialog_font: Font,
-        choice_font: Font, images: Dict[str, Surface], animations: Dict[str, List[Surface]], sound_player: SoundPlayer,
-        background: Optional[Surface], select_blip_sound_id: str):
+        choice_font: Font, images: Mapping[str, Surface], animations: Mapping[str, Sequence[Surface]],
+        sound_player: SoundPlayer, background: Optional[Surface], select_blip_sound_id: str, scheduler: Scheduler,
+        background_id: Optional[str] = None):
         self.surface = surface
         self._picture_size = picture_size
         self._width = surface.get_width()
@@ -53,41 +96,66 @@ class Ui:
         self._animations = animations
         self._sound_player = sound_player
         self._background = background
+        self._background_id = background_id
         self._select_blip_sound_id = select_blip_sound_id
+        self._scheduler = scheduler
+        self._profiler = NULL_PROFILER
+        self._cache_namespace = next(_cache_namespaces)
 
         # MUTABLE STATE BELOW
         self._dialog_node = dialog_node
         self._components: List[Tuple[_Component, Vec2]] = []
         self._dialog_box = None
         self._choice_buttons = []
+        # For each row of the surface, the index of the choice button that covers it (if any), for fast hit-testing
+        self._choice_button_rows: List[Optional[int]] = []
+        self._choice_button_rects: List[Rect] = []
         self._highlighted_choice_index = 0
         self._screen_shake = _ScreenShake()
+        self._needs_full_redraw = True
 
         self.set_dialog(dialog_node)
 
     def set_dialog(self, dialog_node: DialogNode):
         self._dialog_node = dialog_node
+        self._needs_full_redraw = True
 
         graphics = dialog_node.graphics
-        if graphics.image_ids:
-            animation = _Animation([self._images[i] for i in graphics.image_ids], graphics.offset)
-        else:
-            animation = _Animation(self._animations[graphics.animation_id], graphics.offset)
+        with self._profiler.section("asset_fetch"):
+            if graphics.image_ids:
+                animation = _Animation([self._images[i] for i in graphics.image_ids], graphics.offset,
+                                       graphics.image_ids)
+            else:
+                animation = _Animation(self._animations[graphics.animation_id], graphics.offset,
+                                       graphics.animation_id)
         margin = 5
         dialog_box_size = (self._width - margin * 2, 120)
-        self._components = [(_Picture(Surface(self._picture_size), self._background, animation), (0, 0))]
+        for component, _ in self._components:
+            component.stop()
+        picture = _Picture(self._picture_size, self._background, self._background_id, animation, self._scheduler,
+                           self._cache_namespace)
+        self._components = [(picture, (0, 0))]
         if dialog_node.text:
             self._dialog_box = _TextBox(
-                self._dialog_font, dialog_box_size, dialog_node.text,
-                border_color=(150, 150, 150), text_color=(255, 255, 255), sound_player=self._sound_player)
+                self._dialog_font, dialog_box_size, dialog_node.text, border_color=(150, 150, 150),
+                text_color=(255, 255, 255), sound_player=self._sound_player, scheduler=self._scheduler,
+                profiler=self._profiler)
             self._components.append(
                 (self._dialog_box, (margin, self._picture_size[1] - dialog_box_size[1] - margin)))
             if dialog_node.graphics.instant_text:
                 self._dialog_box.set_cursor_to_end()
         self._choice_buttons = []
+        self._choice_button_rows = []
+        self._choice_button_rects = []
         if graphics.screen_shake:
             self._screen_shake.start(graphics.screen_shake)
 
+    def set_profiler(self, profiler: NullProfiler):
+        """ Record the timings of text layout, glyph rendering and asset lookups with the given profiler """
+        self._profiler = profiler
+        if self._dialog_box:
+            self._dialog_box.set_profiler(profiler)
+
     def _add_choice_buttons(self):
         button_height = 40
         self._choice_buttons = [_ChoiceButton(self._choice_font, (self._width, button_height), choice.text)
@@ -99,23 +167,61 @@ class Ui:
             j = len(self._choice_buttons) - i
             position = (0, self.surface.get_height() - button_height * j - 5 * j)
             self._components.append((button, position))
-
-    def redraw(self):
-        self.surface.fill(BLACK)
-        dx, dy = (self._screen_shake.x, self._screen_shake.y)
+            button.mark_dirty()
+        self._update_choice_button_hit_test()
+
+    def _update_choice_button_hit_test(self):
+        self._choice_button_rects = [Rect(position, component.surface.get_size())
+                                     for component, position in self._components
+                                     if isinstance(component, _ChoiceButton)]
+        self._choice_button_rows = [None] * self.surface.get_height()
+        for choice_index, rect in enumerate(self._choice_button_rects):
+            for y in range(max(0, rect.top), min(rect.bottom, len(self._choice_button_rows))):
+                self._choice_button_rows[y] = choice_index
+
+    def redraw(self) -> List[Rect]:
+        """ Bring the surface up to date, and return the areas of it that changed """
+        if self._needs_full_redraw:
+            self._needs_full_redraw = False
+            self.surface.fill(BLACK)
+            dx, dy = (self._screen_shake.x, self._screen_shake.y)
+            self.surface.blits([(component.surface, (x + dx, y + dy)) for component, (x, y) in self._components])
+            for component, _ in self._components:
+                component.take_dirty_rects()
+            return [self.surface.get_rect()]
+
+        dirty_rects = []
         for component, (x, y) in self._components:
-            self.surface.blit(component.surface, (x + dx, y + dy))
+            for rect in component.take_dirty_rects():
+                _add_merged(dirty_rects, rect.move(x, y).clip(self.surface.get_rect()))
+        # Components overlap (and the text box is translucent), so every component that covers a dirty area has to be
+        # drawn again in that area, in order.
+        blits = []
+        for dirty_rect in dirty_rects:
+            self.surface.fill(BLACK, dirty_rect)
+            for component, (x, y) in self._components:
+                area = dirty_rect.clip(Rect((x, y), component.surface.get_size()))
+                if area.w > 0 and area.h > 0:
+                    blits.append((component.surface, area.topleft, area.move(-x, -y)))
+        self.surface.blits(blits)
+        return dirty_rects
 
     def update(self, elapsed_time: Millis):
+        """ Respond to time passing. The components themselves are driven by the scheduler's timers. """
 
+        if self._screen_shake.is_active():
+            # The whole UI moves while shaking (and has to be redrawn once more in place when the shake is over)
+            self._needs_full_redraw = True
         self._screen_shake.update(elapsed_time)
 
-        for component, _ in self._components:
-            component.update(elapsed_time)
-
         if self._dialog_box.is_cursor_at_end() and not self._choice_buttons:
             self._add_choice_buttons()
 
+    def time_until_update(self) -> Optional[Millis]:
+        """ How long until the UI changes by itself (not counting the scheduler's timers), or None if it's waiting """
+        if self._screen_shake.is_active():
+            return _ScreenShake.INTERVAL
+
     def move_choice_highlight(self, delta: int):
         if self._choice_buttons and len(self._choice_buttons) > 1:
             new_index = (self._highlighted_choice_index + delta) % len(self._choice_buttons)
@@ -136,20 +242,23 @@ class Ui:
         self._dialog_box.set_cursor_to_end()
 
     def choice_button_at_position(self, target_position: Vec2) -> Optional[int]:
-        for choice_index, (component, position) in enumerate((c for c in self._components
-                                                              if isinstance(c[0], _ChoiceButton))):
-            rect = Rect(position, component.surface.get_size())
-            if rect.collidepoint(target_position):
+        x, y = target_position
+        if 0 <= y < len(self._choice_button_rows):
+            choice_index = self._choice_button_rows[y]
+            if choice_index is not None and self._choice_button_rects[choice_index].collidepoint(x, y):
                 return choice_index
 
 
 class _Animation:
-    def __init__(self, frames: List[Surface], offset: Vec2):
+    def __init__(self, frames: Sequence[Surface], offset: Vec2, key: Hashable):
         if not frames:
             raise ValueError("Cannot instantiate animation without frames!")
         self._frames = frames
         self._frame_index = 0
-        self.offset = offset
+        # Offsets from a JSON file are lists, which can't be part of a cache key
+        self.offset: Vec2 = tuple(offset)
+        # Identifies the frames (for caching), as they may be evicted and loaded again as new surfaces
+        self.key = key
 
     def change_frame(self):
         self._frame_index = (self._frame_index + 1) % len(self._frames)
@@ -157,108 +266,188 @@ class _Animation:
     def image(self) -> Surface:
         return self._frames[self._frame_index]
 
+    def num_frames(self) -> int:
+        return len(self._frames)
+
+    def frame_index(self) -> int:
+        return self._frame_index
+
 
 class _Picture(_Component):
 
-    def __init__(self, surface: Surface, background: Optional[Surface], animation: _Animation):
-        super().__init__(surface)
+    def __init__(self, size: Vec2, background: Optional[Surface], background_id: Optional[str],
+        animation: _Animation, scheduler: Scheduler, cache_namespace: Hashable = None):
+        self._size = size
         self._background = background
+        self._background_id = background_id
         self._animation = animation
-        self._redraw()
-        self._periodic_frame_change = PeriodicAction(Millis(130), self._change_frame)
-
-    def _redraw(self):
-        self.surface.fill(BLACK)
+        self._cache_namespace = cache_namespace
+        # Long animations are composited into this, frame by frame
+        self._buffer = Surface(size) if animation.num_frames() > MAX_CACHED_ANIMATION_FRAMES else None
+        super().__init__(self._composited_frame())
+        if self._animation.num_frames() > 1:
+            # After a stall (like a minimized window), skip ahead rather than compositing every missed frame
+            self._timers.append(scheduler.call_periodically(Millis(130), self._change_frame, catch_up=False))
+
+    def _composited_frame(self) -> Surface:
+        if self._buffer is not None:
+            return self._composite(self._buffer)
+        # The cached surfaces are shared, and are swapped in as they are rather than copied, so they must never be
+        # drawn on after being composited.
+        background_key = (self._background_id or self._background) if self._background else None
+        key = (self._cache_namespace, self._size, background_key, self._animation.key,
+               self._animation.frame_index(), self._animation.offset)
+        return picture_frame_cache.get_or_create(key, lambda: self._composite(Surface(self._size)))
+
+    def _composite(self, surface: Surface) -> Surface:
+        # Also when there's a background, as it may be translucent (and the buffer holds the previous frame)
+        surface.fill(BLACK)
         if self._background:
-            self.surface.blit(self._background, (0, 0))
-        self.surface.blit(self._animation.image(), self._animation.offset)
+            surface.blit(self._background, (0, 0))
+        surface.blit(self._animation.image(), self._animation.offset)
+        return surface
 
     def _change_frame(self):
         self._animation.change_frame()
-        self._redraw()
-
-    def update(self, elapsed_time: Millis):
-        self._periodic_frame_change.update(elapsed_time)
+        self.surface = self._composited_frame()
+        self.mark_dirty()
 
 
 class _ChoiceButton(_Component):
     def __init__(self, font: Font, size: Vec2, text: str, highlighted: bool = False):
-        super().__init__(Surface(size))
-
         self._font = font
+        self._size = size
         self._text = text
         self._highlighted = highlighted
-        self._container_rect = Rect((0, 0), size)
+        super().__init__(self._rendered_button())
 
-        self._redraw()
+    def _rendered_button(self) -> Surface:
+        # The cached surfaces are shared, and are swapped in as they are, so they must never be drawn on
+        return choice_button_cache.get_or_create((self._text, self._font, self._size, self._highlighted), self._render)
 
-    def _redraw(self):
-        self.surface.fill(BLACK)
+    def _render(self) -> Surface:
+        surface = Surface(self._size)
+        container_rect = surface.get_rect()
+        background_color = (60, 60, 60) if self._highlighted else BLACK
         if self._highlighted:
-            self.surface.fill((60, 60, 60), self._container_rect)
-            pygame.draw.rect(self.surface, GREEN, self._container_rect, width=2, border_radius=4)
+            surface.fill(background_color, container_rect)
+            pygame.draw.rect(surface, GREEN, container_rect, width=2, border_radius=4)
         else:
-            pygame.draw.rect(self.surface, WHITE, self._container_rect, width=1, border_radius=4)
-        rendered_text = self._font.render(self._text, True, WHITE)
-        text_position = (self._container_rect.x + (self._container_rect.w - rendered_text.get_width()) // 2,
-                         self._container_rect.y + (self._container_rect.h - rendered_text.get_height()) // 2)
-        self.surface.blit(rendered_text, text_position)
+            pygame.draw.rect(surface, WHITE, container_rect, width=1, border_radius=4)
+        # Rendered onto the button's background color, so that it can be blitted without any alpha blending
+        rendered_text = self._font.render(self._text, True, WHITE, background_color)
+        text_position = (container_rect.x + (container_rect.w - rendered_text.get_width()) // 2,
+                         container_rect.y + (container_rect.h - rendered_text.get_height()) // 2)
+        surface.blit(rendered_text, text_position)
+        return surface
 
     def set_highlighted(self, highlighted: bool):
-        self._highlighted = highlighted
-        self._redraw()
+        if highlighted != self._highlighted:
+            self._highlighted = highlighted
+            self.surface = self._rendered_button()
+            self.mark_dirty()
 
 
 class _TextBox(_Component):
     def __init__(self, font: Font, size: Vec2, text: str, border_color: Vec3, text_color: Vec3,
-        sound_player: SoundPlayer):
+        sound_player: SoundPlayer, scheduler: Scheduler, profiler: NullProfiler = NULL_PROFILER):
         super().__init__(Surface(size))
         self.surface.set_alpha(180)
+        self._profiler = profiler
 
         self._container_rect = Rect((0, 0), size)
         pad = 30
         self._text_area = self._container_rect.inflate(-pad, -pad)
         self._font = font
+        self._line_height = font.get_height()
         self._border_color = border_color
         self._text_color = text_color
         self._sound_player = sound_player
         self._lines = self._split_into_lines(text)
         self._cursor = 0
         self._max_cursor_position = max(0, len(text) - 1)
-        self._periodic_cursor_advance = PeriodicAction(Millis(40), self._advance_cursor)
+        if not self.is_cursor_at_end():
+            self._timers.append(scheduler.call_periodically(Millis(40), self._advance_cursor))
+
+        # The surface keeps everything that has been revealed so far. These track how far into the text it has been
+        # drawn, so that advancing the cursor only needs to render the newly revealed characters.
+        self._drawn_chars = 0
+        self._drawn_line_index = 0
+        self._drawn_chars_in_line = 0
 
         self._redraw()
 
+    def set_profiler(self, profiler: NullProfiler):
+        self._profiler = profiler
+
     def _advance_cursor(self):
         if self._cursor < self._max_cursor_position:
             self._sound_player.play_text_blip()
             self._cursor += 1
-            self._redraw()
-
-    def update(self, elapsed_time: Millis):
-        self._periodic_cursor_advance.update(elapsed_time)
+            self._draw_revealed_text()
+        if self.is_cursor_at_end():
+            self.stop()
 
     def set_cursor_to_end(self):
         self._cursor = self._max_cursor_position
-        self._redraw()
+        self._draw_revealed_text()
+        self.stop()
 
     def is_cursor_at_end(self) -> bool:
         return self._cursor == self._max_cursor_position
 
-    def _split_into_lines(self, text) -> List[str]:
-        return list(layout_text_in_area(text, lambda t: self._font.size(t)[0], self._text_area.width))
+    def _split_into_lines(self, text) -> Sequence[str]:
+        width = self._text_area.width
+        with self._profiler.section("text_layout"):
+            return text_layout_cache.get_or_create(
+                (text, self._font, width),
+                lambda: tuple(layout_text_in_area(text, lambda t: self._font.size(t)[0], width)))
 
     def _redraw(self):
         self.surface.fill(BLACK)
         pygame.draw.rect(self.surface, self._border_color, self._container_rect, width=1, border_radius=2)
-        x, y = self._text_area.topleft
-        num_chars_rendered = 0
-        for line in self._lines:
-            remaining = self._cursor + 1 - num_chars_rendered
-            if remaining <= 0:
-                return
-            part_of_line = line[:remaining]
-            rendered_line = self._font.render(part_of_line, True, self._text_color)
-            self.surface.blit(rendered_line, (x, y))
-            y += rendered_line.get_height()
-            num_chars_rendered += len(part_of_line)
+        self._drawn_chars = 0
+        self._drawn_line_index = 0
+        self._drawn_chars_in_line = 0
+        self._draw_revealed_text()
+
+    def _draw_revealed_text(self):
+        num_chars_to_reveal = self._cursor + 1
+        while self._drawn_chars < num_chars_to_reveal and self._drawn_line_index < len(self._lines):
+            line = self._lines[self._drawn_line_index]
+            start = self._drawn_chars_in_line
+            end = min(len(line), start + num_chars_to_reveal - self._drawn_chars)
+            if end > start:
+                self._draw_line_part(line, start, end)
+            self._drawn_chars += end - start
+            if end == len(line):
+                self._drawn_line_index += 1
+                self._drawn_chars_in_line = 0
+            else:
+                self._drawn_chars_in_line = end
+
+    def _draw_line_part(self, line: str, start: int, end: int):
+        x = self._text_area.x + (self._font.size(line[:start])[0] if start > 0 else 0)
+        y = self._text_area.y + self._drawn_line_index * self._line_height
+        with self._profiler.section("glyph_render"):
+            if start == 0 and end == len(line):
+                # Whole lines are rendered onto the box's black background up front, so that they can be blitted
+                # without alpha blending. Parts of a line keep their transparency, as their glyphs may overlap the
+                # previous part's.
+                rendered_part = rendered_line_cache.get_or_create(
+                    (line, self._font, self._text_color),
+                    lambda: self._font.render(line, True, self._text_color, BLACK))
+            else:
+                rendered_part = self._font.render(line[start:end], True, self._text_color)
+        self.mark_dirty(self.surface.blit(rendered_part, (x, y)))
+
+
+def _add_merged(rects: List[Rect], rect: Rect):
+    """ Add the rect to the list, merging it with any rects that it overlaps so that no area is covered twice """
+    if rect.w <= 0 or rect.h <= 0:
+        return
+    overlapping_index = rect.collidelist(rects)
+    while overlapping_index != -1:
+        rect = rect.union(rects.pop(overlapping_index))
+        overlapping_index = rect.collidelist(rects)
+    rects.append(rect)
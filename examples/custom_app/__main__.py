@@ -85,6 +85,7 @@ def main():
 
         elapsed_time = Millis(clock.tick())
 
+        mouse_position = None
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 _exit_game()
@@ -100,15 +101,21 @@ def main():
                     elif event.key == pygame.K_UP:
                         dialog_component.move_choice_selection(-1)
             elif event.type == pygame.MOUSEBUTTONDOWN:
+                # Motion from before the click must not highlight the buttons of the node that the click leads to
+                mouse_position = None
                 ui_coordinates = translate_screen_to_ui_coordinates(dialog_rect, pygame.mouse.get_pos())
                 if ui_coordinates:
                     dialog_component.commit_choice_at_position(ui_coordinates)
                     if dialog_component.current_node_id() == dialog_closed_node_id:
                         is_dialog_shown = False
             elif event.type == pygame.MOUSEMOTION:
-                ui_coordinates = translate_screen_to_ui_coordinates(dialog_rect, pygame.mouse.get_pos())
-                if ui_coordinates:
-                    dialog_component.select_choice_at_position(ui_coordinates)
+                # Only the latest position matters, so a flood of motion events is handled once per frame
+                mouse_position = event.pos
+
+        if mouse_position is not None:
+            ui_coordinates = translate_screen_to_ui_coordinates(dialog_rect, mouse_position)
+            if ui_coordinates:
+                dialog_component.select_choice_at_position(ui_coordinates)
 
         if is_dialog_shown:
             dialog_component.update(elapsed_time)
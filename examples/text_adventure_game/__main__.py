@@ -49,7 +49,8 @@ def main():
             DialogNode(
                 node_id="EXIT",
                 text="",
-                choices=[]),
+                choices=[],
+                is_ending=True),
         ],
     )
 
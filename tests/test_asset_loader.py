@@ -0,0 +1,114 @@
+import time
+
+import pygame
+import pytest
+
+from assets import AssetLoader
+from constants import Millis
+from graph import DialogGraph, DialogNode, DialogChoice, NodeGraphics
+
+
+def _write_image(filepath):
+    pygame.image.save(pygame.Surface((4, 4)), str(filepath))
+    return filepath
+
+
+def _wait_until_loaded(loader, image_ids, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not loader.is_loaded(image_ids=image_ids):
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.01)
+
+
+def test_load_registered_assets_only_when_needed(tmp_path):
+    loader = AssetLoader((8, 8), num_workers=1)
+    loader.register_image("a", _write_image(tmp_path.joinpath("a.png")))
+    loader.register_image("b", _write_image(tmp_path.joinpath("b.png")))
+    assert "a" in loader.images
+    assert loader.progress() == (0, 0)
+
+    loader.prefetch(image_ids=["a"])
+    _wait_until_loaded(loader, ["a"])
+    assert loader.progress() == (1, 1)
+    assert not loader.is_loaded(image_ids=["b"])
+
+    assert loader.images["a"].get_size() == (8, 8)
+    assert (loader.hits, loader.misses) == (1, 0)
+    assert loader.images["b"].get_size() == (8, 8)
+    assert (loader.hits, loader.misses) == (1, 1)
+    loader.shutdown()
+
+
+def test_prefetch_and_evict_around_current_node(tmp_path, make_dialog_component):
+    loader = AssetLoader((8, 8), num_workers=1)
+    image_ids = ["a", "b", "c", "d"]
+    for image_id in image_ids:
+        loader.register_image(image_id, _write_image(tmp_path.joinpath(f"{image_id}.png")))
+    # A -> B -> C -> D, each node showing its own image
+    graph = DialogGraph("A", [DialogNode(image_id.upper(), "::text::",
+                                         [DialogChoice("::next::", next_id.upper())] if next_id else [],
+                                         NodeGraphics(image_ids=[image_id]))
+                              for image_id, next_id in zip(image_ids, image_ids[1:] + [None])])
+    component = make_dialog_component(graph, loader.images, asset_loader=loader, prefetch_depth=1)
+
+    _wait_until_loaded(loader, ["a", "b"])
+    assert [i for i in image_ids if loader.is_loaded(image_ids=[i])] == ["a", "b"]
+
+    component.skip_text()
+    component.update(Millis(0))
+    component.commit_selected_choice()
+    assert component.current_node_id() == "B"
+    _wait_until_loaded(loader, ["b", "c"])
+    assert [i for i in image_ids if loader.is_loaded(image_ids=[i])] == ["b", "c"]
+    loader.shutdown()
+
+
+def test_evict_registered_assets(tmp_path):
+    loader = AssetLoader((8, 8), num_workers=1)
+    loader.load_image("eager", _write_image(tmp_path.joinpath("eager.png")))
+    loader.register_image("lazy", _write_image(tmp_path.joinpath("lazy.png")))
+    loader.prefetch(image_ids=["lazy"])
+    loader.images["eager"]
+    loader.images["lazy"]
+
+    loader.evict_all_except()
+
+    assert loader.is_loaded(image_ids=["eager"])
+    assert not loader.is_loaded(image_ids=["lazy"])
+    loader.shutdown()
+
+
+def test_report_progress_of_eagerly_loaded_assets(tmp_path):
+    loader = AssetLoader((8, 8), num_workers=1)
+    for image_id in ["a", "b", "c"]:
+        loader.load_image(image_id, _write_image(tmp_path.joinpath(f"{image_id}.png")))
+    assert loader.progress()[1] == 3
+
+    for image_id in ["a", "b", "c"]:
+        loader.images[image_id]
+    assert loader.progress() == (3, 3)
+    assert loader.is_loaded(image_ids=["a", "b", "c"])
+    loader.shutdown()
+
+
+def test_report_errors_from_worker_threads(tmp_path):
+    loader = AssetLoader((8, 8), num_workers=1)
+    loader.load_image("good", _write_image(tmp_path.joinpath("good.png")))
+    loader.load_image("missing", tmp_path.joinpath("missing.png"))
+
+    with pytest.raises(Exception, match="missing.png"):
+        loader.images["missing"]
+    with pytest.raises(Exception, match="missing.png"):
+        loader.raise_first_error()
+    assert loader.images["good"].get_size() == (8, 8)
+    loader.shutdown()
+
+
+def test_combine_animation_frames_once(tmp_path):
+    loader = AssetLoader((8, 8), num_workers=1)
+    loader.load_animation("animation", [_write_image(tmp_path.joinpath(f"{i}.png")) for i in range(3)])
+
+    frames = loader.animations["animation"]
+    assert len(frames) == 3
+    assert loader.animations["animation"] is frames
+    loader.shutdown()
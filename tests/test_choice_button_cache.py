@@ -0,0 +1,20 @@
+import pygame
+
+from ui import _ChoiceButton, choice_button_cache
+
+
+def test_share_rendered_buttons():
+    pygame.font.init()
+    font = pygame.font.Font(None, 15)
+    choice_button_cache.clear()
+
+    first = _ChoiceButton(font, (100, 40), "Next")
+    second = _ChoiceButton(font, (100, 40), "Next")
+    assert second.surface is first.surface
+
+    first.set_highlighted(True)
+    assert first.surface is not second.surface
+    assert first.take_dirty_rects() == [first.surface.get_rect()]
+    first.set_highlighted(False)
+    assert first.surface is second.surface
+    assert len(choice_button_cache) == 2
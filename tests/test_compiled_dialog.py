@@ -0,0 +1,139 @@
+import json
+
+import pytest
+
+from config_file import parse_dialog_from_json, compile_dialog, parse_compiled_dialog, load_dialog_from_file, \
+    save_compiled_dialog, open_compiled_dialog
+
+
+def _describe(dialog_graph):
+    return (dialog_graph.title, dialog_graph.background_image_id, dialog_graph.current_node().node_id,
+            [(n.node_id, n.text, [(c.text, c.leads_to_id) for c in n.choices], n.sound_id, _describe_graphics(n),
+              n.is_ending)
+             for n in dialog_graph.nodes()])
+
+
+def _describe_graphics(node):
+    graphics = node.graphics
+    if graphics is None:
+        return None
+    return graphics.image_ids, graphics.animation_id, graphics.offset, graphics.screen_shake, graphics.instant_text
+
+
+def _round_trip(dialog_graph):
+    return parse_compiled_dialog(compile_dialog(dialog_graph))
+
+
+@pytest.mark.parametrize("filepath", ["examples/animated_dialog/wikipedia.json", "examples/slideshow/dragonball.json"])
+def test_round_trip_example(filepath):
+    with open(filepath) as f:
+        dialog_graph = parse_dialog_from_json(json.load(f))
+    assert _describe(_round_trip(dialog_graph)) == _describe(dialog_graph)
+
+
+@pytest.mark.parametrize("dialog_json", [
+    {"sequence": [["text 1", "image 1"], ["text 2", "image 2"]]},
+    {"graph": {"root": "1", "nodes": [{"id": "1", "text": "text 1", "graphics": {"animation": "animation 1"},
+                                       "choices": []}]}},
+    {
+        "title": "Title ✓",
+        "background_image_id": "background",
+        "graph": {
+            "root": "2",
+            "nodes": [
+                {"id": "1", "text": "", "choices": [["back", "2"], ["stay", "1"]], "sound": "blip"},
+                {"id": "2", "text": "Ünïcödé text 🙂", "choices": [["on", "1"], ["stay", "2"]],
+                 "graphics": {"image": "image", "offset": [-3, 4], "screen_shake": 0, "instant_text": True}},
+                {"id": "3", "text": "unreachable", "choices": [["back", "2"]],
+                 "graphics": {"image": "image", "offset": [-3, 4], "screen_shake": 0, "instant_text": True}},
+                {"id": "4", "text": "the end", "choices": [], "ending": True,
+                 "graphics": {"image": "image", "offset": [-3, 4], "screen_shake": 0, "instant_text": True}},
+            ]
+        }
+    },
+])
+def test_round_trip(dialog_json):
+    dialog_graph = parse_dialog_from_json(dialog_json)
+    compiled = _round_trip(dialog_graph)
+
+    assert _describe(compiled) == _describe(dialog_graph)
+    if dialog_graph.current_node().choices:
+        compiled.make_choice(0)
+        dialog_graph.make_choice(0)
+    assert compiled.current_node().node_id == dialog_graph.current_node().node_id
+
+
+def test_shares_identical_graphics_and_choices():
+    dialog_json = {
+        "graph": {
+            "root": "1",
+            "nodes": [
+                {"id": "1", "text": "text 1", "graphics": {"image": "image"}, "choices": [["back", "1"], ["on", "2"]]},
+                {"id": "2", "text": "text 2", "graphics": {"image": "image"}, "choices": [["back", "1"]]},
+            ]
+        }
+    }
+    first, second = _round_trip(parse_dialog_from_json(dialog_json)).nodes()
+
+    assert first.graphics is second.graphics
+    assert first.choices[0] is second.choices[0]
+
+
+def test_load_from_file(tmp_path):
+    dialog_graph = parse_dialog_from_json({"sequence": [["text 1", "image 1"], ["text 2", "image 2"]]})
+    file_path = str(tmp_path / "sequence.dialog")
+    save_compiled_dialog(dialog_graph, file_path)
+
+    assert _describe(load_dialog_from_file(file_path)) == _describe(dialog_graph)
+
+
+def test_open_lazily(tmp_path):
+    with open("examples/slideshow/dragonball.json") as f:
+        dialog_graph = parse_dialog_from_json(json.load(f))
+    file_path = str(tmp_path / "dragonball.dialog")
+    save_compiled_dialog(dialog_graph, file_path)
+
+    lazy_graph = open_compiled_dialog(file_path, max_cached_nodes=2, verify_checksum=True)
+
+    assert _describe(lazy_graph) == _describe(dialog_graph)
+    for _ in range(5):
+        lazy_graph.make_choice(0)
+        dialog_graph.make_choice(0)
+        assert lazy_graph.current_node().node_id == dialog_graph.current_node().node_id
+    assert len(lazy_graph._node_cache) == 2
+    node_id = dialog_graph.current_node().node_id
+    assert [n.node_id for n in lazy_graph.neighborhood(node_id, 3)] == \
+           [n.node_id for n in dialog_graph.neighborhood(node_id, 3)]
+    for node in dialog_graph.nodes():
+        assert lazy_graph.neighborhood(node.node_id, 0)[0].node_id == node.node_id
+    with pytest.raises(KeyError):
+        lazy_graph.neighborhood("MISSING", 1)
+
+
+def test_reject_corrupt_data():
+    data = bytearray(compile_dialog(parse_dialog_from_json({"sequence": [["text 1", "image 1"], ["text 2", "image 2"]]})))
+    data[-1] ^= 1
+    with pytest.raises(ValueError) as excinfo:
+        parse_compiled_dialog(bytes(data))
+    assert "checksum mismatch" in str(excinfo.value)
+
+
+def test_reject_truncated_data():
+    data = compile_dialog(parse_dialog_from_json({"sequence": [["text 1", "image 1"], ["text 2", "image 2"]]}))
+    with pytest.raises(ValueError) as excinfo:
+        parse_compiled_dialog(data[:-1])
+    assert "checksum mismatch" in str(excinfo.value)
+
+
+def test_reject_other_version():
+    data = bytearray(compile_dialog(parse_dialog_from_json({"sequence": [["text 1", "image 1"], ["text 2", "image 2"]]})))
+    data[4] += 1
+    with pytest.raises(ValueError) as excinfo:
+        parse_compiled_dialog(bytes(data))
+    assert "Unsupported compiled dialog version" in str(excinfo.value)
+
+
+def test_reject_other_file():
+    with pytest.raises(ValueError) as excinfo:
+        parse_compiled_dialog(b'{"sequence": [["text 1", "image 1"], ["text 2", "image 2"]]}')
+    assert "not a compiled dialog file" in str(excinfo.value)
@@ -0,0 +1,48 @@
+import os
+
+import pygame
+import pytest
+
+from assets import convert_for_display
+
+
+@pytest.fixture
+def display():
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    pygame.display.init()
+    yield pygame.display.set_mode((10, 10))
+    pygame.display.quit()
+
+
+def _surface_with_alpha(alphas):
+    surface = pygame.Surface((len(alphas), 1), pygame.SRCALPHA)
+    for x, alpha in enumerate(alphas):
+        surface.set_at((x, 0), (10, 20, 30, alpha))
+    return surface
+
+
+def test_unchanged_without_display():
+    # An earlier test may have left a display mode set
+    pygame.display.quit()
+    surface = _surface_with_alpha([255, 0])
+    assert convert_for_display(surface) is surface
+
+
+def test_drop_alpha_of_opaque_surface(display):
+    converted = convert_for_display(_surface_with_alpha([255, 255]))
+    assert not converted.get_flags() & pygame.SRCALPHA
+    assert converted.get_colorkey() is None
+    assert converted.get_bitsize() == display.get_bitsize()
+
+
+def test_use_colorkey_for_binary_alpha(display):
+    converted = convert_for_display(_surface_with_alpha([255, 0]))
+    assert not converted.get_flags() & pygame.SRCALPHA
+    assert converted.get_flags() & pygame.RLEACCELOK
+    assert converted.get_at((0, 0))[:3] == (10, 20, 30)
+    assert converted.get_at((1, 0))[:3] == converted.get_colorkey()[:3]
+
+
+def test_keep_alpha_of_translucent_surface(display):
+    converted = convert_for_display(_surface_with_alpha([255, 128]))
+    assert converted.get_flags() & pygame.SRCALPHA
@@ -0,0 +1,51 @@
+import pygame
+import pytest
+
+from constants import Millis
+from graph import DialogNode, DialogChoice, NodeGraphics, LazyDialogGraph, NodeSource
+
+
+class _CountingSource(NodeSource):
+    """ A chain of nodes, counting how many times a node is decoded """
+
+    def __init__(self, image_ids):
+        self._image_ids = image_ids
+        self.num_decoded = 0
+
+    def __len__(self):
+        return len(self._image_ids)
+
+    def root_node_index(self):
+        return 0
+
+    def node(self, index):
+        self.num_decoded += 1
+        choices = [DialogChoice("::next::", str(index + 1))] if index + 1 < len(self) else []
+        return DialogNode(str(index), "::text::", choices, NodeGraphics(image_ids=[self._image_ids[index]]))
+
+    def choice_targets(self, index):
+        return [index + 1] if index + 1 < len(self) else []
+
+    def index_of(self, node_id):
+        return int(node_id)
+
+
+def _commit_first_choice(component):
+    component.skip_text()
+    component.update(Millis(0))
+    component.commit_selected_choice()
+
+
+def test_lazy_graph_is_not_decoded_up_front(make_dialog_component):
+    source = _CountingSource(["image"] * 10_000)
+    component = make_dialog_component(LazyDialogGraph(source), {"image": pygame.Surface((8, 8))})
+    _commit_first_choice(component)
+    assert component.current_node_id() == "1"
+    assert source.num_decoded < 10
+
+
+def test_lazy_graph_nodes_are_validated_when_reached(make_dialog_component):
+    source = _CountingSource(["image", "missing"])
+    component = make_dialog_component(LazyDialogGraph(source), {"image": pygame.Surface((8, 8))})
+    with pytest.raises(ValueError, match="Graph node '1' refers to missing image: 'missing'"):
+        _commit_first_choice(component)
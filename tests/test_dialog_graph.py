@@ -1,3 +1,6 @@
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
 
 from graph import DialogGraph, DialogNode, DialogChoice, NodeGraphics
@@ -37,3 +40,73 @@ def test_state_after_making_choice():
     graph = DialogGraph("START", [first_node, second_node])
     graph.make_choice(0)
     assert graph.current_node() == second_node
+
+
+def test_neighborhood():
+    graph = DialogGraph("A", [
+        DialogNode("A", "::text::", [DialogChoice("::text::", "B"), DialogChoice("::text::", "C")]),
+        DialogNode("B", "::text::", [DialogChoice("::text::", "D"), DialogChoice("::text::", "A")]),
+        DialogNode("C", "::text::", [DialogChoice("::text::", "D")]),
+        DialogNode("D", "::text::", [DialogChoice("::text::", "E")]),
+        DialogNode("E", "::text::", []),
+    ])
+    assert [n.node_id for n in graph.neighborhood("A", 0)] == ["A"]
+    assert [n.node_id for n in graph.neighborhood("A", 2)] == ["A", "B", "C", "D"]
+    assert [n.node_id for n in graph.neighborhood("C", 5)] == ["C", "D", "E"]
+
+
+def _cycle_graph(num_nodes: int) -> DialogGraph:
+    return DialogGraph("0", [DialogNode(str(i), "::text::", [DialogChoice("::next::", str((i + 1) % num_nodes)),
+                                                             DialogChoice("::start::", "0")])
+                             for i in range(num_nodes)])
+
+
+def test_sessions_are_independent():
+    graph = _cycle_graph(5)
+    first = graph.new_session()
+    second = graph.new_session()
+    first.make_choice(0)
+    first.make_choice(0)
+    second.make_choice(0)
+    assert first.current_node().node_id == "2"
+    assert second.current_node().node_id == "1"
+    assert graph.current_node().node_id == "0"
+
+
+def test_session_history():
+    session = _cycle_graph(5).new_session()
+    assert not session.can_go_back()
+    session.make_choice(0)
+    session.make_choice(0)
+    session.make_choice(1)
+    assert session.history() == ["0", "1", "2"]
+    session.go_back()
+    assert session.current_node().node_id == "2"
+    assert session.history() == ["0", "1"]
+    session.restart()
+    assert session.current_node().node_id == "0"
+    assert not session.can_go_back()
+    with pytest.raises(ValueError):
+        session.go_back()
+
+
+def test_session_history_is_bounded():
+    session = _cycle_graph(100).new_session(max_history=3)
+    for _ in range(50):
+        session.make_choice(0)
+    assert session.history() == ["47", "48", "49"]
+    assert sys.getsizeof(session) + sys.getsizeof(session._history) < 300
+
+
+def test_concurrent_sessions_share_graph():
+    graph = _cycle_graph(7)
+
+    def walk(num_steps: int) -> str:
+        session = graph.new_session()
+        for _ in range(num_steps):
+            session.make_choice(0)
+        return session.current_node().node_id
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(walk, range(1000)))
+    assert results == [str(steps % 7) for steps in range(1000)]
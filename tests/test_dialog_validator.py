@@ -0,0 +1,92 @@
+import json
+import shutil
+
+import pygame
+
+from runners.dialog_validator import validate_file, validate_files, find_dialog_files
+
+
+def _write_dialog(path, nodes, **fields):
+    path.write_text(json.dumps({"graph": {"root": nodes[0]["id"], "nodes": nodes}, **fields}))
+    return str(path)
+
+
+def test_valid_example():
+    report = validate_file("examples/animated_dialog/wikipedia.json")
+    assert report.errors == []
+    assert report.num_nodes == 8
+
+
+def test_report_all_problems(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    pygame.image.save(pygame.Surface((4, 4)), str(data_dir / "fine.png"))
+    (data_dir / "corrupt.png").write_bytes(b"not an image")
+    (data_dir / "empty_animation").mkdir()
+    shutil.copy("examples/animated_dialog/data/applause.ogg", data_dir / "applause.ogg")
+    file_path = _write_dialog(tmp_path / "dialog.json", [
+        {"id": "1", "text": "", "choices": [["on", "2"]], "graphics": {"image": "fine.png"}, "sound": "applause.ogg"},
+        {"id": "2", "text": "", "choices": [["on", "3"]], "graphics": {"image": "missing.png"}},
+        {"id": "3", "text": "", "choices": [["on", "4"]], "graphics": {"image": "missing.png"}},
+        {"id": "4", "text": "", "choices": [["on", "5"]], "graphics": {"image": "corrupt.png"}, "sound": "none.ogg"},
+        {"id": "5", "text": "", "choices": [], "graphics": {"animation": "empty_animation"}},
+        {"id": "6", "text": "", "choices": []},
+    ], background_image_id="fine.png")
+
+    report = validate_file(file_path)
+
+    assert report.num_nodes == 6
+    assert len(report.errors) == 5
+    assert report.errors[0] == "Graph node '6' has no graphics"
+    assert any(e.startswith("Graph node '2' and 1 other nodes: Missing image") for e in report.errors)
+    assert any(e.startswith("Graph node '4': Failed to decode image") for e in report.errors)
+    assert any(e.startswith("Graph node '4': Missing sound") for e in report.errors)
+    assert any(e.startswith("Graph node '5': Animation directory has no frames") for e in report.errors)
+    assert report.warnings == ["Unreachable nodes (1): 6", "Dead ends (no choices, not marked as ending) (2): 5, 6"]
+
+
+def test_report_all_structural_problems(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    pygame.image.save(pygame.Surface((4, 4)), str(data_dir / "fine.png"))
+    graphics = {"image": "fine.png"}
+    file_path = tmp_path / "dialog.json"
+    file_path.write_text(json.dumps({"graph": {"root": "START", "nodes": [
+        {"id": "1", "text": "", "choices": [["on", "2"], ["on", "X"]], "graphics": graphics},
+        {"id": "1", "text": "", "choices": [["on", "Y"]], "graphics": graphics},
+        {"id": "2", "choices": [], "graphics": graphics},
+        {"id": "3", "text": "", "choices": [["on", "Z"], ["on", "W"]], "graphics": {"image": "missing.png"}},
+    ]}}))
+
+    report = validate_file(str(file_path))
+
+    assert report.num_nodes == 3
+    assert report.errors[:8] == [
+        "Failed to load dialog: Invalid config for graph node #2: missing 'text'",
+        "Failed to load dialog: Duplicate node ID found: 1",
+        "Failed to load dialog: Graph node '1': Dialog choice leading to missing node: 2",
+        "Failed to load dialog: Graph node '1': Dialog choice leading to missing node: X",
+        "Failed to load dialog: Graph node '1': Dialog choice leading to missing node: Y",
+        "Failed to load dialog: Graph node '3': Dialog choice leading to missing node: Z",
+        "Failed to load dialog: Graph node '3': Dialog choice leading to missing node: W",
+        "Failed to load dialog: No node found with ID: START",
+    ]
+    assert report.errors[8].startswith("Graph node '3': Missing image")
+    assert len(report.errors) == 9
+    assert report.warnings == []
+
+
+def test_validate_directory_in_parallel(tmp_path):
+    (tmp_path / "nested").mkdir()
+    _write_dialog(tmp_path / "nested" / "broken.json", [{"id": "1", "text": "", "choices": [["on", "MISSING"]]}])
+    (tmp_path / "not_a_dialog.txt").write_text("")
+    shutil.copy("examples/animated_dialog/wikipedia.json", tmp_path / "wikipedia.json")
+    shutil.copytree("examples/animated_dialog/data", tmp_path / "data")
+
+    file_paths = find_dialog_files([str(tmp_path)])
+    reports = validate_files(file_paths, num_workers=2)
+
+    assert [r.file_path for r in reports] == [str(tmp_path / "nested" / "broken.json"), str(tmp_path / "wikipedia.json")]
+    assert reports[0].errors == ["Failed to load dialog: Graph node '1': Dialog choice leading to missing node: MISSING",
+                                 "Graph node '1' has no graphics"]
+    assert reports[1].errors == []
@@ -0,0 +1,83 @@
+import pygame
+import pytest
+from pygame.event import Event
+
+from constants import Millis
+from graph import DialogGraph, DialogNode, DialogChoice, NodeGraphics
+from runners.dialog_app import App, _wait_for_events
+from sound import SoundPlayer
+
+
+class _FakeEventQueue:
+    """ Stands in for pygame.event.wait/get, recording how long the app asked to wait """
+
+    def __init__(self, events):
+        self.events = events
+        self.waits = []
+
+    def wait(self, *timeout):
+        self.waits.append(timeout[0] if timeout else None)
+        return self.events.pop(0) if self.events else Event(pygame.NOEVENT)
+
+    def get(self):
+        events, self.events = self.events, []
+        return events
+
+
+def test_wait_until_timeout_or_input():
+    queue = _FakeEventQueue([Event(pygame.KEYDOWN, key=pygame.K_SPACE), Event(pygame.KEYDOWN, key=pygame.K_UP)])
+    events = _wait_for_events(Millis(30), queue.wait, queue.get)
+    assert queue.waits == [30]
+    assert [e.key for e in events] == [pygame.K_SPACE, pygame.K_UP]
+
+
+def test_drop_no_event_after_timeout():
+    queue = _FakeEventQueue([])
+    assert _wait_for_events(Millis(30), queue.wait, queue.get) == []
+
+
+def test_dont_wait_when_update_is_due():
+    queue = _FakeEventQueue([])
+    assert _wait_for_events(Millis(0), queue.wait, queue.get) == []
+    assert queue.waits == []
+
+
+def test_wait_for_input_once_dialog_is_idle(make_dialog_component):
+    graph = DialogGraph("A", [DialogNode("A", "Some text that takes a while to appear",
+                                         [DialogChoice("::text::", "A")], NodeGraphics(image_ids=["image"]))])
+    component = make_dialog_component(graph, {"image": pygame.Surface((8, 8))})
+    queue = _FakeEventQueue([])
+
+    # While the text appears, the app only sleeps until the next character is due
+    timeout = component.time_until_update()
+    assert timeout is not None and timeout > 0
+    _wait_for_events(timeout, queue.wait, queue.get)
+
+    component.skip_text()
+    for _ in range(3):
+        component.update(Millis(100))
+    assert component.time_until_update() is None
+    _wait_for_events(component.time_until_update(), queue.wait, queue.get)
+    assert queue.waits == [timeout, None]
+
+
+class _StopApp(Exception):
+    pass
+
+
+def test_first_frame_is_shown_before_waiting(monkeypatch):
+    pygame.font.init()
+    graph = DialogGraph("A", [DialogNode("A", "::text::", [], NodeGraphics(image_ids=["image"]))])
+    app = App(pygame.Surface((500, 500)), pygame.font.Font(None, 15), pygame.font.Font(None, 15),
+              {"image": pygame.Surface((8, 8))}, {}, SoundPlayer({}, None), graph, "blip", event_driven=True)
+    display_updates = []
+    monkeypatch.setattr(pygame.display, "update", lambda *rects: display_updates.append(rects))
+
+    def wait_for_events():
+        # The app would block here in pygame.event.wait()
+        assert display_updates
+        raise _StopApp()
+
+    monkeypatch.setattr(app, "_handle_events", wait_for_events)
+    with pytest.raises(_StopApp):
+        app.run()
@@ -1,5 +1,7 @@
+import io
+
 from graph import DialogGraph, DialogNode, DialogChoice, NodeGraphics
-from runners.graph_visualizer import generate_graphviz
+from runners.graph_visualizer import generate_graphviz, write_dot
 
 
 def test_simple_graphviz():
@@ -18,3 +20,63 @@ def test_simple_graphviz():
         '\tROOT_NODE -> OTHER_NODE [label="Choice text"]',
         '\tOTHER_NODE [label="Other text"]'
     }
+
+
+def _write_dot(dialog_graph, **options):
+    out = io.StringIO()
+    num_nodes = write_dot(dialog_graph, out, "name", **options)
+    lines = out.getvalue().split("\n")
+    assert lines[0] == 'digraph "name" {'
+    assert lines[-2:] == ["}", ""]
+    return num_nodes, [line.strip() for line in lines[4:-2]]
+
+
+def _chain_graph():
+    # A -> B -> C -> D, where D branches to A and E
+    return DialogGraph("A", [
+        DialogNode("A", "a", [DialogChoice("1", "B")]),
+        DialogNode("B", "b", [DialogChoice("2", "C")]),
+        DialogNode("C", "c", [DialogChoice("3", "D")]),
+        DialogNode("D", "d", [DialogChoice("back", "A"), DialogChoice("on", "x.E")]),
+        DialogNode("x.E", 'say "hi"', [DialogChoice("end", "x.F")]),
+        DialogNode("x.F", "f", [DialogChoice("again", "x.E")]),
+    ])
+
+
+def test_write_dot():
+    num_nodes, lines = _write_dot(_chain_graph())
+
+    assert num_nodes == 6
+    assert lines[:3] == ['"A" [label="a"]', '"A" -> "B" [label="1"]', '"B" [label="b"]']
+    assert '"x.E" [label="say \\"hi\\""]' in lines
+    assert len(lines) == 13
+
+
+def test_write_dot_neighborhood():
+    num_nodes, lines = _write_dot(_chain_graph(), focus_node_id="C", max_choices=1)
+
+    assert num_nodes == 2
+    assert lines == ['"C" [label="c" color="#FFCC88"]',
+                     '"C" -> "D" [label="3"]',
+                     '"D" [label="d" style="filled,dashed" penwidth=2]']
+
+
+def test_write_dot_collapse_chains():
+    num_nodes, lines = _write_dot(_chain_graph(), collapse_chains=True)
+
+    assert num_nodes == 2
+    assert lines == ['"A" [label="a\\n\\n[2 more nodes]\\n\\nd"]',
+                     '"A" -> "A" [label="back"]',
+                     '"A" -> "x.E" [label="on"]',
+                     '"x.E" [label="say \\"hi\\"\\n\\nf"]',
+                     '"x.E" -> "x.E" [label="again"]']
+
+
+def test_write_dot_clusters():
+    num_nodes, lines = _write_dot(_chain_graph(), cluster_separator=".", max_nodes=5)
+
+    assert num_nodes == 5
+    assert lines[4:7] == ['subgraph cluster_1 {', 'label="x"', '"x.E" [label="say \\"hi\\"" style="filled,dashed" '
+                                                                 'penwidth=2]']
+    assert lines[7] == "}"
+    assert '"x.E" -> "x.F" [label="end"]' not in lines
@@ -0,0 +1,54 @@
+from analysis import analyze_graph, strongly_connected_components, reachable_from
+from graph import DialogGraph, DialogNode, DialogChoice
+
+
+def _node(node_id, *targets, is_ending=False):
+    return DialogNode(node_id, "::text::", [DialogChoice("::text::", target) for target in targets],
+                      is_ending=is_ending)
+
+
+def test_analyze_graph():
+    graph = DialogGraph("A", [
+        _node("A", "B", "C"),
+        _node("B", "A"),
+        _node("C", "C", "D", "E"),
+        _node("D"),
+        _node("E", is_ending=True),
+        _node("F", "E"),
+        _node("G", is_ending=True),
+        _node("H", "I"),
+        _node("I", "H"),
+    ])
+    graph.make_choice(1)
+
+    analysis = analyze_graph(graph)
+
+    assert analysis.num_nodes == 9
+    assert analysis.num_choices == 9
+    assert analysis.unreachable_node_ids == ["F", "G", "H", "I"]
+    assert analysis.dead_end_node_ids == ["D"]
+    assert analysis.unreachable_ending_ids == ["G"]
+    assert sorted(sorted(cycle) for cycle in analysis.cycles) == [["A", "B"], ["C"], ["H", "I"]]
+    assert analysis.num_strongly_connected_components == 7
+    assert analysis.has_problems()
+
+
+def test_analyze_graph_without_problems():
+    graph = DialogGraph("A", [_node("A", "B"), _node("B", "A", "C"), _node("C", is_ending=True)])
+
+    analysis = analyze_graph(graph)
+
+    assert not analysis.has_problems()
+    assert analysis.cycles == [["A", "B"]]
+    assert "3 nodes, 3 choices" in analysis.summary()
+
+
+def test_long_chain_does_not_recurse():
+    num_nodes = 100_000
+    graph = DialogGraph("0", [_node(str(i), str((i + 1) % num_nodes)) for i in range(num_nodes)])
+    choice_offsets, choice_targets = graph.adjacency()
+
+    component_of, num_components = strongly_connected_components(choice_offsets, choice_targets)
+
+    assert num_components == 1
+    assert all(reachable_from(choice_offsets, choice_targets, 0))
@@ -0,0 +1,106 @@
+import json
+import time
+
+from config_file import parse_dialog_from_json
+from runners.graph_visualizer import render_graph, watch, RenderOptions
+
+
+def _fake_render(engine, output_format, filepath):
+    """ Stands in for graphviz.render, which needs graphviz to be installed. Copies the DOT text to the output. """
+    output_filepath = f"{filepath}.{output_format}"
+    with open(filepath) as source, open(output_filepath, "w") as output:
+        output.write(source.read())
+    return output_filepath
+
+
+def _dialog_json(text):
+    return {"graph": {"root": "1", "nodes": [{"id": "1", "text": text, "choices": []}]}}
+
+
+class _CountingRender:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+        return _fake_render(*args)
+
+
+def test_unchanged_graph_is_not_rendered_again(tmp_path):
+    render = _CountingRender()
+
+    first = render_graph(parse_dialog_from_json(_dialog_json("text")), "name", RenderOptions(), tmp_path, render)
+    second = render_graph(parse_dialog_from_json(_dialog_json("text")), "name", RenderOptions(), tmp_path, render)
+
+    assert render.count == 1
+    assert first == second == tmp_path / "name.pdf"
+    assert '"1" [label="text"]' in first.read_text()
+
+
+def test_changed_graph_or_options_are_rendered_again(tmp_path):
+    render = _CountingRender()
+
+    render_graph(parse_dialog_from_json(_dialog_json("text")), "name", RenderOptions(), tmp_path, render)
+    render_graph(parse_dialog_from_json(_dialog_json("other text")), "name", RenderOptions(), tmp_path, render)
+    render_graph(parse_dialog_from_json(_dialog_json("other text")), "name", RenderOptions(output_format="svg"),
+                 tmp_path, render)
+
+    assert render.count == 3
+    assert '"1" [label="other text"]' in (tmp_path / "name.pdf").read_text()
+    assert not list(tmp_path.glob("*.partial"))
+
+
+def test_reordered_graph_is_not_rendered_again(tmp_path):
+    render = _CountingRender()
+    nodes = [{"id": "1", "text": "first", "choices": [["a", "1"], ["b", "2"]]},
+             {"id": "2", "text": "second", "choices": [["c", "1"]]}]
+    reordered_nodes = [{"id": "2", "text": "second", "choices": [["c", "1"]]},
+                       {"id": "1", "text": "first", "choices": [["b", "2"], ["a", "1"]]}]
+
+    render_graph(parse_dialog_from_json({"graph": {"root": "1", "nodes": nodes}}), "name", RenderOptions(), tmp_path,
+                 render)
+    render_graph(parse_dialog_from_json({"graph": {"root": "1", "nodes": reordered_nodes}}), "name", RenderOptions(),
+                 tmp_path, render)
+
+    assert render.count == 1
+    assert not list(tmp_path.glob("*.partial"))
+
+
+def _wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.02)
+
+
+def test_watch_renders_again_when_file_changes(tmp_path):
+    dialog_filepath = tmp_path / "dialog.json"
+    dialog_filepath.write_text(json.dumps(_dialog_json("before")))
+    output_filepath = tmp_path / "out" / "dialog.json.pdf"
+
+    process = watch(str(dialog_filepath), RenderOptions(), tmp_path / "out", 0.02, _fake_render)
+    try:
+        _wait_for(lambda: output_filepath.exists() and "before" in output_filepath.read_text())
+        dialog_filepath.write_text(json.dumps(_dialog_json("after")))
+        _wait_for(lambda: "after" in output_filepath.read_text())
+    finally:
+        # Not terminate(), as the process inherits the SIGTERM handler of SDL if pygame has been initialized
+        process.kill()
+        process.join()
+
+
+def test_watch_survives_file_being_replaced(tmp_path):
+    dialog_filepath = tmp_path / "dialog.json"
+    dialog_filepath.write_text(json.dumps(_dialog_json("before")))
+    output_filepath = tmp_path / "out" / "dialog.json.pdf"
+
+    process = watch(str(dialog_filepath), RenderOptions(), tmp_path / "out", 0.02, _fake_render)
+    try:
+        _wait_for(lambda: output_filepath.exists() and "before" in output_filepath.read_text())
+        dialog_filepath.unlink()
+        time.sleep(0.1)
+        dialog_filepath.write_text(json.dumps(_dialog_json("after")))
+        _wait_for(lambda: "after" in output_filepath.read_text())
+    finally:
+        process.kill()
+        process.join()
@@ -0,0 +1,58 @@
+import pytest
+
+from cache import LruCache
+
+
+def test_evict_least_recently_used_entry():
+    cache = LruCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert "a" in cache
+    assert "b" not in cache
+    assert "c" in cache
+    assert cache.evictions == 1
+
+
+def test_evict_over_byte_limit():
+    cache = LruCache(max_bytes=10, size_of=len)
+    cache.put("a", "xxxx")
+    cache.put("b", "yyyy")
+    cache.put("c", "zzzz")
+    assert len(cache) == 2
+    assert cache.num_bytes == 8
+
+
+def test_count_hits_and_misses():
+    cache = LruCache(max_entries=10)
+    assert cache.get_or_create("a", lambda: 1) == 1
+    assert cache.get_or_create("a", lambda: 2) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.hit_rate() == 0.5
+
+
+def test_shrinking_limits_evicts():
+    cache = LruCache(max_entries=10)
+    for i in range(10):
+        cache.put(i, i)
+    cache.set_limits(max_entries=3)
+    assert len(cache) == 3
+    assert 9 in cache
+
+
+def test_reject_byte_limit_without_size_function():
+    with pytest.raises(ValueError):
+        LruCache(max_bytes=10)
+
+
+def test_set_limits_keeps_limits_that_are_not_given():
+    cache = LruCache(max_entries=10, max_bytes=10, size_of=len)
+    cache.set_limits(max_entries=5)
+    for key in "abcd":
+        cache.put(key, "xxxx")
+    assert len(cache) == 2
+    cache.set_limits(max_bytes=None)
+    for key in "abcdef":
+        cache.put(key, "xxxx")
+    assert len(cache) == 5
@@ -21,11 +21,11 @@ def test_load_simple_sequence():
     dialog_graph = parse_dialog_from_json(dialog_json)
 
     assert dialog_graph.current_node().text == "text 1"
-    assert dialog_graph.current_node().graphics.image_ids == ["image 1"]
+    assert dialog_graph.current_node().graphics.image_ids == ("image 1",)
     assert dialog_graph.current_node().choices[0].text == "Next"
     dialog_graph.make_choice(0)
     assert dialog_graph.current_node().text == "text 2"
-    assert dialog_graph.current_node().graphics.image_ids == ["image 2"]
+    assert dialog_graph.current_node().graphics.image_ids == ("image 2",)
     assert dialog_graph.current_node().choices[0].text == "Play from beginning"
 
 
@@ -70,11 +70,11 @@ def test_load_graph():
     dialog_graph = parse_dialog_from_json(dialog_json)
 
     assert dialog_graph.current_node().text == "text 1"
-    assert dialog_graph.current_node().graphics.image_ids == ["image 1"]
+    assert dialog_graph.current_node().graphics.image_ids == ("image 1",)
     assert [c.text for c in dialog_graph.current_node().choices] == ["stay here", "go next"]
     dialog_graph.make_choice(1)
     assert dialog_graph.current_node().text == "text 2"
-    assert dialog_graph.current_node().graphics.image_ids == ["image 2"]
+    assert dialog_graph.current_node().graphics.image_ids == ("image 2",)
     assert [c.text for c in dialog_graph.current_node().choices] == ["go back"]
 
 
@@ -99,3 +99,34 @@ def test_load_graph_with_animation():
     assert dialog_graph.current_node().text == "text 1"
     assert dialog_graph.current_node().graphics.animation_id == "animation 1"
     assert dialog_graph.current_node().choices == []
+
+
+def test_share_identical_graphics_and_choices():
+    dialog_json = {
+        "graph": {
+            "root": "1",
+            "nodes": [
+                {"id": "1", "text": "text 1", "graphics": {"image": "image"}, "choices": [["back", "1"], ["on", "2"]]},
+                {"id": "2", "text": "text 2", "graphics": {"image": "image"}, "choices": [["back", "1"]]},
+            ]
+        }
+    }
+    first, second = parse_dialog_from_json(dialog_json).nodes()
+
+    assert first.graphics is second.graphics
+    assert first.choices[0] is second.choices[0]
+    assert first.choices[1].leads_to_id is second.node_id
+
+
+def test_load_graph_with_integer_ids():
+    dialog_graph = parse_dialog_from_json(
+        {"graph": {"root": 1, "nodes": [{"id": 1, "text": "x", "choices": [["again", 1]]}]}})
+
+    assert dialog_graph.current_node().node_id == 1
+    dialog_graph.make_choice(0)
+    assert dialog_graph.current_node().node_id == 1
+
+
+def test_integer_choice_leading_to_missing_node():
+    with pytest.raises(ValueError, match="Dialog choice leading to missing node: 2"):
+        parse_dialog_from_json({"graph": {"root": "1", "nodes": [{"id": "1", "text": "x", "choices": [["go", 2]]}]}})
@@ -0,0 +1,67 @@
+import io
+import json
+
+import pytest
+
+from config_file import parse_dialog_from_json, parse_dialog_from_stream, _JsonReader, _parse_dialog_stream
+
+
+def _describe(dialog_graph):
+    return (dialog_graph.title, dialog_graph.background_image_id, dialog_graph.current_node().node_id,
+            [(n.node_id, n.text, [(c.text, c.leads_to_id) for c in n.choices], n.sound_id, n.graphics.image_ids,
+              n.graphics.animation_id, n.graphics.offset, n.graphics.screen_shake, n.graphics.instant_text)
+             for n in dialog_graph.nodes()])
+
+
+@pytest.mark.parametrize("filepath", ["examples/animated_dialog/wikipedia.json", "examples/slideshow/dragonball.json"])
+def test_same_result_as_json_parser(filepath):
+    with open(filepath) as f:
+        text = f.read()
+    # A tiny chunk size, so that values are cut off at the end of the buffer all the time
+    streamed = _parse_dialog_stream(_JsonReader(io.StringIO(text), chunk_size=7))
+    assert _describe(streamed) == _describe(parse_dialog_from_json(json.loads(text)))
+
+
+def test_keys_in_any_order():
+    text = '{"graph": {"nodes": [{"id": "1", "text": "text 1", "choices": [["again", "1"]], ' \
+           '"graphics": {"image": "image 1", "offset": [1, 2]}}], "root": "1"}, "title": "title", "other": 3.25}'
+    streamed = _parse_dialog_stream(_JsonReader(io.StringIO(text), chunk_size=5))
+    assert _describe(streamed) == _describe(parse_dialog_from_json(json.loads(text)))
+
+
+@pytest.mark.parametrize("text", [
+    '{}',
+    '{"graph": {"root": "1", "nodes": [{"id": "1", "text": "text", "choices": [["go", "2"]]}]}}',
+    '{"graph": {"nodes": []}}',
+    '{"graph": {"root": "1", "nodes": [{"id": "1"}]}}',
+    '{"graph": {"root": "1", "nodes": [{"id": "1"}, ]}}',
+    '{"graph": {"nodes": [{"id": "1"}]}}',
+    '{"graph": {"nodes": [{"id": "1"}], "root": "1"}, "title": "title",}',
+    '{"graph": {"root": "1", "nodes": [{"id": "1", "text": "text", "choices": []}, ]}}',
+    '{"graph": [1, 2]}',
+    '[]',
+])
+def test_same_errors_as_json_parser(text):
+    with pytest.raises(Exception) as expected:
+        parse_dialog_from_json(json.loads(text))
+    with pytest.raises(Exception) as actual:
+        parse_dialog_from_stream(io.StringIO(text))
+    assert (type(actual.value), str(actual.value)) == (type(expected.value), str(expected.value))
+
+
+class _CountingStream(io.StringIO):
+    def __init__(self, text):
+        super().__init__(text)
+        self.num_seeks = 0
+
+    def seek(self, *args):
+        self.num_seeks += 1
+        return super().seek(*args)
+
+
+def test_invalid_dialog_is_not_decoded_again():
+    stream = _CountingStream(
+        '{"graph": {"root": "1", "nodes": [{"id": "1", "text": "text", "choices": [["go", "2"]]}]}}')
+    with pytest.raises(ValueError, match="Dialog choice leading to missing node: 2"):
+        parse_dialog_from_stream(stream)
+    assert stream.num_seeks == 0
@@ -0,0 +1,97 @@
+import pygame
+from pygame.surface import Surface
+
+from constants import Millis
+from timing import Scheduler
+from ui import _Animation, _Picture, picture_frame_cache, MAX_CACHED_ANIMATION_FRAMES
+
+
+def _filled_surface(size, color):
+    surface = Surface(size)
+    surface.fill(color)
+    return surface
+
+
+def test_composite_background_and_frame():
+    picture_frame_cache.clear()
+    background = _filled_surface((8, 8), (0, 0, 100))
+    frames = [_filled_surface((2, 2), (200, 0, 0)), _filled_surface((2, 2), (0, 200, 0))]
+    picture = _Picture((8, 8), background, "bg", _Animation(frames, (1, 1), "anim"), Scheduler())
+
+    assert picture.surface.get_at((0, 0))[:3] == (0, 0, 100)
+    assert picture.surface.get_at((1, 1))[:3] == (200, 0, 0)
+
+
+def test_reuse_composited_frames():
+    picture_frame_cache.clear()
+    background = _filled_surface((8, 8), (0, 0, 100))
+    frames = [_filled_surface((2, 2), (200, 0, 0)), _filled_surface((2, 2), (0, 200, 0))]
+    scheduler = Scheduler()
+    picture = _Picture((8, 8), background, "bg", _Animation(frames, (1, 1), "anim"), scheduler)
+    first_frame = picture.surface
+
+    scheduler.update(Millis(130))
+    assert picture.surface.get_at((1, 1))[:3] == (0, 200, 0)
+    scheduler.update(Millis(130))
+    assert picture.surface is first_frame
+
+    other_picture = _Picture((8, 8), background, "bg", _Animation(frames, (1, 1), "anim"), Scheduler())
+    assert other_picture.surface is first_frame
+    assert len(picture_frame_cache) == 2
+
+
+def test_skip_missed_frames_after_stall():
+    picture_frame_cache.clear()
+    background = _filled_surface((8, 8), (0, 0, 100))
+    frames = [_filled_surface((2, 2), (i * 10, 0, 0)) for i in range(20)]
+    scheduler = Scheduler()
+    _Picture((8, 8), background, "bg", _Animation(frames, (1, 1), "anim"), scheduler)
+
+    scheduler.update(Millis(130 * 15))
+    assert len(picture_frame_cache) == 2
+
+
+def test_accept_offset_given_as_list():
+    picture_frame_cache.clear()
+    background = _filled_surface((8, 8), (0, 0, 100))
+    picture = _Picture((8, 8), background, "bg", _Animation([_filled_surface((2, 2), (200, 0, 0))], [3, 3], "anim"),
+                       Scheduler())
+    assert picture.surface.get_at((3, 3))[:3] == (200, 0, 0)
+
+
+def test_dont_share_frames_between_namespaces():
+    picture_frame_cache.clear()
+    first = _Picture((8, 8), _filled_surface((8, 8), (0, 0, 100)), "bg",
+                     _Animation([_filled_surface((2, 2), (200, 0, 0))], (1, 1), "anim"), Scheduler(), 1)
+    second = _Picture((8, 8), _filled_surface((8, 8), (0, 100, 0)), "bg",
+                      _Animation([_filled_surface((2, 2), (0, 0, 200))], (1, 1), "anim"), Scheduler(), 2)
+    assert first.surface.get_at((0, 0))[:3] == (0, 0, 100)
+    assert second.surface.get_at((0, 0))[:3] == (0, 100, 0)
+    assert second.surface.get_at((1, 1))[:3] == (0, 0, 200)
+
+
+def test_composite_long_animation_into_own_buffer():
+    picture_frame_cache.clear()
+    frames = [_filled_surface((2, 2), (i, 0, 0)) for i in range(MAX_CACHED_ANIMATION_FRAMES + 1)]
+    scheduler = Scheduler()
+    picture = _Picture((8, 8), None, None, _Animation(frames, (1, 1), "anim"), scheduler)
+    first_frame = picture.surface
+
+    scheduler.update(Millis(130))
+    assert picture.surface is first_frame
+    assert picture.surface.get_at((1, 1))[:3] == (1, 0, 0)
+    assert len(picture_frame_cache) == 0
+
+
+def test_clear_buffer_under_translucent_background():
+    picture_frame_cache.clear()
+    background = Surface((8, 8), pygame.SRCALPHA)
+    # The first frame is larger than the others, so it would show around the second frame if it weren't cleared
+    frames = [_filled_surface((3, 3) if i == 0 else (1, 1), (200, 0, 0))
+              for i in range(MAX_CACHED_ANIMATION_FRAMES + 1)]
+    scheduler = Scheduler()
+    picture = _Picture((8, 8), background, "bg", _Animation(frames, (1, 1), "anim"), scheduler)
+    assert picture.surface.get_at((3, 3))[:3] == (200, 0, 0)
+
+    scheduler.update(Millis(130))
+    assert picture.surface.get_at((3, 3))[:3] == (0, 0, 0)
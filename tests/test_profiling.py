@@ -0,0 +1,49 @@
+import json
+import time
+
+from profiling import FrameProfiler, NULL_PROFILER
+
+
+def test_summarize_sections_and_frames():
+    profiler = FrameProfiler()
+    for i in range(4):
+        profiler.start_frame()
+        with profiler.section("update"):
+            with profiler.section("text_layout"):
+                time.sleep(0.02 if i == 2 else 0)
+        with profiler.section("redraw"):
+            pass
+    profiler.start_frame()
+
+    stats = profiler.percentiles()
+    assert set(stats) == {"update", "text_layout", "redraw", "frame"}
+    assert stats["frame"]["count"] == 4
+    assert stats["update"]["max"] >= 20
+    assert stats["update"]["p50"] <= stats["update"]["p99"] <= stats["update"]["max"]
+
+    worst_index, worst_time, sections = profiler.worst_frames()[0]
+    assert worst_index == 2
+    assert worst_time == sections["update"] + sections["redraw"]
+
+
+def test_export_chrome_trace(tmp_path):
+    profiler = FrameProfiler()
+    profiler.start_frame()
+    with profiler.section("redraw"):
+        pass
+    trace_path = tmp_path.joinpath("trace.json")
+    profiler.export_chrome_trace(str(trace_path))
+
+    events = json.loads(trace_path.read_text())["traceEvents"]
+    assert [(e["name"], e["ph"], e["args"]["frame"]) for e in events] == [("redraw", "X", 0)]
+
+
+def test_null_profiler_records_nothing():
+    NULL_PROFILER.start_frame()
+    with NULL_PROFILER.section("update"):
+        pass
+    NULL_PROFILER.start_frame()
+
+    assert NULL_PROFILER.percentiles() == {}
+    assert NULL_PROFILER.worst_frames() == []
+    assert NULL_PROFILER.chrome_trace()["traceEvents"] == []
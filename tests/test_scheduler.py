@@ -0,0 +1,76 @@
+from constants import Millis
+from timing import Scheduler
+
+
+def test_call_later_fires_once():
+    scheduler = Scheduler()
+    calls = []
+    scheduler.call_later(Millis(100), lambda: calls.append("a"))
+    scheduler.update(Millis(99))
+    assert calls == []
+    scheduler.update(Millis(1))
+    scheduler.update(Millis(500))
+    assert calls == ["a"]
+    assert scheduler.time_until_next() is None
+
+
+def test_periodic_timer_catches_up_after_long_update():
+    scheduler = Scheduler()
+    calls = []
+    scheduler.call_periodically(Millis(40), lambda: calls.append("a"))
+    scheduler.update(Millis(500))
+    assert len(calls) == 12
+    assert scheduler.time_until_next() == 20
+
+
+def test_periodic_timer_skips_missed_runs():
+    scheduler = Scheduler()
+    calls = []
+    scheduler.call_periodically(Millis(40), lambda: calls.append("a"), catch_up=False)
+    scheduler.update(Millis(500))
+    assert len(calls) == 1
+    assert scheduler.time_until_next() == 20
+
+
+def test_due_callbacks_are_called_in_deadline_order():
+    scheduler = Scheduler()
+    calls = []
+    scheduler.call_periodically(Millis(30), lambda: calls.append("a"))
+    scheduler.call_periodically(Millis(50), lambda: calls.append("b"))
+    scheduler.update(Millis(100))
+    assert calls == ["a", "b", "a", "a", "b"]
+
+
+def test_cancelled_timer_is_not_called():
+    scheduler = Scheduler()
+    calls = []
+    timer = scheduler.call_periodically(Millis(10), lambda: calls.append("a"))
+    scheduler.update(Millis(10))
+    timer.cancel()
+    scheduler.update(Millis(100))
+    assert calls == ["a"]
+    assert scheduler.time_until_next() is None
+    assert len(scheduler) == 0
+
+
+def test_callback_can_cancel_its_own_timer():
+    scheduler = Scheduler()
+    calls = []
+
+    def callback():
+        calls.append("a")
+        if len(calls) == 3:
+            timer.cancel()
+
+    timer = scheduler.call_periodically(Millis(10), callback)
+    scheduler.update(Millis(100))
+    assert calls == ["a", "a", "a"]
+
+
+def test_many_cancelled_timers_are_dropped():
+    scheduler = Scheduler()
+    timers = [scheduler.call_later(Millis(100), lambda: None) for _ in range(100)]
+    for timer in timers[:90]:
+        timer.cancel()
+    assert len(scheduler) == 10
+    assert len(scheduler._queue) < 100
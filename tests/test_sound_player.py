@@ -0,0 +1,31 @@
+from constants import Millis
+from sound import SoundPlayer
+from timing import Scheduler
+
+
+class _FakeSound:
+    def __init__(self):
+        self.num_plays = 0
+
+    def play(self):
+        self.num_plays += 1
+
+
+def test_pace_text_blips_with_scheduler():
+    blip = _FakeSound()
+    sound_player = SoundPlayer({}, blip)
+    scheduler = Scheduler()
+    sound_player.use_scheduler(scheduler)
+    for _ in range(5):
+        sound_player.play_text_blip()
+    assert blip.num_plays == 0
+    scheduler.update(Millis(75))
+    assert blip.num_plays == 1
+
+
+def test_play_text_blips_right_away_without_scheduler():
+    blip = _FakeSound()
+    sound_player = SoundPlayer({}, blip)
+    sound_player.play_text_blip()
+    sound_player.play_text_blip()
+    assert blip.num_plays == 2
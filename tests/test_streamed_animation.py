@@ -0,0 +1,41 @@
+import pygame
+
+from assets import FrameBudget, StreamedAnimation
+
+
+def _write_frames(directory, num_frames):
+    filepaths = []
+    for i in range(num_frames):
+        filepath = directory.joinpath(f"{i:02}.png")
+        pygame.image.save(pygame.Surface((4, 4)), str(filepath))
+        filepaths.append(filepath)
+    return filepaths
+
+
+def test_decode_frames_lazily_within_window(tmp_path):
+    budget = FrameBudget(max_bytes=1024 * 1024)
+    animation = StreamedAnimation("anim", _write_frames(tmp_path, 5), (8, 8), budget, window_size=2)
+    assert budget.decodes == 0
+
+    assert animation[0].get_size() == (8, 8)
+    animation[1]
+    animation[0]
+    assert animation.decodes == 2
+
+    animation[2]
+    assert animation.evictions == 1
+    animation[1]
+    assert animation.decodes == 4
+
+
+def test_stay_within_shared_budget(tmp_path):
+    frame_bytes = 8 * 8 * pygame.image.load(str(_write_frames(tmp_path, 1)[0])).get_bytesize()
+    budget = FrameBudget(max_bytes=3 * frame_bytes)
+    first = StreamedAnimation("first", _write_frames(tmp_path, 3), (8, 8), budget)
+    second = StreamedAnimation("second", _write_frames(tmp_path, 3), (8, 8), budget)
+    for animation in [first, second]:
+        for i in range(len(animation)):
+            animation[i]
+    assert budget.decodes == 6
+    assert budget.num_bytes == 3 * frame_bytes
+    assert budget.evictions == 3
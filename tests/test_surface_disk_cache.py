@@ -0,0 +1,63 @@
+import os
+
+import pygame
+
+from assets import SurfaceDiskCache
+
+
+def _write_image(filepath, color):
+    surface = pygame.Surface((4, 4))
+    surface.fill(color)
+    pygame.image.save(surface, str(filepath))
+
+
+def test_reuse_cached_surface(tmp_path):
+    image_path = tmp_path.joinpath("image.png")
+    _write_image(image_path, (10, 20, 30))
+    cache = SurfaceDiskCache(tmp_path.joinpath("cache"))
+
+    first = cache.load_and_scale(image_path, (8, 8))
+    second = cache.load_and_scale(image_path, (8, 8))
+
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert second.get_size() == (8, 8)
+    assert second.get_at((7, 7)) == first.get_at((7, 7)) == (10, 20, 30, 255)
+
+
+def test_invalidate_when_source_changes(tmp_path):
+    image_path = tmp_path.joinpath("image.png")
+    _write_image(image_path, (10, 20, 30))
+    cache = SurfaceDiskCache(tmp_path.joinpath("cache"))
+    cache.load_and_scale(image_path, (8, 8))
+
+    _write_image(image_path, (40, 50, 60))
+    stat = os.stat(image_path)
+    os.utime(image_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    assert cache.load_and_scale(image_path, (8, 8)).get_at((0, 0)) == (40, 50, 60, 255)
+    assert cache.misses == 2
+
+
+def test_keep_an_entry_per_size(tmp_path):
+    image_path = tmp_path.joinpath("image.png")
+    _write_image(image_path, (10, 20, 30))
+    cache = SurfaceDiskCache(tmp_path.joinpath("cache"))
+    cache.load_and_scale(image_path, (8, 8))
+
+    assert cache.load_and_scale(image_path, (6, 6)).get_size() == (6, 6)
+    assert cache.load_and_scale(image_path, (8, 8)).get_size() == (8, 8)
+    assert cache.load_and_scale(image_path, (6, 6)).get_size() == (6, 6)
+    assert (cache.hits, cache.misses) == (2, 2)
+
+
+def test_rebuild_truncated_entry(tmp_path):
+    image_path = tmp_path.joinpath("image.png")
+    _write_image(image_path, (10, 20, 30))
+    cache_dir = tmp_path.joinpath("cache")
+    cache = SurfaceDiskCache(cache_dir)
+    cache.load_and_scale(image_path, (8, 8))
+    [cache_filepath] = cache_dir.iterdir()
+    cache_filepath.write_bytes(cache_filepath.read_bytes()[:10])
+
+    assert cache.load_and_scale(image_path, (8, 8)).get_at((0, 0)) == (10, 20, 30, 255)
+    assert cache.misses == 2
@@ -24,3 +24,23 @@ def test_long_word_split():
 def test_complex():
     assert list(text_util.layout_text_in_area("This is a long text. It is split onto several lines.", len, 10)) \
            == ["This is a ", "long text.", "It is ", "split onto", "several ", "lines."]
+
+
+def test_each_glyph_measured_once():
+    measured = []
+
+    def font_width(text):
+        measured.append(text)
+        return len(text)
+
+    text = "This is a long text. It is split onto several lines. " * 20
+    list(text_util.layout_text_in_area(text, font_width, 10))
+    assert sorted(measured) == sorted(set(text))
+
+
+def test_trailing_whitespace_at_line_break():
+    assert list(text_util.layout_text_in_area("hello  ", len, 5)) == ["hello"]
+
+
+def test_glyph_wider_than_area():
+    assert list(text_util.layout_text_in_area("ab", lambda t: 2 * len(t), 1)) == ["a", "b"]